@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def build_incidence(schedule, names=None):
+    """
+    People x days 0/1 matrix for a schedule (any date range).
+    Returns (incidence, names, dates). People missing from `names` are appended in order of appearance.
+    """
+    names = list(names or [])
+    index = {name: i for i, name in enumerate(names)}
+    dates = sorted(schedule)
+
+    rows = []
+    cols = []
+    for col, d in enumerate(dates):
+        for p in schedule[d]:
+            i = index.get(p['name'])
+            if i is None:
+                i = index[p['name']] = len(names)
+                names.append(p['name'])
+            rows.append(i)
+            cols.append(col)
+
+    incidence = np.zeros((len(names), len(dates)), dtype=np.int32)
+    if rows:
+        incidence[rows, cols] = 1
+    return incidence, names, dates
+
+
+def _std(values):
+    # Sample standard deviation, same as statistics.stdev
+    return float(np.std(values, ddof=1)) if values.shape[0] > 1 else 0.0
+
+
+def compute_analytics(schedule, names=None, holidays=()):
+    """
+    All stats-tab numbers from one incidence matrix A (people x days):
+      co-occurrence = A @ A.T (diagonal cleared)
+      weekday distribution = A @ W, W = days x 7 one-hot weekday matrix
+      totals / weekend / Saturday / Sunday = A @ day masks
+    plus the fairness metrics over those counts.
+    """
+    incidence, names, dates = build_incidence(schedule, names)
+    holidays = set(holidays)
+
+    weekdays = np.array([d.weekday() for d in dates], dtype=np.int64)
+    weekday_onehot = np.zeros((len(dates), 7), dtype=np.int32)
+    weekday_onehot[np.arange(len(dates)), weekdays] = 1
+    weekend_mask = np.array([d.weekday() >= 5 or d.strftime("%d/%m/%Y") in holidays for d in dates], dtype=bool)
+
+    weekday_dist = incidence @ weekday_onehot
+    totals = incidence.sum(axis=1)
+    weekend = incidence[:, weekend_mask].sum(axis=1)
+    saturday = incidence[:, weekend_mask & (weekdays == 5)].sum(axis=1)
+    sunday = incidence[:, weekend_mask & (weekdays == 6)].sum(axis=1)
+
+    co_occurrence = incidence @ incidence.T
+    np.fill_diagonal(co_occurrence, 0)
+
+    n = len(names)
+    pair_counts = co_occurrence[np.triu_indices(n, k=1)] if n > 1 else np.zeros(0)
+    fairness = {
+        "total_std": _std(totals),
+        "weekend_std": _std(weekend),
+        # Average spread of each weekday across people
+        "weekday_std": float(np.mean([_std(weekday_dist[:, k]) for k in range(7)])) if n > 1 else 0.0,
+        # Average Saturday/Sunday imbalance per person
+        "sat_sun_gap": float(np.mean(np.abs(saturday - sunday))) if n else 0.0,
+        "co_occurrence_std": _std(pair_counts),
+    }
+
+    return {
+        "names": names,
+        "dates": dates,
+        "incidence": incidence,
+        "totals": totals,
+        "weekend": weekend,
+        "saturday": saturday,
+        "sunday": sunday,
+        "weekday": weekday_dist,
+        "co_occurrence": co_occurrence,
+        "fairness": fairness,
+    }
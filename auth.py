@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+class ServerBusyError(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+class LoginThrottle:
+    """
+    Token bucket per key (username or client) with exponential backoff after
+    repeated failures. A single instance is shared by every session of the process,
+    so parallel sessions draw from the same buckets.
+    """
+
+    def __init__(self, capacity, refill_per_sec, backoff_after=3, backoff_base=2.0, backoff_max=900.0, max_keys=10000):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.backoff_after = backoff_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> [tokens, last_refill, consecutive_failures, locked_until]
+        self._state = {}
+
+    def _entry(self, key, now):
+        entry = self._state.get(key)
+        if entry is None:
+            if len(self._state) >= self.max_keys:
+                self._prune(now)
+            entry = self._state[key] = [float(self.capacity), now, 0, 0.0]
+        else:
+            entry[0] = min(self.capacity, entry[0] + (now - entry[1]) * self.refill_per_sec)
+            entry[1] = now
+        return entry
+
+    def _prune(self, now):
+        # Drop keys that are back to a full bucket and not locked
+        for key, (tokens, last, failures, locked_until) in list(self._state.items()):
+            refilled = tokens + (now - last) * self.refill_per_sec
+            if refilled >= self.capacity and locked_until <= now:
+                del self._state[key]
+
+    def acquire(self, key, now=None):
+        """Takes one token. Returns 0 if allowed, otherwise the seconds to wait."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entry(key, now)
+            if entry[3] > now:
+                return entry[3] - now
+            if entry[0] < 1:
+                return (1 - entry[0]) / self.refill_per_sec
+            entry[0] -= 1
+            return 0.0
+
+    def record_failure(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entry(key, now)
+            entry[2] += 1
+            if entry[2] >= self.backoff_after:
+                delay = min(self.backoff_max, self.backoff_base ** (entry[2] - self.backoff_after + 1))
+                entry[3] = now + delay
+
+    def record_success(self, key):
+        with self._lock:
+            self._state.pop(key, None)
+
+
+# Per account: a handful of tries, then one per minute
+USER_THROTTLE = LoginThrottle(capacity=5, refill_per_sec=1 / 60)
+# Per client: enough for a few users behind one address, one every 5 seconds after that
+CLIENT_THROTTLE = LoginThrottle(capacity=20, refill_per_sec=1 / 5)
+
+# Reverse proxies in front of the app that append to X-Forwarded-For (0: the header is ignored)
+TRUSTED_PROXY_HOPS = int(os.environ.get("NOBET_TRUSTED_PROXY_HOPS") or 0)
+
+
+def client_address(remote_ip, forwarded_for, hops=None):
+    """
+    Client address for the per-client throttle. X-Forwarded-For is read only behind
+    trusted proxies, and then only the entry the outermost one added: entries to its
+    left come from the client and can be anything.
+    """
+    hops = TRUSTED_PROXY_HOPS if hops is None else hops
+    if hops > 0 and forwarded_for:
+        entries = [e.strip() for e in forwarded_for.split(",") if e.strip()]
+        if len(entries) >= hops:
+            return entries[-hops]
+    return remote_ip
+
+
+def acquire_login_slot(username, client_id):
+    """Returns 0 if a login attempt may proceed, otherwise the seconds until the next one is allowed."""
+    wait = CLIENT_THROTTLE.acquire(client_id)
+    if wait > 0:
+        return wait
+    return USER_THROTTLE.acquire(username.lower())
+
+
+def record_login_result(username, client_id, success):
+    if success:
+        USER_THROTTLE.record_success(username.lower())
+    else:
+        USER_THROTTLE.record_failure(username.lower())
+        CLIENT_THROTTLE.record_failure(client_id)
+
+
+# --- bcrypt off the script thread ---
+# bcrypt releases the GIL, so a small pool runs hashes in parallel while capping
+# the CPU a burst of logins can take. Excess requests fail fast instead of queueing.
+
+_HASH_WORKERS = min(4, os.cpu_count() or 1)
+_hash_pool = ThreadPoolExecutor(max_workers=_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(_HASH_WORKERS * 8)
+
+
+def _run_hash(fn, *args):
+    if not _hash_slots.acquire(timeout=2):
+        raise ServerBusyError()
+    try:
+        return _hash_pool.submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
+
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+
+def _check(password, hashed_text):
+    try:
+        return bcrypt.checkpw(password.encode(), hashed_text.encode())
+    except ValueError:
+        return False
+
+
+def hash_password(password):
+    return _run_hash(_hash, password)
+
+
+def verify_password(password, hashed_text):
+    return _run_hash(_check, password, hashed_text)
@@ -0,0 +1,136 @@
+import calendar
+import html
+from datetime import date
+
+from exports import schedule_hash, cached_export
+
+# Calendar HTML for st.markdown. Styling lives in one stylesheet with classes
+# instead of inline styles per cell, rows are assembled with join, and the
+# result is memoized on the schedule content. Highlighting a person is done
+# in the browser: hidden radio inputs + CSS sibling selectors, so picking a
+# name never reruns the script.
+
+_CSS = """<style>
+.nw-hl{display:none}
+.nw-filter{display:flex;flex-wrap:wrap;gap:4px;margin-bottom:8px}
+.nw-filter label{cursor:pointer;padding:2px 8px;border-radius:10px;font-size:12px;border:1px solid var(--text-color);color:var(--text-color)}
+.nw-cal table{width:100%;border-collapse:collapse;table-layout:fixed}
+.nw-cal th{border:1px solid var(--text-color);padding:8px;background:var(--secondary-background-color);width:14%;color:var(--text-color)}
+.nw-cal td{border:1px solid var(--text-color);padding:5px;height:100px;vertical-align:top;background:var(--background-color)}
+.nw-cal td.we{background:var(--secondary-background-color)}
+.nw-cal td.empty{opacity:0.5}
+.nw-day{font-weight:bold;margin-bottom:5px;color:var(--text-color)}
+.nw-chip{background:#e6f3ff;padding:2px 4px;margin-bottom:2px;border-radius:4px;font-size:11px;border:1px solid #cce5ff;color:#004085;font-weight:bold}
+.nw-year{display:grid;grid-template-columns:repeat(auto-fill,minmax(210px,1fr));gap:12px}
+.nw-year table{border-collapse:collapse;width:100%;font-size:11px;table-layout:fixed}
+.nw-year caption{font-weight:bold;color:var(--text-color);padding-bottom:2px}
+.nw-year th{color:var(--text-color);font-weight:normal;opacity:0.7}
+.nw-year td{text-align:center;padding:2px;border:1px solid rgba(128,128,128,0.3);color:var(--text-color)}
+.nw-year td.we{background:var(--secondary-background-color)}
+.nw-year td.on{background:#e6f3ff;color:#004085}
+</style>"""
+
+# Precompiled templates (bound str.format)
+_RADIO = '<input type="radio" class="nw-hl" name="{view}-hl" id="{view}-hl-{idx}"{checked}>'.format
+_LABEL = '<label for="{view}-hl-{idx}">{name}</label>'.format
+_TH = '<th>{}</th>'.format
+_MONTH_CELL = '<td class="{cls}"><div class="nw-day">{day}</div>{chips}</td>'.format
+_CHIP = '<div class="nw-chip p{idx}">{name}</div>'.format
+_YEAR_CELL = '<td class="{cls}" title="{title}">{day}</td>'.format
+_EMPTY_MONTH_CELL = '<td class="empty"></td>'
+_EMPTY_YEAR_CELL = '<td></td>'
+
+# Rules that switch on when a person's radio is checked
+_MONTH_RULE = ('#{view}-hl-{idx}:checked~.nw-cal .nw-chip:not(.p{idx}){{opacity:0.2}}'
+               '#{view}-hl-{idx}:checked~.nw-cal .p{idx}{{background:#ffd54f;color:#000}}'
+               '#{view}-hl-{idx}:checked~.nw-filter label[for="{view}-hl-{idx}"]{{background:#ffd54f;color:#000}}').format
+_YEAR_RULE = ('#{view}-hl-{idx}:checked~.nw-year td.on:not(.p{idx}){{background:none;color:var(--text-color)}}'
+              '#{view}-hl-{idx}:checked~.nw-year td.p{idx}{{background:#ffd54f;color:#000}}'
+              '#{view}-hl-{idx}:checked~.nw-filter label[for="{view}-hl-{idx}"]{{background:#ffd54f;color:#000}}').format
+
+
+def _person_index(schedules):
+    names = sorted({p['name'] for schedule in schedules for team in schedule.values() for p in team})
+    return {name: i for i, name in enumerate(names)}
+
+
+def _filter_html(view, index, all_label, rule):
+    radios = [_RADIO(view=view, idx="all", checked=" checked")]
+    labels = [_LABEL(view=view, idx="all", name=html.escape(all_label))]
+    rules = []
+    for name, idx in index.items():
+        radios.append(_RADIO(view=view, idx=idx, checked=""))
+        labels.append(_LABEL(view=view, idx=idx, name=html.escape(name)))
+        rules.append(rule(view=view, idx=idx))
+    return "".join(["<style>", "".join(rules), "</style>", "".join(radios),
+                    '<div class="nw-filter">', "".join(labels), "</div>"])
+
+
+def _render_month(year, month, schedule, t, holidays, all_label):
+    view = f"m{year}{month:02d}"
+    index = _person_index([schedule])
+    rows = []
+    for week in calendar.monthcalendar(year, month):
+        cells = []
+        for day in week:
+            if day == 0:
+                cells.append(_EMPTY_MONTH_CELL)
+                continue
+            d = date(year, month, day)
+            is_weekend = d.weekday() >= 5 or d.strftime("%d/%m/%Y") in holidays
+            chips = "".join(_CHIP(idx=index[p['name']], name=html.escape(p['name'])) for p in schedule.get(d, []))
+            cells.append(_MONTH_CELL(cls="we" if is_weekend else "", day=day, chips=chips))
+        rows.append("<tr>" + "".join(cells) + "</tr>")
+
+    headers = "".join(_TH(day) for day in t["short_days"])
+    return "".join([
+        _CSS, '<div class="nw-wrap">', _filter_html(view, index, all_label, _MONTH_RULE),
+        '<div class="nw-cal"><table><thead><tr>', headers, "</tr></thead><tbody>",
+        "".join(rows), "</tbody></table></div></div>"
+    ])
+
+
+def _render_year(year, months, t, holidays, all_label):
+    view = f"y{year}"
+    index = _person_index(months.values())
+    short_headers = "".join(_TH(day[:2]) for day in t["short_days"])
+    blocks = []
+    for month in range(1, 13):
+        schedule = months.get(month, {})
+        rows = []
+        for week in calendar.monthcalendar(year, month):
+            cells = []
+            for day in week:
+                if day == 0:
+                    cells.append(_EMPTY_YEAR_CELL)
+                    continue
+                d = date(year, month, day)
+                team = schedule.get(d, [])
+                cls = ["we"] if d.weekday() >= 5 or d.strftime("%d/%m/%Y") in holidays else []
+                if team:
+                    cls.append("on")
+                    cls.extend(f"p{index[p['name']]}" for p in team)
+                title = html.escape(", ".join(p['name'] for p in team), quote=True)
+                cells.append(_YEAR_CELL(cls=" ".join(cls), title=title, day=day))
+            rows.append("<tr>" + "".join(cells) + "</tr>")
+        blocks.append(f"<table><caption>{month:02d}/{year}</caption><thead><tr>{short_headers}</tr></thead><tbody>{''.join(rows)}</tbody></table>")
+
+    return "".join([
+        _CSS, '<div class="nw-wrap">', _filter_html(view, index, all_label, _YEAR_RULE),
+        '<div class="nw-year">', "".join(blocks), "</div></div>"
+    ])
+
+
+def get_calendar_html(year, month, schedule, t, holidays=(), all_label="All"):
+    """Month grid, memoized on schedule content."""
+    holidays = tuple(sorted(holidays))
+    key = ("calendar_html", schedule_hash(schedule, year, month, t["short_days"], holidays, all_label))
+    return cached_export(key, lambda: _render_month(year, month, schedule, t, holidays, all_label))
+
+
+def get_year_html(year, months, t, holidays=(), all_label="All"):
+    """Twelve compact month grids. months: {month_number: schedule}."""
+    holidays = tuple(sorted(holidays))
+    merged = {d: team for schedule in months.values() for d, team in schedule.items()}
+    key = ("year_html", schedule_hash(merged, year, t["short_days"], holidays, all_label))
+    return cached_export(key, lambda: _render_year(year, months, t, holidays, all_label))
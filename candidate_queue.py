@@ -0,0 +1,87 @@
+import heapq
+
+# Water-filling order of the personnel during one scheduler attempt.
+#
+# Instead of shuffling and sorting the whole roster for every date, every person
+# has an entry (priority, random tie-break, ...) in two heaps, one keyed for
+# weekdays and one for weekends/holidays (the priority differs). A date pops
+# people lazily, only as many as it looks at; the popped entries go back in
+# afterwards. Committing a date re-keys only the people assigned to it: their
+# version is bumped, new entries are pushed and the old ones are dropped when
+# they surface. Per date this costs O(k log N) for the k people examined.
+#
+# Members of a symmetry class (see symmetry.py) share their heap places: when
+# an entry of a class comes out, the first member in roster order with that
+# priority that has not been handed out for this date is returned, so the random
+# tie-break only decides which class gets a place, not which member.
+
+
+class CandidateQueue:
+
+    def __init__(self, personnel, priority, rng, class_of=None):
+        """
+        priority(person, weekend): sort key, lowest first (see DutyScheduler.priority).
+        class_of: {name: class index} of interchangeable people.
+        """
+        self.priority = priority
+        self.rng = rng
+        self.class_of = class_of or {}
+        self.index = {p['name']: i for i, p in enumerate(personnel)}
+        self.people = personnel
+        self.version = [0] * len(personnel)
+        self.heaps = {False: [], True: []}
+        # (class, weekend) -> {priority: [roster indices]}
+        self.buckets = {}
+        self.keys = {False: [None] * len(personnel), True: [None] * len(personnel)}
+        self._weekend = False
+        self._popped = []
+        self._given = set()
+        for i in range(len(personnel)):
+            self._push(i)
+
+    def _push(self, i):
+        p = self.people[i]
+        cls = self.class_of.get(p['name'])
+        for weekend in (False, True):
+            key = self.priority(p, weekend)
+            self.keys[weekend][i] = key
+            heapq.heappush(self.heaps[weekend], (key, self.rng.random(), i, self.version[i]))
+            if cls is not None:
+                bucket = self.buckets.setdefault((cls, weekend), {}).setdefault(key, [])
+                bucket.append(i)
+                bucket.sort()
+
+    def candidates(self, weekend):
+        """People in priority order for one date (a generator; stop when the date is full)."""
+        heap = self.heaps[weekend]
+        self._weekend = weekend
+        self._popped = []
+        self._given = set()
+        while heap:
+            entry = heapq.heappop(heap)
+            key, _, i, version = entry
+            if version != self.version[i]:
+                continue  # Re-keyed since this entry was pushed
+            self._popped.append(entry)
+            cls = self.class_of.get(self.people[i]['name'])
+            if cls is not None:
+                # First member of the class with this priority not handed out yet
+                i = next(j for j in self.buckets[(cls, weekend)][key] if j not in self._given)
+            self._given.add(i)
+            yield self.people[i]
+
+    def commit(self, team):
+        """After a date is committed: re-key its people and return the others' entries."""
+        for p in team:
+            i = self.index[p['name']]
+            cls = self.class_of.get(p['name'])
+            if cls is not None:
+                for weekend in (False, True):
+                    self.buckets[(cls, weekend)][self.keys[weekend][i]].remove(i)
+            self.version[i] += 1
+            self._push(i)
+        heap = self.heaps[self._weekend]
+        for entry in self._popped:
+            if entry[3] == self.version[entry[2]]:
+                heapq.heappush(heap, entry)
+        self._popped = []
@@ -0,0 +1,235 @@
+"""
+Decision traces of the scheduler search.
+
+With config['record_trace'] the scheduler records, for every attempt, its seed,
+the candidate order of every date, the rule that rejected each candidate, the
+soft rules broken and the time each date took. Events are stored as columns of
+small integers (array module) and written zlib-compressed after a JSON header
+that holds the inputs, so a trace file alone is enough to rerun the search:
+
+    python decision_trace.py summary trace.nbt       # where the time and the failures went
+    python decision_trace.py replay trace.nbt        # rerun, check it makes the same decisions
+    python decision_trace.py replay trace.nbt --attempt 3
+"""
+import argparse
+import json
+import sys
+import zlib
+from array import array
+from collections import Counter, defaultdict
+
+MAGIC = b"NBTRACE1\n"
+
+# Event kinds
+ORDER = 0       # person is the next candidate taken for the date
+FIXED = 1       # assigned by a fixed date
+ACCEPT = 2      # passed the person and team rules, kept
+REJECT = 3      # rejected by a person rule (code)
+TEAM_REJECT = 4  # rejected by a team rule (code)
+SOFT = 5        # kept while breaking a soft rule (code)
+DAY_DONE = 6    # date committed, value = microseconds spent on it
+DAY_FAILED = 7  # date could not be filled, value = microseconds spent on it
+KIND_NAMES = ["order", "fixed", "accept", "reject", "team_reject", "soft", "day_done", "day_failed"]
+
+NO_PERSON = 0xFFFF
+NO_RULE = 0xFF
+
+# Column name -> array typecode
+COLUMNS = {"attempt": "I", "day": "B", "person": "H", "kind": "B", "code": "B", "value": "I"}
+
+
+class TraceRecorder:
+    """Collects the decisions of one DutyScheduler.generate() run."""
+
+    def __init__(self, scheduler, rules):
+        self.year = scheduler.year
+        self.month = scheduler.month
+        self.names = [p['name'] for p in scheduler.personnel]
+        self.rules = list(rules)
+        self.inputs = None
+        self.seeds = []
+        self.results = []
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+        self._person = {name: i for i, name in enumerate(self.names)}
+        self._rule = {rule: i for i, rule in enumerate(self.rules)}
+
+    def set_inputs(self, personnel, config, holiday_dates):
+        """JSON-ready copy of the scheduler inputs, so the run can be replayed."""
+        from holiday_calendar import format_date
+
+        config = {k: v for k, v in config.items() if k not in ("record_trace", "attempt_seeds")}
+        config['holidays'] = [format_date(d) for d in sorted(holiday_dates)]
+        self.inputs = {"personnel": personnel, "config": config}
+
+    def begin_attempt(self, seed):
+        self.seeds.append(seed)
+
+    def end_attempt(self, success):
+        self.results.append(bool(success))
+
+    def event(self, day, kind, person=None, rule=None, value=0):
+        c = self.columns
+        c["attempt"].append(len(self.seeds) - 1)
+        c["day"].append(day)
+        c["person"].append(NO_PERSON if person is None else self._person[person['name']])
+        c["kind"].append(kind)
+        c["code"].append(NO_RULE if rule is None else self._rule[rule])
+        c["value"].append(value)
+
+    def to_bytes(self):
+        header = {
+            "year": self.year, "month": self.month, "names": self.names, "rules": self.rules,
+            "seeds": self.seeds, "results": self.results, "inputs": self.inputs,
+            "events": len(self.columns["kind"]), "byteorder": sys.byteorder,
+        }
+        body = b"".join(self.columns[name].tobytes() for name in COLUMNS)
+        header = json.dumps(header, ensure_ascii=False, default=str).encode("utf-8")
+        return MAGIC + len(header).to_bytes(4, "little") + header + zlib.compress(body, 6)
+
+
+class Trace:
+    """A loaded trace file: header fields and the event columns."""
+
+    def __init__(self, header, columns):
+        self.header = header
+        self.columns = columns
+        self.names = header["names"]
+        self.rules = header["rules"]
+        self.seeds = header["seeds"]
+        self.results = header["results"]
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(MAGIC):
+            raise ValueError("not a decision trace")
+        pos = len(MAGIC)
+        size = int.from_bytes(data[pos:pos + 4], "little")
+        header = json.loads(data[pos + 4:pos + 4 + size].decode("utf-8"))
+        body = zlib.decompress(data[pos + 4 + size:])
+        columns, offset = {}, 0
+        for name, code in COLUMNS.items():
+            col = array(code)
+            length = col.itemsize * header["events"]
+            col.frombytes(body[offset:offset + length])
+            if header["byteorder"] != sys.byteorder:
+                col.byteswap()
+            columns[name] = col
+            offset += length
+        return cls(header, columns)
+
+    @classmethod
+    def from_recorder(cls, recorder):
+        return cls.from_bytes(recorder.to_bytes())
+
+    def events(self, attempt=None):
+        """(attempt, day, person, kind, code, value) rows, optionally of one attempt."""
+        rows = zip(*(self.columns[name] for name in COLUMNS))
+        if attempt is None:
+            return list(rows)
+        return [row for row in rows if row[0] == attempt]
+
+    def describe(self, row):
+        attempt, day, person, kind, code, value = row
+        who = self.names[person] if person != NO_PERSON else "-"
+        rule = self.rules[code] if code != NO_RULE else ""
+        return f"attempt {attempt} day {day}: {KIND_NAMES[kind]} {who} {rule}".rstrip()
+
+
+def summarize(trace, top=10):
+    """Text report: attempts, failing dates, rejecting rules and slowest dates."""
+    cols = trace.columns
+    failed_days = Counter()
+    rejections = Counter()
+    by_person = Counter()
+    soft = Counter()
+    day_time = defaultdict(int)
+    attempt_time = defaultdict(int)
+    for attempt, day, person, kind, code, value in zip(*(cols[name] for name in COLUMNS)):
+        if kind in (REJECT, TEAM_REJECT):
+            rejections[trace.rules[code]] += 1
+            if person != NO_PERSON:
+                by_person[(trace.names[person], trace.rules[code])] += 1
+        elif kind == SOFT:
+            soft[trace.rules[code]] += 1
+        elif kind in (DAY_DONE, DAY_FAILED):
+            day_time[day] += value
+            attempt_time[attempt] += value
+            if kind == DAY_FAILED:
+                failed_days[day] += 1
+
+    header = trace.header
+    lines = [
+        f"{header['year']}-{header['month']:02d}: {len(trace.seeds)} attempts, "
+        f"{sum(trace.results)} valid, {len(cols['kind'])} events, {sum(attempt_time.values()) / 1000:.1f} ms in the search"
+    ]
+    if failed_days:
+        lines.append("attempts failed on:")
+        lines += [f"  day {day:2d}: {n}" for day, n in failed_days.most_common(top)]
+    if rejections:
+        lines.append("rejections by rule:")
+        lines += [f"  {rule}: {n}" for rule, n in rejections.most_common(top)]
+        lines.append("most rejected (person, rule):")
+        lines += [f"  {name} / {rule}: {n}" for (name, rule), n in by_person.most_common(top)]
+    if soft:
+        lines.append("soft rules broken:")
+        lines += [f"  {rule}: {n}" for rule, n in soft.most_common(top)]
+    if day_time:
+        lines.append("slowest dates (all attempts):")
+        lines += [f"  day {day:2d}: {us / 1000:.1f} ms" for day, us in sorted(day_time.items(), key=lambda x: -x[1])[:top]]
+    return "\n".join(lines)
+
+
+def replay(trace, attempt=None):
+    """
+    Reruns the recorded search (or one attempt of it) from the stored inputs and
+    seeds. Returns (new trace, first differing (recorded, replayed) rows or None).
+    Timings are not compared.
+    """
+    from scheduler import DutyScheduler
+
+    inputs = trace.header["inputs"]
+    seeds = trace.seeds if attempt is None else [trace.seeds[attempt]]
+    config = dict(inputs["config"], attempt_seeds=seeds, record_trace=True)
+    result = DutyScheduler(trace.header["year"], trace.header["month"], inputs["personnel"], config).generate()
+    replayed = Trace.from_recorder(result.trace)
+
+    # Replayed attempts are numbered from 0
+    recorded = [row[1:5] for row in trace.events(attempt)]
+    again = [row[1:5] for row in replayed.events()]
+    for i, (a, b) in enumerate(zip(recorded, again)):
+        if a != b:
+            return replayed, (trace.events(attempt)[i], replayed.events()[i])
+    if len(recorded) != len(again):
+        return replayed, ("length", len(recorded), len(again))
+    return replayed, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay a scheduler decision trace")
+    parser.add_argument("command", choices=["summary", "replay"])
+    parser.add_argument("path")
+    parser.add_argument("--attempt", type=int, default=None, help="replay a single attempt")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        trace = Trace.from_bytes(f.read())
+
+    if args.command == "summary":
+        print(summarize(trace, args.top))
+        return 0
+
+    replayed, diff = replay(trace, args.attempt)
+    print(summarize(replayed, args.top))
+    if diff is None:
+        print("replay: identical decisions")
+        return 0
+    if diff[0] == "length":
+        print(f"replay: DIFFERENT number of events ({diff[1]} recorded, {diff[2]} replayed)")
+    else:
+        print(f"replay: DIFFERENT\n  recorded: {trace.describe(diff[0])}\n  replayed: {replayed.describe(diff[1])}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
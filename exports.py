@@ -0,0 +1,504 @@
+import calendar
+import hashlib
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+# xlsxwriter and reportlab are imported inside the builders: this module is
+# loaded on every page (hashing, cache, ICS) but the libraries are only needed
+# when a download is actually built.
+
+# --- Fonts ---
+# Fonts are looked up once per process, never downloaded. Search order:
+# bundled `fonts/` next to this file, the font cache directory, the working
+# directory (older versions downloaded Roboto there) and common system paths
+# (`packages.txt` installs DejaVu on Streamlit Cloud / the devcontainer).
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+FONT_CACHE_DIR = os.environ.get("NOBET_FONT_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "nobetwizard", "fonts")
+SYSTEM_FONT_DIRS = [
+    "/usr/share/fonts/truetype/dejavu",
+    "/usr/share/fonts/dejavu",
+    "/usr/share/fonts/TTF",
+    "/usr/share/fonts/truetype/noto",
+    "/usr/share/fonts/truetype/liberation",
+    "/Library/Fonts",
+    "/System/Library/Fonts/Supplemental",
+    "C:\\Windows\\Fonts",
+]
+
+# (regular, bold) file names in order of preference. All of them cover Turkish.
+FONT_CANDIDATES = [
+    ("Roboto-Regular.ttf", "Roboto-Bold.ttf"),
+    ("DejaVuSans.ttf", "DejaVuSans-Bold.ttf"),
+    ("NotoSans-Regular.ttf", "NotoSans-Bold.ttf"),
+    ("LiberationSans-Regular.ttf", "LiberationSans-Bold.ttf"),
+    ("arial.ttf", "arialbd.ttf"),
+]
+
+_font_lock = threading.Lock()
+_pdf_fonts = None
+
+
+def find_font_pair():
+    """Returns paths of the first available (regular, bold) font pair, or None."""
+    dirs = [FONT_DIR, FONT_CACHE_DIR, os.getcwd()] + SYSTEM_FONT_DIRS
+    for regular, bold in FONT_CANDIDATES:
+        for folder in dirs:
+            path_reg = os.path.join(folder, regular)
+            path_bold = os.path.join(folder, bold)
+            if os.path.exists(path_reg) and os.path.exists(path_bold):
+                return path_reg, path_bold
+    return None
+
+
+def get_pdf_fonts():
+    """
+    Registers the PDF fonts on first call and returns (regular, bold, unicode_ok).
+    unicode_ok is False when only the built-in Helvetica (no Turkish glyphs) is available.
+    """
+    global _pdf_fonts
+    if _pdf_fonts is not None:
+        return _pdf_fonts
+    with _font_lock:
+        if _pdf_fonts is None:
+            fonts = ('Helvetica', 'Helvetica-Bold', False)
+            pair = find_font_pair()
+            if pair:
+                try:
+                    from reportlab.pdfbase import pdfmetrics
+                    from reportlab.pdfbase.ttfonts import TTFont
+                    pdfmetrics.registerFont(TTFont('NW-Regular', pair[0]))
+                    pdfmetrics.registerFont(TTFont('NW-Bold', pair[1]))
+                    fonts = ('NW-Regular', 'NW-Bold', True)
+                except Exception as e:
+                    print(f"Font Error: {e}")
+            else:
+                print("Font Warning: no Unicode TTF font found, PDF exports fall back to Helvetica.")
+            _pdf_fonts = fonts
+    return _pdf_fonts
+
+
+# --- Memoized exports ---
+# Exports are built only when a download is requested and cached by schedule
+# content + format, so reruns and repeated downloads do not rebuild them.
+
+EXPORT_CACHE_SIZE = 32
+_export_cache = OrderedDict()
+_export_cache_lock = threading.Lock()
+
+# reportlab keeps some module level state; documents are built one at a time
+_reportlab_lock = threading.Lock()
+
+
+def schedule_hash(schedule, *extra):
+    """Stable hash of a schedule's dates and names plus any other inputs that change the output."""
+    h = hashlib.sha1()
+    for d in sorted(schedule):
+        h.update(d.isoformat().encode())
+        for p in schedule[d]:
+            h.update(b"\0" + str(p['name']).encode())
+        h.update(b"\n")
+    h.update(repr(extra).encode())
+    return h.hexdigest()
+
+
+def cached_export(key, builder):
+    """Returns the cached bytes for `key`, calling builder() only on a miss."""
+    with _export_cache_lock:
+        if key in _export_cache:
+            _export_cache.move_to_end(key)
+            return _export_cache[key]
+    data = builder()
+    with _export_cache_lock:
+        _export_cache[key] = data
+        _export_cache.move_to_end(key)
+        while len(_export_cache) > EXPORT_CACHE_SIZE:
+            _export_cache.popitem(last=False)
+    return data
+
+
+def build_zip(builders):
+    """Runs the {file_name: builder} callables concurrently and packs the results into one ZIP."""
+    with ThreadPoolExecutor(max_workers=max(len(builders), 1), thread_name_prefix="export") as pool:
+        futures = {name: pool.submit(fn) for name, fn in builders.items()}
+        buffer_zip = BytesIO()
+        with zipfile.ZipFile(buffer_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, future in futures.items():
+                zf.writestr(name, future.result())
+    return buffer_zip.getvalue()
+
+
+# --- Exports ---
+
+# --- iCalendar (RFC 5545) ---
+# Events are produced by generators and written line by line. UIDs are derived
+# from language-independent data only (uid_scope, usually the user, the date,
+# the person id and the shift index), so re-importing an updated file replaces
+# events instead of duplicating them, whatever the UI language or title.
+# A schedule is {date: team} (all-day events), or a list of shifts
+# [(shift name, "HH:MM" start, "HH:MM" end, {date: team})] for timed events
+# (see shifts.py; an end at or before the start is on the next day).
+
+ICS_PRODID = "-//NobetWizard//DutyRoster//EN"
+
+def _ics_escape(text):
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+def _ics_fold(line):
+    """Encodes one content line, folded at 75 octets without splitting UTF-8 characters."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return data + b"\r\n"
+    parts = []
+    start = 0
+    limit = 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end])
+        start = end
+        limit = 74 # continuation lines start with a space
+    return b"\r\n ".join(parts) + b"\r\n"
+
+def ics_uid(d, key):
+    """Stable UID of one event; key must not depend on display text."""
+    digest = hashlib.sha1(f"{d.isoformat()}|{key}".encode("utf-8")).hexdigest()[:20]
+    return f"{d.strftime('%Y%m%d')}-{digest}@nobetwizard"
+
+def _ics_dtstamp():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def _ics_header(cal_name):
+    yield _ics_fold("BEGIN:VCALENDAR")
+    yield _ics_fold("VERSION:2.0")
+    yield _ics_fold(f"PRODID:{ICS_PRODID}")
+    yield _ics_fold("CALSCALE:GREGORIAN")
+    yield _ics_fold("METHOD:PUBLISH")
+    yield _ics_fold(f"X-WR-CALNAME:{_ics_escape(cal_name)}")
+
+def _ics_event(d, uid, summary, description, dtstamp, times=None):
+    yield _ics_fold("BEGIN:VEVENT")
+    yield _ics_fold(f"UID:{uid}")
+    yield _ics_fold(f"DTSTAMP:{dtstamp}")
+    if times:
+        # Floating local times of a shift
+        (start_h, start_m), (end_h, end_m) = (map(int, str(x).split(":")) for x in times)
+        start = datetime(d.year, d.month, d.day, start_h, start_m)
+        end = datetime(d.year, d.month, d.day, end_h, end_m)
+        if end <= start:
+            end += timedelta(days=1)
+        yield _ics_fold(f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}")
+        yield _ics_fold(f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}")
+    else:
+        dt_end = d + timedelta(days=1) # All day events end next day
+        yield _ics_fold(f"DTSTART;VALUE=DATE:{d.strftime('%Y%m%d')}")
+        yield _ics_fold(f"DTEND;VALUE=DATE:{dt_end.strftime('%Y%m%d')}")
+    yield _ics_fold(f"SUMMARY:{_ics_escape(summary)}")
+    yield _ics_fold(f"DESCRIPTION:{_ics_escape(description)}")
+    yield _ics_fold("TRANSP:OPAQUE")
+    yield _ics_fold("END:VEVENT")
+
+def _ics_entries(schedule):
+    """(date, shift index or None, shift name or None, (start, end) or None, team) in time order."""
+    if isinstance(schedule, dict):
+        return [(d, None, None, None, schedule[d]) for d in sorted(schedule)]
+    entries = [(d, i, name, (start, end), team) for i, (name, start, end, shift) in enumerate(schedule) for d, team in shift.items()]
+    entries.sort(key=lambda e: (e[0], e[3][0]))
+    return entries
+
+def iter_ics(schedule, title="Duty Roster", dtstamp=None, uid_scope=""):
+    """Yields the encoded lines of a team calendar, one event per date (or per shift)."""
+    dtstamp = dtstamp or _ics_dtstamp()
+    yield from _ics_header(title)
+    for d, index, shift, times, team in _ics_entries(schedule):
+        names = ", ".join([p['name'] for p in team])
+        label = f"{title} ({shift})" if shift else title
+        key = f"team:{uid_scope}:{index}" if shift else f"team:{uid_scope}"
+        yield from _ics_event(d, ics_uid(d, key), f"{label}: {names}", f"Team: {names}", dtstamp, times)
+    yield _ics_fold("END:VCALENDAR")
+
+def generate_ics(schedule, title="Duty Roster", uid_scope=""):
+    """Generates an iCalendar file for the whole team."""
+    buffer_ics = BytesIO()
+    for line in iter_ics(schedule, title, uid_scope=uid_scope):
+        buffer_ics.write(line)
+    return buffer_ics.getvalue()
+
+def generate_person_ics(schedule, title="Duty Roster", uid_scope=""):
+    """
+    Per-person feeds in a single pass over the schedule. Each person's events are
+    written straight into their own buffer. Returns {name: bytes}.
+    """
+    dtstamp = _ics_dtstamp()
+    feeds = {}
+    for d, index, shift, times, team in _ics_entries(schedule):
+        names = [p['name'] for p in team]
+        for p, name in zip(team, names):
+            feed = feeds.get(name)
+            if feed is None:
+                feed = feeds[name] = BytesIO()
+                for line in _ics_header(f"{title} - {name}"):
+                    feed.write(line)
+            others = ", ".join(n for n in names if n != name)
+            person = p.get('id') or name
+            key = f"person:{uid_scope}:{person}:{index}" if shift else f"person:{uid_scope}:{person}"
+            for line in _ics_event(d, ics_uid(d, key), f"{title} ({shift})" if shift else title,
+                                   f"Team: {others}" if others else "Team: -", dtstamp, times):
+                feed.write(line)
+    end = _ics_fold("END:VCALENDAR")
+    result = {}
+    for name, feed in feeds.items():
+        feed.write(end)
+        result[name] = feed.getvalue()
+    return result
+
+def ics_file_name(name):
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+    return f"{safe or 'person'}.ics"
+
+def generate_person_ics_zip(schedule, title="Duty Roster", uid_scope=""):
+    """All per-person feeds in one ZIP, one .ics file each."""
+    buffer_zip = BytesIO()
+    used = set()
+    with zipfile.ZipFile(buffer_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in generate_person_ics(schedule, title, uid_scope).items():
+            file_name = ics_file_name(name)
+            while file_name in used:
+                file_name = "_" + file_name
+            used.add(file_name)
+            zf.writestr(file_name, data)
+    return buffer_zip.getvalue()
+
+def _is_weekend(d, holidays):
+    return d.weekday() >= 5 or d.strftime("%d/%m/%Y") in holidays
+
+def generate_excel(rosters, t, day_names, holidays=(), names=None):
+    """
+    Report workbook written with xlsxwriter in constant_memory mode (rows are
+    flushed to disk as they are written). One pass over the schedule fills the
+    Schedule sheet and the counters for the Stats, Day Distribution and
+    Co-occurrence sheets. Column widths are tracked from the written values.
+
+    rosters: list of (label, schedule), e.g. departments or shifts; a label column is added when there is more than one.
+    day_names: display names for Monday..Sunday.
+    names: people in display order (people without duties still get a row).
+    """
+    import xlsxwriter
+
+    holidays = set(holidays)
+    multi = len(rosters) > 1
+    buffer_excel = BytesIO()
+    workbook = xlsxwriter.Workbook(buffer_excel, {"constant_memory": True})
+    header_fmt = workbook.add_format({"bold": True, "bg_color": "#D9D9D9", "border": 1})
+
+    def write_sheet_header(worksheet, header, widths):
+        worksheet.write_row(0, 0, header, header_fmt)
+        for col, value in enumerate(header):
+            widths[col] = max(widths.get(col, 0), len(str(value)))
+
+    def write_data_row(worksheet, row_idx, values, widths):
+        worksheet.write_row(row_idx, 0, values)
+        for col, value in enumerate(values):
+            widths[col] = max(widths.get(col, 0), len(str(value)))
+
+    def apply_widths(worksheet, widths):
+        for col, width in widths.items():
+            worksheet.set_column(col, col, min(width + 2, 80))
+
+    # People index, counters
+    index = {}
+    order = []
+    def person_idx(name):
+        i = index.get(name)
+        if i is None:
+            i = index[name] = len(order)
+            order.append(name)
+            totals.append([0, 0, 0, 0])
+            weekday_counts.append([0] * 7)
+        return i
+
+    totals = []          # [total, weekend, saturday, sunday]
+    weekday_counts = []  # per weekday
+    pairs = {}           # (i, j) with i < j -> count
+    for name in names or []:
+        person_idx(name)
+
+    # 1. Schedule sheet (single pass, also fills the counters)
+    ws_sched = workbook.add_worksheet(t["sheet_schedule"][:31])
+    sched_widths = {}
+    header = ([t["department"]] if multi else []) + [t["col_date"], t["col_day"], t["col_team"], t["col_type"]]
+    write_sheet_header(ws_sched, header, sched_widths)
+    row_idx = 1
+    for label, schedule in rosters:
+        for d in sorted(schedule):
+            team = schedule[d]
+            weekend = _is_weekend(d, holidays)
+            wd = d.weekday()
+            idxs = [person_idx(p['name']) for p in team]
+            for i in idxs:
+                c = totals[i]
+                c[0] += 1
+                if weekend:
+                    c[1] += 1
+                    if wd == 5:
+                        c[2] += 1
+                    elif wd == 6:
+                        c[3] += 1
+                weekday_counts[i][wd] += 1
+            for a_pos in range(len(idxs)):
+                for b_pos in range(a_pos + 1, len(idxs)):
+                    key = (min(idxs[a_pos], idxs[b_pos]), max(idxs[a_pos], idxs[b_pos]))
+                    pairs[key] = pairs.get(key, 0) + 1
+
+            values = ([label] if multi else []) + [
+                d.strftime("%d/%m/%Y"),
+                day_names[wd],
+                ", ".join(p['name'] for p in team),
+                t["type_wknd"] if weekend else t["type_wkday"]
+            ]
+            write_data_row(ws_sched, row_idx, values, sched_widths)
+            row_idx += 1
+    apply_widths(ws_sched, sched_widths)
+
+    # 2. Per-person stats
+    ws_stats = workbook.add_worksheet(t["stats"][:31])
+    stats_widths = {}
+    write_sheet_header(ws_stats, [t["name"], t["col_assigned"], t["type_wknd"], day_names[5], day_names[6]], stats_widths)
+    for i, name in enumerate(order):
+        write_data_row(ws_stats, i + 1, [name] + totals[i], stats_widths)
+    apply_widths(ws_stats, stats_widths)
+
+    # 3. Day-of-week distribution
+    ws_days = workbook.add_worksheet(t["sheet_days"][:31])
+    days_widths = {}
+    write_sheet_header(ws_days, [t["name"]] + list(day_names), days_widths)
+    for i, name in enumerate(order):
+        write_data_row(ws_days, i + 1, [name] + weekday_counts[i], days_widths)
+    apply_widths(ws_days, days_widths)
+
+    # 4. Co-occurrence matrix (written row by row from the sparse pair counts)
+    ws_co = workbook.add_worksheet(t["sheet_co_occurrence"][:31])
+    co_widths = {}
+    write_sheet_header(ws_co, [""] + order, co_widths)
+    for i, name in enumerate(order):
+        row = [pairs.get((min(i, j), max(i, j)), 0) if i != j else 0 for j in range(len(order))]
+        write_data_row(ws_co, i + 1, [name] + row, co_widths)
+    apply_widths(ws_co, co_widths)
+
+    workbook.close()
+    return buffer_excel.getvalue()
+
+# Rows per table flowable. Long tables are split so reportlab lays out
+# small chunks instead of one huge table (which is slow and memory hungry).
+PDF_ROWS_PER_TABLE = 40
+
+def generate_pdf(df_res, year, month, t):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+
+    buffer_pdf = BytesIO()
+    doc = SimpleDocTemplate(buffer_pdf, pagesize=A4)
+    elements = []
+    styles = getSampleStyleSheet()
+    font_name, font_name_bold, _ = get_pdf_fonts()
+
+    # Title
+    title_style = styles['Title']
+    title_style.fontName = font_name_bold
+    elements.append(Paragraph(f"{t['title']} - {year}/{month}", title_style))
+
+    # Table
+    header = df_res.columns.to_list()
+    rows = df_res.values.tolist()
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), font_name_bold),
+        ('FONTNAME', (0, 1), (-1, -1), font_name),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ])
+    for start in range(0, max(len(rows), 1), PDF_ROWS_PER_TABLE):
+        table = Table([header] + rows[start:start + PDF_ROWS_PER_TABLE], repeatRows=1)
+        table.setStyle(table_style)
+        elements.append(table)
+
+    with _reportlab_lock:
+        doc.build(elements)
+    return buffer_pdf.getvalue()
+
+def _calendar_month_table(year, month, schedule, t, font_name, font_name_bold, width, holidays=()):
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import Table, TableStyle, Paragraph
+
+    cell_style = ParagraphStyle('calendar_cell', fontName=font_name, fontSize=7, leading=8.5)
+    weeks = calendar.monthcalendar(year, month)
+
+    rows = [list(t["short_days"])]
+    style = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), font_name_bold),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('VALIGN', (0, 1), (-1, -1), 'TOP'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        # Weekend columns
+        ('BACKGROUND', (5, 1), (6, -1), colors.HexColor("#f0f0f0")),
+    ]
+    for row_idx, week in enumerate(weeks, start=1):
+        row = []
+        for col_idx, day in enumerate(week):
+            if day == 0:
+                row.append("")
+                style.append(('BACKGROUND', (col_idx, row_idx), (col_idx, row_idx), colors.HexColor("#dddddd")))
+                continue
+            d = date(year, month, day)
+            if d.strftime("%d/%m/%Y") in holidays and col_idx < 5:
+                style.append(('BACKGROUND', (col_idx, row_idx), (col_idx, row_idx), colors.HexColor("#f0f0f0")))
+            names = "<br/>".join(escape(p['name']) for p in schedule.get(d, []))
+            row.append(Paragraph(f"<font name='{font_name_bold}'>{day}</font><br/>{names}", cell_style))
+        rows.append(row)
+
+    table = Table(rows, colWidths=[width / 7.0] * 7, rowHeights=[16] + [None] * len(weeks))
+    table.setStyle(TableStyle(style))
+    return table
+
+def generate_calendar_pdf(months, t, holidays=()):
+    """
+    Calendar-grid PDF, one landscape page per month.
+    months: list of (year, month, schedule) with schedule {date: [person dicts]}.
+    """
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, PageBreak
+
+    buffer_pdf = BytesIO()
+    doc = SimpleDocTemplate(buffer_pdf, pagesize=landscape(A4), leftMargin=24, rightMargin=24, topMargin=24, bottomMargin=24)
+    styles = getSampleStyleSheet()
+    font_name, font_name_bold, _ = get_pdf_fonts()
+    title_style = styles['Title']
+    title_style.fontName = font_name_bold
+
+    elements = []
+    for i, (year, month, schedule) in enumerate(months):
+        if i > 0:
+            elements.append(PageBreak())
+        elements.append(Paragraph(f"{t['title']} - {year}/{month}", title_style))
+        elements.append(_calendar_month_table(year, month, schedule, t, font_name, font_name_bold, doc.width, holidays))
+
+    with _reportlab_lock:
+        doc.build(elements)
+    return buffer_pdf.getvalue()
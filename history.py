@@ -0,0 +1,93 @@
+from datetime import date
+
+# Cumulative per-person duty counts across accepted (saved) months.
+# Each saved month contributes its counts; re-saving a month applies only the
+# difference between its old and new contribution, so the totals are always
+# current without re-reading past months.
+# "months" counts the months a person was on the roster (month_doc["roster"]);
+# months saved before rosters were recorded count only when the person had a duty.
+
+WEEKDAY_FIELDS = ["wd0", "wd1", "wd2", "wd3", "wd4", "wd5", "wd6"]
+HISTORY_FIELDS = ["months", "total", "weekend", "saturday", "sunday"] + WEEKDAY_FIELDS
+
+
+def month_contribution(month_doc):
+    """Per-person counts of one month document: {person_id: {field: n}}."""
+    if not month_doc:
+        return {}
+    holidays = set(month_doc.get("holidays", []))
+    counts = {}
+    for pid in month_doc.get("roster", []):
+        counts[pid] = dict.fromkeys(HISTORY_FIELDS, 0)
+        counts[pid]["months"] = 1
+    for d_str, ids in month_doc.get("schedule", {}).items():
+        d = date.fromisoformat(d_str)
+        wd = d.weekday()
+        is_weekend = wd >= 5 or d.strftime("%d/%m/%Y") in holidays
+        for pid in ids:
+            c = counts.get(pid)
+            if c is None:
+                c = counts[pid] = dict.fromkeys(HISTORY_FIELDS, 0)
+                c["months"] = 1
+            c["total"] += 1
+            c[WEEKDAY_FIELDS[wd]] += 1
+            if is_weekend:
+                c["weekend"] += 1
+                if wd == 5:
+                    c["saturday"] += 1
+                elif wd == 6:
+                    c["sunday"] += 1
+    return counts
+
+
+def contribution_delta(old_month_doc, new_month_doc):
+    """Non-zero field changes when a month's schedule is replaced: {person_id: {field: delta}}."""
+    old = month_contribution(old_month_doc)
+    new = month_contribution(new_month_doc)
+    delta = {}
+    for pid in set(old) | set(new):
+        o = old.get(pid, {})
+        n = new.get(pid, {})
+        changes = {f: n.get(f, 0) - o.get(f, 0) for f in HISTORY_FIELDS}
+        changes = {f: v for f, v in changes.items() if v}
+        if changes:
+            delta[pid] = changes
+    return delta
+
+
+def build_history(month_docs):
+    """Cumulative counts of whole months from scratch: {person_id: {"name", field: n}}."""
+    totals = {}
+    for month_doc in sorted(month_docs, key=lambda m: (int(m["year"]), int(m["month"]))):
+        names = month_doc.get("names", {})
+        for pid, counts in month_contribution(month_doc).items():
+            entry = totals.setdefault(pid, dict.fromkeys(HISTORY_FIELDS, 0))
+            # Latest known name
+            entry["name"] = names.get(pid) or entry.get("name")
+            for field in HISTORY_FIELDS:
+                entry[field] += counts[field]
+    return totals
+
+
+def compute_deficits(history, people):
+    """
+    How far each person is below the roster's average monthly rate, in duties.
+    history: {person_id: counts}; people: [(person_id, name)] of the current roster.
+    Rates are per month on the roster, so months without a duty lower them.
+    Returns {name: {"total": x, "weekend": y}} for the scheduler (positive = owed duties).
+    People without history are neutral.
+    """
+    rates = {}
+    for pid, name in people:
+        h = history.get(pid)
+        if h and h.get("months", 0) > 0:
+            rates[name] = (h.get("total", 0) / h["months"], h.get("weekend", 0) / h["months"])
+    if len(rates) < 2:
+        return {}
+
+    avg_total = sum(r[0] for r in rates.values()) / len(rates)
+    avg_weekend = sum(r[1] for r in rates.values()) / len(rates)
+    return {
+        name: {"total": avg_total - r[0], "weekend": avg_weekend - r[1]}
+        for name, r in rates.items()
+    }
@@ -0,0 +1,88 @@
+import threading
+from datetime import date, datetime
+
+# Holidays per (country, year, language), built once per process and shared by
+# every session. Full holidays and half-days (e.g. arife, from 13:00) are kept
+# apart so callers can decide how to treat half-days. Dates are `date` objects;
+# the UI and saved state use "dd/mm/YYYY" strings, see to_date_set/format_date.
+
+DATE_FMT = "%d/%m/%Y"
+DEFAULT_COUNTRY = "TR"
+
+# UI language -> python-holidays language code
+LANGUAGE_CODES = {"English": "en_US", "Türkçe": "tr"}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _build(country, year, language):
+    # Imported here: holidays is only needed once a calendar is requested
+    import holidays as holidays_lib
+
+    full = holidays_lib.country_holidays(country, years=year, language=language)
+    try:
+        half = holidays_lib.country_holidays(country, years=year, language=language, categories=("half_day",))
+    except NotImplementedError:
+        # Country without a half-day category
+        half = {}
+    return {
+        "full": {d: name for d, name in full.items()},
+        "half": {d: name for d, name in half.items() if d not in full},
+    }
+
+
+def get_year(country, year, language=None):
+    """{"full": {date: name}, "half": {date: name}} for one country/year (cached)."""
+    key = (country, year, language)
+    entry = _cache.get(key)
+    if entry is None:
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is None:
+                entry = _cache[key] = _build(country, year, language)
+    return entry
+
+
+def preload(country, years, language=None):
+    """Builds the cache for several years at once (e.g. the selected year and its neighbours)."""
+    for year in years:
+        get_year(country, year, language)
+
+
+def holiday_dates(country, years, half_days=False):
+    """Set of holiday dates over the given years, for O(1) membership tests."""
+    dates = set()
+    for year in years:
+        entry = get_year(country, year)
+        dates.update(entry["full"])
+        if half_days:
+            dates.update(entry["half"])
+    return frozenset(dates)
+
+
+def month_holidays(country, year, month, language=None, half_days=True):
+    """[(date, name, is_half_day)] of one month, in date order."""
+    entry = get_year(country, year, language)
+    days = [(d, name, False) for d, name in entry["full"].items() if d.month == month]
+    if half_days:
+        days.extend((d, name, True) for d, name in entry["half"].items() if d.month == month)
+    return sorted(days)
+
+
+def format_date(d):
+    return d.strftime(DATE_FMT)
+
+
+def to_date_set(values):
+    """Date set from a mix of `date` objects and "dd/mm/YYYY" strings (saved selections)."""
+    dates = set()
+    for value in values or ():
+        if isinstance(value, date):
+            dates.add(value)
+        else:
+            try:
+                dates.add(datetime.strptime(value, DATE_FMT).date())
+            except (TypeError, ValueError):
+                pass
+    return frozenset(dates)
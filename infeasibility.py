@@ -0,0 +1,444 @@
+import calendar
+import math
+import time
+from collections import Counter, namedtuple
+from datetime import date
+from itertools import combinations, product
+
+from holiday_calendar import to_date_set
+
+# Explains why a month cannot be scheduled.
+#
+# Every hard constraint that can make a month infeasible is one item: a leave or
+# off date of a person, a busy weekday, a fixed date, a person's total/weekend
+# cap, an incompatible pair, min_seniors, the gender rule, rest rules. An
+# oracle decides whether a set of items is infeasible with two relaxations of
+# the scheduler's rules, both polynomial:
+#   - per date: is there any valid team (availability, fixed people, gender,
+#     pairs, seniors)? Decided from counts per role and gender; pairs between
+#     non-fixed people only where the date has few possible teams.
+#   - over the month: can every date be staffed within everyone's total and
+#     weekend caps (a max-flow, once with senior slots and once with M/F slots)?
+# Fixed people count as team members the team rules apply to, and fixed dates
+# beyond a person's cap are a conflict, so adding an item never makes a set
+# feasible again (QuickXplain's minimality relies on that).
+# If the oracle finds the full set infeasible, QuickXplain narrows it down to a
+# minimal conflicting set with O(k log(n/k)) oracle calls for a conflict of k
+# items among n. When a date has no possible team, only the items about that
+# date are searched; otherwise whole kinds of items (all leaves, all caps, ...)
+# are narrowed first and then the items of the kinds that remain. Oracle results
+# are cached per item set, and the search stops after MAX_CHECKS checks or
+# TIME_LIMIT seconds with the smallest conflicting set found so far (minimal=False).
+# Weekly limits, conditional rules and the Saturday/Sunday balance are not
+# modelled, so a month can still fail with no conflict found.
+
+DATE_FMT = "%d/%m/%Y"
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Item kind -> scheduler rule that makes it hard (None: always hard)
+ITEM_RULES = {
+    "leave": "leave_dates", "off": "off_dates", "busy": "busy_days", "fixed": None,
+    "max_duties": "max_duties", "max_weekends": "max_weekends", "pair": "forbidden_pairs",
+    "min_seniors": "min_seniors", "gender": "gender", "mixed_gender_pref": "mixed_gender_pref",
+    "consecutive": "consecutive", "two_day_rest": "two_day_rest",
+}
+
+_INF = float("inf")
+
+# Most candidate teams enumerated on one date to check incompatible pairs exactly;
+# beyond it pairs between non-fixed people are left out of the date check
+PAIR_SEARCH_LIMIT = 200
+
+# Budget of one explanation: oracle checks and seconds
+MAX_CHECKS = 400
+TIME_LIMIT = 2.0
+
+# items: conflicting constraints; dates: dates they leave without a team;
+# minimal: False when the budget ran out before the set was narrowed down
+Explanation = namedtuple("Explanation", ["items", "dates", "minimal"])
+
+
+def _split(value):
+    return [x.strip() for x in (value or "").split(",") if x.strip()]
+
+
+def _limit(person, fixed_key, max_key):
+    # Same limit as DutyScheduler.constraint_violations
+    fixed = person.get(fixed_key, 0) or 0
+    return fixed if fixed > 0 else (person.get(max_key, 0) or 0)
+
+
+def duty_limits(person):
+    """(total, weekend) duty limits the scheduler applies to a person."""
+    return _limit(person, 'fixed_duties_total', 'max_duties'), _limit(person, 'fixed_duties_weekend', 'max_weekends')
+
+
+class _Month:
+    """Scheduler inputs in the shape the oracle needs."""
+
+    def __init__(self, year, month, personnel, config):
+        self.days = [date(year, month, d) for d in range(1, calendar.monthrange(year, month)[1] + 1)]
+        self.people = personnel
+        self.names = [p['name'] for p in personnel]
+        self.by_name = {p['name']: p for p in personnel}
+        self.ppl = config['people_per_day']
+        self.config = config
+        holidays = to_date_set(config.get('holidays', []))
+        self.weekend = {d for d in self.days if d.weekday() >= 5 or d in holidays}
+        soft = set(config.get('soft_rules', []))
+        self.items = [item for item in self._collect() if ITEM_RULES[item[0]] not in soft]
+
+    def _collect(self):
+        config = self.config
+        in_month = {d.strftime(DATE_FMT): d for d in self.days}
+        for p in self.people:
+            for kind, key in (("leave", "leave_dates"), ("off", "off_dates"), ("fixed", "fixed_dates")):
+                for value in _split(p.get(key)):
+                    if value in in_month:
+                        yield (kind, p['name'], in_month[value])
+            for day_name in _split(p.get('busy_days')):
+                if day_name in DAY_NAMES:
+                    yield ("busy", p['name'], DAY_NAMES.index(day_name))
+            if _limit(p, 'fixed_duties_total', 'max_duties') < len(self.days):
+                yield ("max_duties", p['name'])
+            if _limit(p, 'fixed_duties_weekend', 'max_weekends') < len(self.weekend):
+                yield ("max_weekends", p['name'])
+            if not p.get('mixed_gender_allowed', True):
+                yield ("mixed_gender_pref", p['name'])
+        for pair in config.get('forbidden_pairs', []):
+            if pair['p1'] in self.names and pair['p2'] in self.names:
+                yield ("pair", pair['p1'], pair['p2'])
+        if config.get('min_seniors', 0) > 0:
+            yield ("min_seniors",)
+        if config.get('gender_mode', 'Any') != 'Any':
+            yield ("gender",)
+        if not config.get('allow_consecutive', False):
+            yield ("consecutive",)
+            if config.get('require_two_rest_days', False):
+                yield ("two_day_rest",)
+
+    def infeasible(self, items):
+        """True if the items alone already make the month impossible."""
+        items = set(items)
+        blocked, fixed = self._availability(items)
+        for d in self.days:
+            if not self._day_possible(d, blocked, fixed.get(d, []), items):
+                return True
+        return not self._caps_possible(blocked, fixed, items)
+
+    def failing_days(self, items):
+        items = set(items)
+        blocked, fixed = self._availability(items)
+        return [d for d in self.days if not self._day_possible(d, blocked, fixed.get(d, []), items)]
+
+    def about_date(self, item, d):
+        """Whether an item takes part in the team check of date d."""
+        kind = item[0]
+        if kind in ("leave", "off", "fixed"):
+            return item[2] == d
+        if kind == "busy":
+            return item[2] == d.weekday()
+        if kind == "consecutive":
+            return d == self.days[0]
+        if kind == "two_day_rest":
+            return d in self.days[:2]
+        return kind in ("pair", "min_seniors", "gender", "mixed_gender_pref")
+
+    def _availability(self, items):
+        # blocked: {(name, date)} the person cannot work; fixed: {date: [names]}
+        blocked, fixed = set(), {}
+        history = self.config.get('history', {})
+        for item in items:
+            kind = item[0]
+            if kind in ("leave", "off"):
+                blocked.add((item[1], item[2]))
+            elif kind == "busy":
+                blocked.update((item[1], d) for d in self.days if d.weekday() == item[2])
+            elif kind == "fixed":
+                fixed.setdefault(item[2], []).append(item[1])
+            elif kind == "consecutive":
+                blocked.update((name, self.days[0]) for name in history.get('prev_1', []))
+            elif kind == "two_day_rest":
+                blocked.update((name, self.days[0]) for name in history.get('prev_2', []))
+                if len(self.days) > 1:
+                    blocked.update((name, self.days[1]) for name in history.get('prev_1', []))
+        return blocked, fixed
+
+    def _day_possible(self, d, blocked, fixed, items):
+        """
+        Whether any valid team exists on date d. Fixed people are part of the team and
+        the team rules apply to them too, so a fixed item only ever adds constraints
+        (QuickXplain needs a monotone oracle). Counts per role and gender decide in
+        constant time per team shape; incompatible pairs inside the pool are checked
+        by enumerating teams only when there are at most PAIR_SEARCH_LIMIT of them.
+        """
+        team = [self.by_name[name] for name in fixed if name in self.by_name]
+        places = self.ppl - len(team)
+        if places < 0:
+            return False
+        fixed_names = {p['name'] for p in team}
+        pairs = [frozenset(item[1:]) for item in items if item[0] == "pair"]
+        partners = set()
+        for pair in pairs:
+            inside = pair & fixed_names
+            if len(inside) == 2:
+                return False
+            if inside:
+                partners |= pair - inside
+        pool = [
+            p for p in self.people
+            if p['name'] not in fixed_names and p['name'] not in partners and (p['name'], d) not in blocked
+        ]
+        mode = self.config.get('gender_mode', 'Any') if ("gender",) in items else 'Any'
+        seniors = self.config.get('min_seniors', 0) if ("min_seniors",) in items else 0
+        no_mixed = {item[1] for item in items if item[0] == "mixed_gender_pref"}
+
+        # Team shapes: (who may be on the team, both genders required)
+        one_gender = [(lambda p, g=g: p['gender'] == g, False) for g in ("M", "F")]
+        def may_mix(p):
+            return p['name'] not in no_mixed
+
+        if mode == 'Single Gender':
+            shapes = one_gender
+        elif mode == 'Mixed':
+            shapes = [(may_mix, True)]
+        else:
+            shapes = one_gender + [(may_mix, False)]
+
+        for allowed, both in shapes:
+            if not all(allowed(p) for p in team):
+                continue
+            shape_pool = [p for p in pool if allowed(p)]
+            if not _counts_possible(team, shape_pool, places, seniors, both):
+                continue
+            names = {p['name'] for p in shape_pool}
+            inner = [pair for pair in pairs if pair <= names]
+            if not inner or math.comb(len(shape_pool), places) > PAIR_SEARCH_LIMIT:
+                return True
+            for extra in combinations(shape_pool, places):
+                full = team + list(extra)
+                chosen = {p['name'] for p in extra}
+                if (any(pair <= chosen for pair in inner)
+                        or sum(1 for p in full if p.get('role') == 'Senior') < seniors
+                        or (both and len({p['gender'] for p in full}) < 2)):
+                    continue
+                return True
+        return False
+
+    def _caps_possible(self, blocked, fixed, items):
+        # Rest rules bound how many dates one person can take in a month
+        n = len(self.days)
+        rest_cap = -(-n // 3) if ("two_day_rest",) in items else -(-n // 2) if ("consecutive",) in items else n
+        caps = {}
+        for p in self.people:
+            total = _limit(p, 'fixed_duties_total', 'max_duties') if ("max_duties", p['name']) in items else n
+            weekend = _limit(p, 'fixed_duties_weekend', 'max_weekends') if ("max_weekends", p['name']) in items else n
+            # Fixed duties use the caps up; more fixed dates than a cap is a conflict
+            # (counting it as "cap used up" would let a fixed item make a month feasible)
+            own_fixed = [d for d, names in fixed.items() if p['name'] in names]
+            total = min(total, rest_cap) - len(own_fixed)
+            weekend -= sum(1 for d in own_fixed if d in self.weekend)
+            if total < 0 or weekend < 0:
+                return False
+            caps[p['name']] = (total, weekend)
+
+        slot_types = [None]
+        seniors = self.config.get('min_seniors', 0)
+        if ("min_seniors",) in items and seniors > 0:
+            slot_types.append(("role", "Senior", seniors))
+        if ("gender",) in items and self.config.get('gender_mode') == 'Mixed' and self.ppl > 1:
+            slot_types.append(("gender", "M", 1))
+            slot_types.append(("gender", "F", 1))
+        return all(self._flow_possible(blocked, fixed, caps, slot) for slot in slot_types)
+
+    def _flow_possible(self, blocked, fixed, caps, slot):
+        """
+        source -> person group (total caps) -> date, weekend dates through group_weekend (weekend caps);
+        date -> sink (open places). With slot = (field, value, k), k places of every
+        date are reserved for people with p[field] == value.
+        """
+        graph = _FlowGraph()
+        demand = 0
+        for d in self.days:
+            names = fixed.get(d, [])
+            if len(names) >= self.ppl:
+                continue
+            open_places = self.ppl - len(names)
+            demand += open_places
+            if slot is None:
+                graph.add(("day", d), "sink", open_places)
+                continue
+            field, value, k = slot
+            have = sum(1 for p in self.people if p['name'] in names and p.get(field) == value)
+            reserved = min(open_places, max(0, k - have))
+            graph.add(("typed", d), ("day", d), _INF)
+            graph.add(("typed", d), "sink", reserved)
+            graph.add(("day", d), "sink", open_places - reserved)
+        # People with the same caps, slot type and free dates share one node: a flow
+        # of the group splits back over its members by assigning dates round-robin
+        groups = Counter()
+        for p in self.people:
+            total, weekend = caps[p['name']]
+            if total <= 0:
+                continue
+            target = "typed" if slot is not None and p.get(slot[0]) == slot[1] else "day"
+            free = tuple(
+                d for d in self.days
+                if (p['name'], d) not in blocked and p['name'] not in fixed.get(d, []) and len(fixed.get(d, [])) < self.ppl
+            )
+            groups[(total, weekend, target, free)] += 1
+        for i, ((total, weekend, target, free), size) in enumerate(groups.items()):
+            graph.add("source", ("p", i), total * size)
+            graph.add(("p", i), ("pw", i), weekend * size)
+            for d in free:
+                graph.add(("pw", i) if d in self.weekend else ("p", i), (target, d), size)
+        return graph.max_flow("source", "sink") >= demand
+
+
+def _counts_possible(team, pool, places, seniors, both):
+    """Whether `places` people of the pool complete the team to min seniors (and both genders)."""
+    need_seniors = seniors - sum(1 for p in team if p.get('role') == 'Senior')
+    missing = sorted({"M", "F"} - {p['gender'] for p in team}) if both else []
+    counts = Counter((p.get('role') == 'Senior', p['gender']) for p in pool)
+    # One person per missing gender, senior or not; the rest seniors first
+    for picks in product((True, False), repeat=len(missing)):
+        left = Counter(counts)
+        left.subtract((senior, gender) for senior, gender in zip(picks, missing))
+        if any(n < 0 for n in left.values()):
+            continue
+        rest = places - len(missing)
+        need = need_seniors - sum(picks)
+        senior_left = sum(n for (senior, _), n in left.items() if senior)
+        if rest >= 0 and sum(left.values()) >= rest and min(senior_left, rest) >= need:
+            return True
+    return False
+
+
+class _FlowGraph:
+    """Small Dinic max-flow over hashable node names."""
+
+    def __init__(self):
+        self.adj = {}
+        self.edges = []  # [to, capacity, index of the reverse edge]
+
+    def add(self, u, v, cap):
+        self.adj.setdefault(u, []).append(len(self.edges))
+        self.edges.append([v, cap, len(self.edges) + 1])
+        self.adj.setdefault(v, []).append(len(self.edges))
+        self.edges.append([u, 0, len(self.edges) - 1])
+
+    def max_flow(self, s, t):
+        if s not in self.adj or t not in self.adj:
+            return 0
+        flow = 0
+        while True:
+            level = {s: 0}
+            queue = [s]
+            for u in queue:
+                for e in self.adj[u]:
+                    v, cap, _ = self.edges[e]
+                    if cap > 0 and v not in level:
+                        level[v] = level[u] + 1
+                        queue.append(v)
+            if t not in level:
+                return flow
+            pointer = {u: 0 for u in level}
+            while True:
+                pushed = self._push(s, t, _INF, level, pointer)
+                if not pushed:
+                    break
+                flow += pushed
+
+    def _push(self, u, t, limit, level, pointer):
+        if u == t:
+            return limit
+        edges = self.adj[u]
+        while pointer[u] < len(edges):
+            e = edges[pointer[u]]
+            v, cap, rev = self.edges[e]
+            if cap > 0 and level.get(v) == level[u] + 1:
+                pushed = self._push(v, t, min(limit, cap), level, pointer)
+                if pushed:
+                    self.edges[e][1] -= pushed
+                    self.edges[rev][1] += pushed
+                    return pushed
+            pointer[u] += 1
+        return 0
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+class _Oracle:
+    """Cached infeasibility checks within a budget; remembers the smallest infeasible set seen."""
+
+    def __init__(self, infeasible, items, max_checks, time_limit):
+        self.check = infeasible
+        self.order = {item: i for i, item in enumerate(items)}
+        self.cache = {}
+        self.checks = 0
+        self.max_checks = max_checks
+        self.deadline = time.monotonic() + time_limit
+        self.smallest = list(items)
+
+    def __call__(self, items):
+        key = frozenset(items)
+        result = self.cache.get(key)
+        if result is None:
+            if self.checks >= self.max_checks or time.monotonic() > self.deadline:
+                raise _OutOfBudget()
+            self.checks += 1
+            result = self.cache[key] = self.check(key)
+            if result and len(key) < len(self.smallest):
+                self.smallest = sorted(key, key=self.order.get)
+        return result
+
+
+def _quickxplain(background, items, infeasible):
+    # Junker's QuickXplain: a minimal subset of items that is infeasible together with background
+    if not items:
+        return []
+
+    def qx(base, delta, candidates):
+        if delta and infeasible(base):
+            return []
+        if len(candidates) == 1:
+            return list(candidates)
+        half = len(candidates) // 2
+        first, second = candidates[:half], candidates[half:]
+        conflict_2 = qx(base + first, first, second)
+        conflict_1 = qx(base + conflict_2, conflict_2, first)
+        return conflict_1 + conflict_2
+
+    return qx(list(background), [], list(items))
+
+
+def explain(year, month, personnel, config, max_checks=MAX_CHECKS, time_limit=TIME_LIMIT):
+    """
+    Minimal set of hard constraints that together make the month infeasible,
+    as items like ("leave", name, date), ("max_duties", name), ("pair", a, b),
+    ("min_seniors",), plus the dates they leave without a valid team.
+    Returns an Explanation, or None if no conflict among the modelled rules exists.
+    """
+    m = _Month(year, month, personnel, config)
+    failing = m.failing_days(m.items)
+    if failing:
+        # One date without a team is enough; its items alone already rule the month out
+        candidates = [item for item in m.items if m.about_date(item, failing[0])]
+    elif m.infeasible(m.items):
+        candidates = m.items
+    else:
+        return None
+
+    oracle = _Oracle(m.infeasible, candidates, max_checks, time_limit)
+    try:
+        groups = {}
+        for item in candidates:
+            groups.setdefault(item[0], []).append(item)
+        kinds = _quickxplain([], list(groups.values()), lambda gs: oracle([item for g in gs for item in g]))
+        conflict = _quickxplain([], [item for g in kinds for item in g], oracle)
+        minimal = True
+    except _OutOfBudget:
+        conflict, minimal = oracle.smallest, False
+    return Explanation(conflict, m.failing_days(conflict), minimal)
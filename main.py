@@ -1,30 +1,24 @@
 import streamlit as st
-import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from datetime import date, timedelta
 import calendar
-from scheduler import DutyScheduler
+from scheduler import DutyScheduler, RULES, DEFAULT_PENALTIES, COUNT_FIELDS, GENDER_MODES, GENDER_LABELS
+from calendar_view import get_calendar_html, get_year_html
+import storage
+import history
+import holiday_calendar
+import personnel_store
+import scoring
 import json
-import os
-import bcrypt
-from io import BytesIO
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import urllib.request
-import holidays as holidays_lib
-import statistics
+import copy
+import auth
+from exports import generate_excel, generate_pdf, generate_calendar_pdf, generate_ics, generate_person_ics_zip, find_font_pair, schedule_hash, cached_export, build_zip
 import re
-import time
+import math
 
-# --- Cloud Database Imports ---
-try:
-    from google.cloud import firestore
-    from google.oauth2 import service_account
-except ImportError:
-    firestore = None
+# Heavy libraries (pandas, numpy, holidays, google-cloud-firestore, reportlab,
+# xlsxwriter) are imported where they are used, so the login page and cold
+# starts do not pay for them. `python startup_check.py` measures this.
 
 # --- Translation Dictionary ---
 LANG_TEXT = {
@@ -78,6 +72,7 @@ LANG_TEXT = {
         "success": "Schedule generated successfully!",
         "err_fail": "Could not generate a valid schedule with current constraints. Try increasing Max Duties or reducing constraints.",
         "stats": "Statistics",
+        "department": "Department",
         "col_date": "Date",
         "col_day": "Day",
         "col_team": "Team",
@@ -90,7 +85,7 @@ LANG_TEXT = {
         "col_off_help": "Specific dates (YYYY-MM-DD)",
         "col_leave_help": "Dates on leave (DD/MM/YYYY). Use the tool below for date ranges.",
         "col_fixed_help": "Specific dates (YYYY-MM-DD)",
-        "gender_opts": ["Any", "Mixed (Must have M & F)", "Single Gender (All M or All F)"],
+        "gender_opts": GENDER_LABELS["English"],
         "rule_header": "Conditional Rules",
         "rule_trigger": "If holds duty on:",
         "rule_forbidden": "Cannot hold duty on:",
@@ -105,6 +100,8 @@ LANG_TEXT = {
         "logout": "Logout",
         "login_success": "Logged In as {}",
         "login_failed": "Incorrect Username or Password",
+        "login_throttled": "Too many attempts. Please try again in {} seconds.",
+        "server_busy": "Server is busy, please try again in a moment.",
         "user_exists": "User already exists",
         "reg_success": "Account Created! Please Login.",
         "export_excel": "📊 Export to Excel",
@@ -112,10 +109,70 @@ LANG_TEXT = {
         "holidays": "Holidays (Count as Weekend)",
         "holidays_help": "Select dates that should be treated as weekends (e.g. National Holidays).",
         "load_tr_holidays": "🇹🇷 Load TR Holidays",
+        "half_day": "half day",
         "cal_view": "📅 Calendar View",
+        "filter_all": "All",
         "list_view": "📋 List View",
         "fairness_score": "Fairness Score (Std Dev)",
         "fairness_help": "Lower is better. 0 means perfect equality.",
+        "fairness_wknd": "Weekend Fairness (Std Dev)",
+        "use_history": "Balance with Past Months",
+        "use_history_help": "Gives priority to people who had fewer duties (and weekend duties) per month in previously saved schedules.",
+        "soft_header": "Rule Strictness",
+        "soft_help": "Soft rules may be broken when no one else fits, at the cost of a penalty; the schedule with the lowest total penalty is chosen. Hard rules are never broken.",
+        "soft_rules": "Soft Rules",
+        "penalty_for": "Penalty: {}",
+        "soft_violations": "{} soft rule violation(s), total penalty {}",
+        "col_rule": "Rule",
+        "rule_max_duties": "Max Duties",
+        "rule_max_weekends": "Max Weekend Duties",
+        "rule_consecutive": "Consecutive Days",
+        "rule_two_day_rest": "2 Days Rest",
+        "rule_weekly_limit": "Weekly Limit",
+        "rule_busy_days": "Busy Days",
+        "rule_off_dates": "Off Dates",
+        "rule_leave_dates": "Leave Dates",
+        "rule_conditional": "Conditional Rules",
+        "rule_weekend_balance": "Saturday/Sunday Balance",
+        "rule_gender": "Gender Rule",
+        "rule_mixed_gender_pref": "Mixed Gender Preference",
+        "rule_forbidden_pairs": "Incompatible Pairs",
+        "rule_min_seniors": "Min Seniors",
+        "opt_header": "Optimization Goals",
+        "opt_help": "Weights of the fairness goals used to pick the best of the generated schedules (0 = ignored).",
+        "opt_candidates": "Candidate Schedules",
+        "opt_candidates_help": "How many valid schedules are generated and compared. More candidates give fairer results but take longer.",
+        "w_total_std": "Total Duty Balance",
+        "w_weekend_std": "Weekend Balance",
+        "w_weekday_std": "Weekday Balance",
+        "w_sat_sun_gap": "Saturday/Sunday Balance",
+        "w_co_occurrence_std": "Team Variety",
+        "hardest_first": "Fill Hardest Dates First",
+        "hardest_first_help": "Fills the dates with the fewest eligible people (seniors, each gender) first, e.g. weekends or holidays with many people on leave, instead of the 1st to the last day.",
+        "record_trace": "Record Decision Trace",
+        "record_trace_help": "Records every decision of the next generation (seeds, candidate order, rejecting rules, time per date) for a downloadable trace. Inspect it with `python decision_trace.py summary` or rerun it with `replay`.",
+        "dl_trace": "⬇️ Decision Trace",
+        "infeasible_header": "These constraints cannot all hold together. Loosening any one of them removes this conflict:",
+        "infeasible_days": "Dates without any possible team: {0}",
+        "infeasible_month": "Together they leave too few duties (or weekend duties) for the month.",
+        "btn_explain": "🔍 Explain why",
+        "spinner_explain": "Searching for conflicting constraints...",
+        "infeasible_partial": "The search stopped at its time limit, so some of these may not be needed.",
+        "infeasible_none": "No conflict found among leaves, fixed dates, limits, pairs and team rules. The weekly limit, conditional rules, the Saturday/Sunday balance or the random search may be the cause; try soft rules or more candidates.",
+        "conf_leave": "{0} is on leave on {1}",
+        "conf_off": "{0} is off on {1}",
+        "conf_fixed": "{0} has a fixed duty on {1}",
+        "conf_busy": "{0} is busy on {1}",
+        "conf_max_duties": "Max duties of {0}: {1}",
+        "conf_max_weekends": "Max weekend duties of {0}: {1}",
+        "conf_pair": "{0} and {1} cannot work together",
+        "conf_min_seniors": "At least {0} senior(s) per day",
+        "conf_gender": "Gender rule: {0}",
+        "conf_mixed_gender_pref": "{0} does not accept mixed-gender teams",
+        "conf_consecutive": "No consecutive duties (including the last day of the previous month)",
+        "conf_two_day_rest": "Two rest days between duties",
+        "cumulative_history": "Cumulative (Saved Months)",
+        "col_months": "Months",
         "short_days": ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
         "conflict_header": "Incompatible Pairs",
         "conflict_help": "Select two people who should NOT work together.",
@@ -124,6 +181,9 @@ LANG_TEXT = {
         "template_download": "📥 Download Excel Template",
         "co_occurrence": "🤝 Team Co-occurrence (Who works with whom?)",
         "day_distribution": "📅 Day of Week Distribution",
+        "sheet_schedule": "Schedule",
+        "sheet_days": "Day Distribution",
+        "sheet_co_occurrence": "Co-occurrence",
         "role": "Role",
         "role_senior": "Senior",
         "role_junior": "Junior",
@@ -202,6 +262,7 @@ LANG_TEXT = {
         "success": "Nöbet takvimi başarıyla oluşturuldu!",
         "err_fail": "Uygun takvim oluşturulamadı. Kuralları azaltmayı ya da nöbet sayılarını arttırmayı deneyin.",
         "stats": "İstatistikler",
+        "department": "Bölüm",
         "col_date": "Tarih",
         "col_day": "Gün",
         "col_team": "Ekip",
@@ -214,7 +275,7 @@ LANG_TEXT = {
         "col_off_help": "Belirli tarihler (YYYY-AA-GG)",
         "col_leave_help": "İzinli olunan tarihler (GG/AA/YYYY). Tarih aralığı için aşağıdaki aracı kullanın.",
         "col_fixed_help": "Belirli tarihler (YYYY-AA-GG)",
-        "gender_opts": ["Fark etmez", "Karma (E & K olmalı)", "Tek Cinsiyet (Hepsi E veya Hepsi K)"],
+        "gender_opts": GENDER_LABELS["Türkçe"],
         "rule_header": "Koşullu Kurallar",
         "rule_trigger": "Eğer şu gün nöbetçiyse:",
         "rule_forbidden": "Şu gün nöbet tutamaz:",
@@ -229,6 +290,8 @@ LANG_TEXT = {
         "logout": "Çıkış",
         "login_success": "Giriş Başarılı: {}",
         "login_failed": "Hatalı Kullanıcı Adı veya Şifre",
+        "login_throttled": "Çok fazla deneme. Lütfen {} saniye sonra tekrar deneyin.",
+        "server_busy": "Sunucu meşgul, lütfen birazdan tekrar deneyin.",
         "user_exists": "Kullanıcı zaten var",
         "reg_success": "Hesap Oluşturuldu! Lütfen Giriş Yapın.",
         "export_excel": "📊 Excel Olarak İndir",
@@ -236,10 +299,70 @@ LANG_TEXT = {
         "holidays": "Tatiller (Hafta Sonu Say)",
         "holidays_help": "Hafta sonu gibi sayılacak günleri seçin (örn. Resmi Tatiller).",
         "load_tr_holidays": "TR Tatillerini Yükle",
+        "half_day": "yarım gün",
         "cal_view": "📅 Takvim Görünümü",
+        "filter_all": "Tümü",
         "list_view": "📋 Liste Görünümü",
         "fairness_score": "Adalet Puanı (Standart Sapma)",
         "fairness_help": "Düşük olması iyidir. 0 olması mükemmel eşitlik demektir.",
+        "fairness_wknd": "Hafta Sonu Adalet Puanı (Standart Sapma)",
+        "use_history": "Geçmiş Aylarla Dengele",
+        "use_history_help": "Daha önce kaydedilen çizelgelerde ay başına daha az nöbet (ve hafta sonu nöbeti) tutan kişilere öncelik verir.",
+        "soft_header": "Kural Esnekliği",
+        "soft_help": "Esnek kurallar, uygun kimse kalmadığında bir ceza karşılığında çiğnenebilir; toplam cezası en düşük çizelge seçilir. Katı kurallar asla çiğnenmez.",
+        "soft_rules": "Esnek Kurallar",
+        "penalty_for": "Ceza: {}",
+        "soft_violations": "{} esnek kural ihlali, toplam ceza {}",
+        "col_rule": "Kural",
+        "rule_max_duties": "Maks. Nöbet",
+        "rule_max_weekends": "Maks. Hafta Sonu Nöbeti",
+        "rule_consecutive": "Ardışık Günler",
+        "rule_two_day_rest": "2 Gün Dinlenme",
+        "rule_weekly_limit": "Haftalık Limit",
+        "rule_busy_days": "Meşgul Günler",
+        "rule_off_dates": "İzinli Günler",
+        "rule_leave_dates": "Yıllık İzin",
+        "rule_conditional": "Koşullu Kurallar",
+        "rule_weekend_balance": "Cumartesi/Pazar Dengesi",
+        "rule_gender": "Cinsiyet Kuralı",
+        "rule_mixed_gender_pref": "Karma Ekip Tercihi",
+        "rule_forbidden_pairs": "Uyumsuz Çiftler",
+        "rule_min_seniors": "Min. Kıdemli",
+        "opt_header": "Optimizasyon Hedefleri",
+        "opt_help": "Oluşturulan çizelgeler arasından en iyisini seçerken kullanılan adalet hedeflerinin ağırlıkları (0 = dikkate alınmaz).",
+        "opt_candidates": "Aday Çizelge Sayısı",
+        "opt_candidates_help": "Kaç geçerli çizelge oluşturulup karşılaştırılacağı. Daha fazla aday daha adil sonuç verir ama daha uzun sürer.",
+        "w_total_std": "Toplam Nöbet Dengesi",
+        "w_weekend_std": "Hafta Sonu Dengesi",
+        "w_weekday_std": "Gün Dağılımı Dengesi",
+        "w_sat_sun_gap": "Cumartesi/Pazar Dengesi",
+        "w_co_occurrence_std": "Ekip Çeşitliliği",
+        "hardest_first": "Önce Zor Tarihleri Doldur",
+        "hardest_first_help": "Takvimi 1'inden ayın sonuna doldurmak yerine, en az uygun kişinin (kıdemli, her cinsiyet) olduğu tarihleri, örneğin çok kişinin izinli olduğu hafta sonu veya tatilleri önce doldurur.",
+        "record_trace": "Karar İzini Kaydet",
+        "record_trace_help": "Bir sonraki oluşturmanın tüm kararlarını (tohumlar, aday sırası, reddeden kurallar, tarih başına süre) indirilebilir bir iz olarak kaydeder. `python decision_trace.py summary` ile inceleyin veya `replay` ile yeniden çalıştırın.",
+        "dl_trace": "⬇️ Karar İzi",
+        "infeasible_header": "Bu kuralların hepsi aynı anda sağlanamaz. Herhangi birini gevşetmek bu çakışmayı giderir:",
+        "infeasible_days": "Hiçbir ekibin kurulamadığı tarihler: {0}",
+        "infeasible_month": "Birlikte ay için yeterli nöbet (veya hafta sonu nöbeti) bırakmıyorlar.",
+        "btn_explain": "🔍 Nedenini açıkla",
+        "spinner_explain": "Çakışan kurallar aranıyor...",
+        "infeasible_partial": "Arama süre sınırında durdu; bunların bazıları gerekmeyebilir.",
+        "infeasible_none": "İzinler, sabit tarihler, limitler, çiftler ve ekip kuralları arasında çakışma bulunamadı. Haftalık limit, koşullu kurallar, Cumartesi/Pazar dengesi veya rastgele arama sebep olabilir; esnek kuralları veya daha fazla aday deneyin.",
+        "conf_leave": "{0} {1} tarihinde izinli",
+        "conf_off": "{0} {1} tarihinde müsait değil",
+        "conf_fixed": "{0} için {1} tarihinde sabit nöbet",
+        "conf_busy": "{0} {1} günleri meşgul",
+        "conf_max_duties": "{0} için maks. nöbet: {1}",
+        "conf_max_weekends": "{0} için maks. hafta sonu nöbeti: {1}",
+        "conf_pair": "{0} ve {1} birlikte çalışamaz",
+        "conf_min_seniors": "Günde en az {0} kıdemli",
+        "conf_gender": "Cinsiyet kuralı: {0}",
+        "conf_mixed_gender_pref": "{0} karma ekip kabul etmiyor",
+        "conf_consecutive": "Art arda nöbet yok (önceki ayın son günü dahil)",
+        "conf_two_day_rest": "Nöbetler arasında iki gün dinlenme",
+        "cumulative_history": "Kümülatif (Kaydedilen Aylar)",
+        "col_months": "Ay",
         "short_days": ["Pzt", "Sal", "Çar", "Per", "Cum", "Cmt", "Paz"],
         "conflict_header": "Uyumsuz Çiftler",
         "conflict_help": "Birlikte çalışmaması gereken iki kişiyi seçin.",
@@ -248,6 +371,9 @@ LANG_TEXT = {
         "template_download": "📥 Excel Şablonu İndir",
         "co_occurrence": "🤝 Birlikte Çalışma Sıklığı",
         "day_distribution": "📅 Gün Bazlı Dağılım",
+        "sheet_schedule": "Nöbet Listesi",
+        "sheet_days": "Gün Dağılımı",
+        "sheet_co_occurrence": "Birlikte Çalışma",
         "role": "Rol",
         "role_senior": "Kıdemli",
         "role_junior": "Kıdemsiz",
@@ -277,16 +403,26 @@ LANG_TEXT = {
     }
 }
 
-USER_DB_FILE = "users_db.json"
+# Sidebar keys of the objective weights (scoring.OBJECTIVE_NAMES) and settings restored from the database
+WEIGHT_KEYS = {name: f"cfg_w_{name}" for name in scoring.OBJECTIVE_NAMES}
+# Sidebar keys of the soft-rule penalties (scheduler.RULES)
+PENALTY_KEYS = {rule: f"cfg_pen_{rule}" for rule in RULES}
+CONFIG_KEYS = ["cfg_year", "cfg_month", "cfg_ppl", "cfg_min_seniors", "cfg_gender", "cfg_consecutive", "cfg_two_rest",
+               "cfg_max_weekly", "cfg_language", "cfg_use_history", "cfg_candidates", "cfg_soft_rules", "cfg_hardest_first"] \
+              + list(WEIGHT_KEYS.values()) + list(PENALTY_KEYS.values())
+
 DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 DAYS_TR = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma", "Cumartesi", "Pazar"]
 
 def get_firestore_db():
     """Initialize Firestore Client from Streamlit Secrets"""
-    if firestore is None:
-        return None
-    
     if "firebase" in st.secrets:
+        try:
+            from google.cloud import firestore
+            from google.oauth2 import service_account
+        except ImportError:
+            return None
+
         try:
             # Construct credentials from secrets dictionary
             key_dict = dict(st.secrets["firebase"])
@@ -298,34 +434,19 @@ def get_firestore_db():
             return None
     return None
 
-def get_user_db_path(username):
-    safe_user = "".join([c for c in username if c.isalnum() or c in ('-', '_')])
-    return f"personnel_db_{safe_user}.json"
-
 def load_db(username):
-    # 1. Try Cloud Database
     db = get_firestore_db()
-    if db:
-        doc = db.collection("personnel_data").document(username).get()
-        if doc.exists:
-            return doc.to_dict()
-        return {"personnel": []}
-
-    # 2. Fallback to Local JSON
-    path = get_user_db_path(username)
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            # Backward compatibility: if list, it's just personnel
-            if isinstance(data, list):
-                return {"personnel": data}
-            return data
-    return {"personnel": []}
+    data, snapshot = storage.load_state(db, username)
+    # Remember what is stored so the next save only writes the differences
+    st.session_state["_db_snapshot"] = snapshot
+    st.session_state.save_rev = st.session_state.get("save_rev", 0) + 1
+    return data
+
+def touch_personnel():
+    # Records changed outside the personnel editor: its frame is rebuilt on the next render
+    st.session_state.personnel_rev = st.session_state.get("personnel_rev", 0) + 1
 
 def save_db(personnel, username):
-    # Prepare full state data
-    path = get_user_db_path(username)
-    
     # Save full project state
     state_data = {
         "personnel": personnel,
@@ -341,7 +462,13 @@ def save_db(personnel, username):
         "cfg_two_rest": st.session_state.get("cfg_two_rest"),
         "cfg_min_seniors": st.session_state.get("cfg_min_seniors"),
         "cfg_max_weekly": st.session_state.get("cfg_max_weekly"),
-        "cfg_language": st.session_state.get("cfg_language")
+        "cfg_language": st.session_state.get("cfg_language"),
+        "cfg_use_history": st.session_state.get("cfg_use_history"),
+        "cfg_candidates": st.session_state.get("cfg_candidates"),
+        "cfg_hardest_first": st.session_state.get("cfg_hardest_first"),
+        "cfg_soft_rules": st.session_state.get("cfg_soft_rules"),
+        **{key: st.session_state.get(key) for key in WEIGHT_KEYS.values()},
+        **{key: st.session_state.get(key) for key in PENALTY_KEYS.values()}
     }
 
     # Save generated schedule if exists (Convert date keys to strings)
@@ -353,37 +480,71 @@ def save_db(personnel, username):
         state_data["generated_schedule"] = sched_serializable
         state_data["gen_year"] = st.session_state.get("gen_year")
         state_data["gen_month"] = st.session_state.get("gen_month")
+        state_data["gen_holidays"] = st.session_state.get("gen_holidays", [])
+        state_data["gen_roster"] = st.session_state.get("gen_roster", [])
     
-    # 1. Try Cloud Database
+    # Cloud Database if configured, otherwise local JSON.
+    # Only the personnel records, settings and month that changed are written.
     db = get_firestore_db()
-    if db:
-        db.collection("personnel_data").document(username).set(state_data)
-        return
-
-    # 2. Fallback to Local JSON
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(state_data, f, ensure_ascii=False, indent=4)
-
-def load_users():
-    if os.path.exists(USER_DB_FILE):
-        with open(USER_DB_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_users(data):
-    with open(USER_DB_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    st.session_state["_db_snapshot"] = storage.save_state(db, username, state_data, st.session_state.get("_db_snapshot"))
+    # Stored history may have changed
+    st.session_state.save_rev = st.session_state.get("save_rev", 0) + 1
+
+def load_history(username):
+    # The fairness history only changes when a month is saved: read it once per save or load
+    key = (username, st.session_state.get("save_rev", 0))
+    if st.session_state.get("_history_key") != key:
+        st.session_state["_history"] = storage.load_history(get_firestore_db(), username)
+        st.session_state["_history_key"] = key
+    return st.session_state["_history"]
 
 def make_hashes(password):
-    # Generate a salt and hash the password
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    # Generate a salt and hash the password (on the bounded bcrypt pool)
+    return auth.hash_password(password)
 
 def check_hashes(password, hashed_text):
+    # Check the password against the stored hash
+    return auth.verify_password(password, hashed_text)
+
+def render_explanation(explanation, year, month, personnel, config, t, translate_day):
+    """Shows the conflicting constraints found by infeasibility.explain."""
+    if not explanation:
+        st.info(t["infeasible_none"])
+        return
+    import infeasibility
+    by_name = {p['name']: p for p in personnel}
+    lines = []
+    for kind, *args in explanation.items:
+        if kind in ("leave", "off", "fixed"):
+            args = [args[0], args[1].strftime("%d/%m/%Y")]
+        elif kind == "busy":
+            args = [args[0], translate_day(DAYS_OF_WEEK[args[1]])]
+        elif kind in ("max_duties", "max_weekends"):
+            limits = infeasibility.duty_limits(by_name[args[0]])
+            args = [args[0], limits[0] if kind == "max_duties" else limits[1]]
+        elif kind == "min_seniors":
+            args = [config['min_seniors']]
+        elif kind == "gender":
+            args = [t["gender_opts"][GENDER_MODES.index(config['gender_mode'])]]
+        lines.append(f"- {t[f'conf_{kind}'].format(*args)}")
+    if explanation.dates:
+        lines.append(t["infeasible_days"].format(", ".join(d.strftime("%d/%m/%Y") for d in explanation.dates)))
+    else:
+        lines.append(t["infeasible_month"])
+    if not explanation.minimal:
+        lines.append(t["infeasible_partial"])
+    st.warning(t["infeasible_header"] + "\n\n" + "\n".join(lines))
+
+def get_client_id():
+    """Best-effort client identity for rate limiting: client IP (see auth.client_address), then session id."""
     try:
-        # Check the password against the stored hash
-        return bcrypt.checkpw(password.encode(), hashed_text.encode())
-    except ValueError:
-        return False
+        ip = auth.client_address(st.context.ip_address, st.context.headers.get("X-Forwarded-For"))
+        if ip:
+            return ip
+    except Exception:
+        pass
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
 
 def authenticate(username, password):
     # 1. Check Cloud DB
@@ -395,8 +556,8 @@ def authenticate(username, password):
             return check_hashes(password, stored_hash)
     
     # 2. Check Local DB (Hashed passwords)
-    users = load_users()
-    if username in users and check_hashes(password, users[username]):
+    stored_hash = storage.get_user_hash(username)
+    if stored_hash and check_hashes(password, stored_hash):
         return True
     
     # 2. Check Secrets (Fallback Admin - Plain text in secrets)
@@ -423,10 +584,21 @@ def login_page():
         password = st.text_input(t["password"], type='password', key="login_pass")
         
         if st.button(t["login_btn"]):
-            # Anti-Brute Force: Simple Rate Limiting
-            time.sleep(1) # Artificial delay to slow down guessing scripts
-            
-            if authenticate(username, password):
+            # Anti-Brute Force: token buckets per username and per client, shared across sessions
+            client_id = get_client_id()
+            wait = auth.acquire_login_slot(username, client_id)
+            if wait > 0:
+                st.error(t["login_throttled"].format(math.ceil(wait)))
+                return
+
+            try:
+                ok = authenticate(username, password)
+            except auth.ServerBusyError:
+                st.error(t["server_busy"])
+                return
+            auth.record_login_result(username, client_id, ok)
+
+            if ok:
                 st.session_state['logged_in'] = True
                 st.session_state['username'] = username
                 if 'personnel' in st.session_state:
@@ -449,6 +621,17 @@ def login_page():
                 st.error("Password must be at least 8 characters long.")
                 return
 
+            wait = auth.CLIENT_THROTTLE.acquire(get_client_id())
+            if wait > 0:
+                st.error(t["login_throttled"].format(math.ceil(wait)))
+                return
+
+            try:
+                password_hash = make_hashes(new_pass)
+            except auth.ServerBusyError:
+                st.error(t["server_busy"])
+                return
+
             # 1. Cloud Registration
             db = get_firestore_db()
             if db:
@@ -456,136 +639,15 @@ def login_page():
                 if doc_ref.get().exists:
                     st.error(t["user_exists"])
                 else:
-                    doc_ref.set({"password_hash": make_hashes(new_pass)})
+                    doc_ref.set({"password_hash": password_hash})
                     st.success(t["reg_success"])
             else:
-                # 2. Local Registration
-                users = load_users()
-                if new_user in users:
+                # 2. Local Registration (insert fails if the name was taken concurrently)
+                if storage.get_user_hash(new_user) is not None or not storage.create_user(new_user, password_hash):
                     st.error(t["user_exists"])
                 else:
-                    users[new_user] = make_hashes(new_pass)
-                    save_users(users)
                     st.success(t["reg_success"])
 
-def get_calendar_html(year, month, schedule, t):
-    cal = calendar.monthcalendar(year, month)
-    
-    # Header
-    # Use CSS variables for Dark Mode compatibility
-    headers = "".join([f"<th style='border:1px solid var(--text-color); padding:8px; background:var(--secondary-background-color); width:14%; color:var(--text-color);'>{day}</th>" for day in t["short_days"]])
-    
-    html = f"<table style='width:100%; border-collapse:collapse; table-layout: fixed;'><thead><tr>{headers}</tr></thead><tbody>"
-    
-    for week in cal:
-        html += "<tr>"
-        for day in week:
-            if day == 0:
-                html += "<td style='border:1px solid var(--text-color); background:var(--background-color); opacity:0.5;'></td>"
-            else:
-                current_date = date(year, month, day)
-                is_weekend = current_date.weekday() >= 5
-                bg_color = "var(--background-color)" if not is_weekend else "var(--secondary-background-color)"
-                
-                day_content = f"<div style='font-weight:bold; margin-bottom:5px; color:var(--text-color);'>{day}</div>"
-                
-                if current_date in schedule:
-                    team = schedule[current_date]
-                    for p in team:
-                        # Random pastel colors or fixed blue
-                        day_content += f"<div style='background:#e6f3ff; padding:2px 4px; margin-bottom:2px; border-radius:4px; font-size:11px; border:1px solid #cce5ff; color:#004085; font-weight:bold;'>{p['name']}</div>"
-                
-                html += f"<td style='border:1px solid var(--text-color); padding:5px; height:100px; vertical-align:top; background:{bg_color};'>{day_content}</td>"
-        html += "</tr>"
-    
-    html += "</tbody></table>"
-    return html
-
-def generate_ics(schedule, title="Duty Roster"):
-    """Generates an iCalendar string for the schedule."""
-    ics_content = [
-        "BEGIN:VCALENDAR",
-        "VERSION:2.0",
-        "PRODID:-//NobetWizard//DutyRoster//EN",
-        "CALSCALE:GREGORIAN",
-        "METHOD:PUBLISH"
-    ]
-    
-    for d, team in schedule.items():
-        names = ", ".join([p['name'] for p in team])
-        dt_start = d.strftime("%Y%m%d")
-        dt_end = (d + timedelta(days=1)).strftime("%Y%m%d") # All day events end next day
-        
-        ics_content.append("BEGIN:VEVENT")
-        ics_content.append(f"DTSTART;VALUE=DATE:{dt_start}")
-        ics_content.append(f"DTEND;VALUE=DATE:{dt_end}")
-        ics_content.append(f"SUMMARY:{title}: {names}")
-        ics_content.append(f"DESCRIPTION:Team: {names}")
-        ics_content.append("END:VEVENT")
-        
-    ics_content.append("END:VCALENDAR")
-    return "\n".join(ics_content).encode('utf-8')
-
-def generate_excel(df_res):
-    buffer_excel = BytesIO()
-    with pd.ExcelWriter(buffer_excel, engine='openpyxl') as writer:
-        df_res.to_excel(writer, index=False, sheet_name='Schedule')
-        # Adjust column widths
-        worksheet = writer.sheets['Schedule']
-        for column_cells in worksheet.columns:
-            length = max(len(str(cell.value)) for cell in column_cells)
-            worksheet.column_dimensions[column_cells[0].column_letter].width = length + 2
-    return buffer_excel.getvalue()
-
-def generate_pdf(df_res, year, month, t):
-    buffer_pdf = BytesIO()
-    doc = SimpleDocTemplate(buffer_pdf, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # --- Font Registration for Turkish Support ---
-    font_name = 'Helvetica' # Default fallback
-    font_name_bold = 'Helvetica-Bold'
-    try:
-        font_path_reg = "Roboto-Regular.ttf"
-        font_path_bold = "Roboto-Bold.ttf"
-        
-        if not os.path.exists(font_path_reg):
-            urllib.request.urlretrieve("https://raw.githubusercontent.com/googlefonts/roboto/main/src/hinted/Roboto-Regular.ttf", font_path_reg)
-        
-        if not os.path.exists(font_path_bold):
-            urllib.request.urlretrieve("https://raw.githubusercontent.com/googlefonts/roboto/main/src/hinted/Roboto-Bold.ttf", font_path_bold)
-        
-        pdfmetrics.registerFont(TTFont('Roboto', font_path_reg))
-        pdfmetrics.registerFont(TTFont('Roboto-Bold', font_path_bold))
-        font_name = 'Roboto'
-        font_name_bold = 'Roboto-Bold'
-    except Exception as e:
-        print(f"Font Error: {e}")
-
-    # Title
-    title_style = styles['Title']
-    title_style.fontName = font_name_bold
-    elements.append(Paragraph(f"{t['title']} - {year}/{month}", title_style))
-    
-    # Table
-    data = [df_res.columns.to_list()] + df_res.values.tolist()
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), font_name_bold),
-        ('FONTNAME', (0, 1), (-1, -1), font_name),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(table)
-    
-    doc.build(elements)
-    return buffer_pdf.getvalue()
-
 def main():
     st.set_page_config(page_title="Nöbet Wizard", layout="wide")
     
@@ -595,11 +657,15 @@ def main():
     if not st.session_state['logged_in']:
         login_page()
         return
-    
+
+    # Needed from here on (personnel editor, results); kept off the login page
+    import pandas as pd
+
     if 'personnel' not in st.session_state:
         # Load full project state
         db_data = load_db(st.session_state.get('username'))
         st.session_state.personnel = db_data.get("personnel", [])
+        touch_personnel()
         
         # Restore other settings if available
         if "conditional_rules" in db_data:
@@ -610,7 +676,7 @@ def main():
             st.session_state.holidays_multiselect = db_data["holidays_multiselect"]
             
         # Restore config widgets (Streamlit handles this if we set the key in session_state)
-        for key in ["cfg_year", "cfg_month", "cfg_ppl", "cfg_min_seniors", "cfg_gender", "cfg_consecutive", "cfg_two_rest", "cfg_max_weekly", "cfg_language"]:
+        for key in CONFIG_KEYS:
             if key in db_data:
                 st.session_state[key] = db_data[key]
         
@@ -624,6 +690,9 @@ def main():
                 st.session_state.generated_schedule = sched_loaded
                 st.session_state.gen_year = db_data.get("gen_year")
                 st.session_state.gen_month = db_data.get("gen_month")
+                st.session_state.gen_holidays = db_data.get("gen_holidays", [])
+                st.session_state.gen_roster = db_data.get("gen_roster", [])
+                st.session_state.gen_violations = []
                 st.session_state.schedule_success = True
             except Exception as e:
                 print(f"Error loading schedule: {e}")
@@ -679,11 +748,7 @@ def main():
     min_seniors = st.sidebar.number_input(t["min_seniors"], min_value=0, max_value=people_per_day, key="cfg_min_seniors")
     
     # Map display options to internal logic keys
-    gender_map = {
-        t["gender_opts"][0]: "Any",
-        t["gender_opts"][1]: "Mixed",
-        t["gender_opts"][2]: "Single Gender"
-    }
+    gender_map = dict(zip(t["gender_opts"], GENDER_MODES))
     
     gender_mode = st.sidebar.selectbox(
         t["gender_rules"], 
@@ -703,6 +768,40 @@ def main():
     if "cfg_max_weekly" not in st.session_state:
         st.session_state.cfg_max_weekly = 3
     max_weekly = st.sidebar.number_input(t["weekly_limit"], min_value=1, max_value=7, help=t["weekly_limit_help"], key="cfg_max_weekly")
+
+    if "cfg_use_history" not in st.session_state:
+        st.session_state.cfg_use_history = False
+    use_history = st.sidebar.checkbox(t["use_history"], help=t["use_history_help"], key="cfg_use_history")
+
+    # --- Rule Strictness ---
+    with st.sidebar.expander(t["soft_header"]):
+        st.caption(t["soft_help"])
+        if "cfg_soft_rules" not in st.session_state:
+            # All rules hard, as the scheduler; users opt in to soft rules
+            st.session_state.cfg_soft_rules = []
+        soft_rules = st.multiselect(t["soft_rules"], RULES, format_func=lambda r: t[f"rule_{r}"], key="cfg_soft_rules", placeholder=t["placeholder_select"])
+        rule_penalties = {}
+        for rule in soft_rules:
+            key = PENALTY_KEYS[rule]
+            if key not in st.session_state:
+                st.session_state[key] = DEFAULT_PENALTIES[rule]
+            rule_penalties[rule] = st.number_input(t["penalty_for"].format(t[f"rule_{rule}"]), min_value=0, max_value=1000, step=1, key=key)
+
+    # --- Optimization Goals ---
+    with st.sidebar.expander(t["opt_header"]):
+        st.caption(t["opt_help"])
+        if "cfg_candidates" not in st.session_state:
+            st.session_state.cfg_candidates = 5
+        candidate_count = st.number_input(t["opt_candidates"], min_value=1, max_value=500, help=t["opt_candidates_help"], key="cfg_candidates")
+        objective_weights = {}
+        for name, key in WEIGHT_KEYS.items():
+            if key not in st.session_state:
+                st.session_state[key] = scoring.DEFAULT_WEIGHTS[name]
+            objective_weights[name] = st.slider(t[f"w_{name}"], min_value=0.0, max_value=3.0, step=0.25, key=key)
+        if "cfg_hardest_first" not in st.session_state:
+            st.session_state.cfg_hardest_first = False
+        hardest_first = st.checkbox(t["hardest_first"], help=t["hardest_first_help"], key="cfg_hardest_first")
+        record_trace = st.checkbox(t["record_trace"], help=t["record_trace_help"], key="record_trace")
     
     # --- Previous Month Context ---
     st.sidebar.markdown("---")
@@ -731,20 +830,31 @@ def main():
     if "holidays_multiselect" not in st.session_state:
         st.session_state["holidays_multiselect"] = []
 
-    if lang == "Türkçe":
-        if st.sidebar.button(t["load_tr_holidays"]):
-            try:
-                tr_holidays = holidays_lib.TR(years=year)
-                month_holidays = [d.strftime("%d/%m/%Y") for d in tr_holidays if d.month == month]
-                st.session_state["holidays_multiselect"] = month_holidays
-                st.rerun()
-            except Exception as e:
-                st.sidebar.error(f"Error: {e}")
+    # Official holidays of the month (incl. half-days such as arife), from the per-process cache
+    try:
+        month_holidays = holiday_calendar.month_holidays(holiday_calendar.DEFAULT_COUNTRY, year, month, holiday_calendar.LANGUAGE_CODES.get(lang))
+    except Exception as e:
+        month_holidays = []
+        st.sidebar.error(f"Error: {e}")
+    holiday_labels = {holiday_calendar.format_date(d): (f"{name} ({t['half_day']})" if half else name) for d, name, half in month_holidays}
+
+    if st.sidebar.button(t["load_tr_holidays"]):
+        st.session_state["holidays_multiselect"] = list(holiday_labels)
+        st.rerun()
 
     # Ensure selected holidays are valid for the current month (prevents errors when changing months)
     st.session_state["holidays_multiselect"] = [d for d in st.session_state["holidays_multiselect"] if d in all_month_dates]
-    
-    selected_holidays = st.sidebar.multiselect(t["holidays"], all_month_dates, key="holidays_multiselect", help=t["holidays_help"], placeholder=t["placeholder_select"])
+
+    # Preload the official holidays once per selected month, unless a selection for it was restored
+    if st.session_state.get("_holidays_preloaded") != (year, month):
+        st.session_state["_holidays_preloaded"] = (year, month)
+        if not st.session_state["holidays_multiselect"]:
+            st.session_state["holidays_multiselect"] = list(holiday_labels)
+
+    selected_holidays = st.sidebar.multiselect(
+        t["holidays"], all_month_dates, key="holidays_multiselect", help=t["holidays_help"], placeholder=t["placeholder_select"],
+        format_func=lambda d: f"{d} · {holiday_labels[d]}" if d in holiday_labels else d
+    )
     
     # --- Conditional Rules ---
     st.sidebar.subheader(t["rule_header"])
@@ -826,43 +936,77 @@ def main():
         
     if has_schedule:
         with col_dl_fmt:
-            dl_format = st.selectbox("Format", ["Excel", "PDF", "ICS"], label_visibility="collapsed", key="dl_fmt_top")
+            dl_format = st.selectbox("Format", ["Excel", "PDF", "PDF (Calendar)", "PDF (Year)", "ICS", "ICS (Per person)", "ZIP (All)"], label_visibility="collapsed", key="dl_fmt_top")
         
-        # Prepare data for download
+        # Exports are built lazily when the download is clicked (on a separate thread)
+        # and memoized by schedule content, so reruns never rebuild them.
+        # The builders must not touch st.session_state, so capture everything here.
         schedule = st.session_state.generated_schedule
         gen_year = st.session_state.gen_year
         gen_month = st.session_state.gen_month
+        # Holidays of the generation, not the sidebar's current selection
+        holidays_sel = list(st.session_state.get("gen_holidays", []))
+        username = st.session_state.get('username')
+        day_names = [translate_day(d) for d in DAYS_OF_WEEK]
+        person_names = [p['name'] for p in st.session_state.personnel]
+        export_key = schedule_hash(schedule, gen_year, gen_month, lang, holidays_sel, person_names)
         
-        display_data = []
-        for d, team in sorted(schedule.items()):
-            names = ", ".join([p['name'] for p in team])
-            day_name = translate_day(DAYS_OF_WEEK[d.weekday()])
-            is_weekend = d.weekday() >= 5
-            display_data.append({
-                t["col_date"]: d.strftime("%d/%m/%Y"),
-                t["col_day"]: day_name,
-                t["col_team"]: names,
-                t["col_type"]: t["type_wknd"] if is_weekend else t["type_wkday"]
-            })
-        df_res = pd.DataFrame(display_data)
+        def build_df_res():
+            display_data = []
+            for d, team in sorted(schedule.items()):
+                names = ", ".join([p['name'] for p in team])
+                day_name = translate_day(DAYS_OF_WEEK[d.weekday()])
+                is_weekend = d.weekday() >= 5
+                display_data.append({
+                    t["col_date"]: d.strftime("%d/%m/%Y"),
+                    t["col_day"]: day_name,
+                    t["col_team"]: names,
+                    t["col_type"]: t["type_wknd"] if is_weekend else t["type_wkday"]
+                })
+            return pd.DataFrame(display_data)
+        
+        # Format -> (file name, mime, builder)
+        exports = {
+            "Excel": (f"nobet_list_{gen_year}_{gen_month}.xlsx",
+                      "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                      lambda: generate_excel([(None, schedule)], t, day_names, holidays_sel, person_names)),
+            "PDF": (f"nobet_list_{gen_year}_{gen_month}.pdf", "application/pdf",
+                    lambda: generate_pdf(build_df_res(), gen_year, gen_month, t)),
+            "PDF (Calendar)": (f"nobet_calendar_{gen_year}_{gen_month}.pdf", "application/pdf",
+                               lambda: generate_calendar_pdf([(gen_year, gen_month, schedule)], t, holidays_sel)),
+            "ICS": (f"nobet_list_{gen_year}_{gen_month}.ics", "text/calendar",
+                    lambda: generate_ics(schedule, t["title"].split(" ")[0] + " Duty", uid_scope=username)),
+            "ICS (Per person)": (f"nobet_calendars_{gen_year}_{gen_month}.zip", "application/zip",
+                                 lambda: generate_person_ics_zip(schedule, t["title"].split(" ")[0] + " Duty", uid_scope=username)),
+        }
         
-        data = None
-        file_name = ""
-        mime = ""
+        def memoized(fmt):
+            return lambda: cached_export((export_key, fmt), exports[fmt][2])
         
-        if dl_format == "Excel":
-            data = generate_excel(df_res)
-            file_name = f"nobet_list_{gen_year}_{gen_month}.xlsx"
-            mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        elif dl_format == "PDF":
-            data = generate_pdf(df_res, gen_year, gen_month, t)
-            file_name = f"nobet_list_{gen_year}_{gen_month}.pdf"
-            mime = "application/pdf"
-        elif dl_format == "ICS":
-            data = generate_ics(schedule, t["title"].split(" ")[0] + " Duty")
-            file_name = f"nobet_list_{gen_year}_{gen_month}.ics"
-            mime = "text/calendar"
+        if dl_format == "PDF (Year)":
+            # Every saved month of the year, with the current (maybe unsaved) month taking precedence.
+            # Loaded here, as the builder runs on another thread; the key covers the loaded months.
+            months = {
+                (int(m_doc["year"]), int(m_doc["month"])): storage.month_schedule(m_doc)
+                for m_doc in storage.load_months(get_firestore_db(), username, gen_year)
+            }
+            months[(gen_year, gen_month)] = schedule
+            month_list = [(y, m, s) for (y, m), s in sorted(months.items())]
+            year_key = schedule_hash({d: team for _, _, s in month_list for d, team in s.items()}, gen_year, lang, "year")
+            file_name, mime = f"nobet_calendar_{gen_year}.pdf", "application/pdf"
+            data = lambda: cached_export(year_key, lambda: generate_calendar_pdf(month_list, t))
+        elif dl_format == "ZIP (All)":
+            zip_builders = {exports[fmt][0]: memoized(fmt) for fmt in ["Excel", "PDF", "PDF (Calendar)", "ICS"]}
+            file_name, mime = f"nobet_list_{gen_year}_{gen_month}.zip", "application/zip"
+            data = lambda: cached_export((export_key, "ZIP"), lambda: build_zip(zip_builders))
+        else:
+            file_name, mime, _ = exports[dl_format]
+            data = memoized(dl_format)
             
+        if "PDF" in dl_format or "ZIP" in dl_format:
+            if find_font_pair() is None:
+                st.caption("⚠️ No Unicode font found (see packages.txt); Turkish characters may not render in the PDF.")
+
         with col_dl_btn:
             st.download_button(label="⬇️ Download", data=data, file_name=file_name, mime=mime, use_container_width=True, key="btn_download_top")
 
@@ -881,11 +1025,11 @@ def main():
         with c3:
             fixed_total = st.number_input(t["fixed_total"], min_value=0, value=0, help=t["fixed_total_help"])
         with c4:
-            max_duties = st.number_input(t["max_duties"], min_value=0, value=5)
+            max_duties = st.number_input(t["max_duties"], min_value=0, value=personnel_store.DEFAULTS["max_duties"])
         with c5:
             fixed_wknd = st.number_input(t["fixed_wknd"], min_value=0, value=0, help=t["fixed_wknd_help"])
         with c6:
-            max_weekends = st.number_input(t["max_wknd"], min_value=0, value=2)
+            max_weekends = st.number_input(t["max_wknd"], min_value=0, value=personnel_store.DEFAULTS["max_weekends"])
         with c7:
             mixed_ok = st.checkbox(t["mixed_ok"], value=True, help=t["mixed_ok_help"])
         
@@ -921,6 +1065,7 @@ def main():
                     curr += timedelta(days=1)
 
             st.session_state.personnel.append({
+                "id": storage.new_person_id(),
                 "name": name,
                 "gender": gender,
                 "role": role,
@@ -936,48 +1081,11 @@ def main():
                 "duty_count": 0, # Runtime tracker
                 "weekend_duty_count": 0 # Runtime tracker
             })
+            touch_personnel()
             st.success(t["added"].format(name))
 
     # Display current list
     if st.session_state.personnel:
-        df_personnel = pd.DataFrame(st.session_state.personnel)
-        
-        # Ensure columns exist
-        if "mixed_gender_allowed" not in df_personnel.columns:
-            df_personnel["mixed_gender_allowed"] = True
-        if "role" not in df_personnel.columns:
-            df_personnel["role"] = "Junior"
-        if "fixed_duties_total" not in df_personnel.columns:
-            # Migration: Use old fixed_duties if available, else 0
-            df_personnel["fixed_duties_total"] = df_personnel.get("fixed_duties", 0)
-            
-        if "fixed_duties_weekend" not in df_personnel.columns:
-            df_personnel["fixed_duties_weekend"] = 0
-            
-        if "duty_count" not in df_personnel.columns:
-            df_personnel["duty_count"] = 0
-        if "weekend_duty_count" not in df_personnel.columns:
-            df_personnel["weekend_duty_count"] = 0
-        if "busy_days" not in df_personnel.columns:
-            df_personnel["busy_days"] = ""
-        if "off_dates" not in df_personnel.columns:
-            df_personnel["off_dates"] = ""
-        if "leave_dates" not in df_personnel.columns:
-            df_personnel["leave_dates"] = ""
-        if "fixed_dates" not in df_personnel.columns:
-            df_personnel["fixed_dates"] = ""
-            
-        # Helper to convert comma-separated strings to lists for the editor
-        def str_to_list(val):
-            if isinstance(val, list): return val
-            if not val or val == "": return []
-            return [x.strip() for x in str(val).split(",") if x.strip()]
-
-        # Create a copy for the editor with list types
-        df_editor = df_personnel.copy()
-        for col in ["busy_days", "off_dates", "leave_dates", "fixed_dates"]:
-            df_editor[col] = df_editor[col].apply(str_to_list)
-
         # Translate roles for display
         role_map_display = {
             "Junior": t["role_junior"],
@@ -986,19 +1094,35 @@ def main():
         # Reverse map for saving
         role_map_save = {v: k for k, v in role_map_display.items()}
 
-        df_editor["role"] = df_editor["role"].map(role_map_display).fillna(df_editor["role"])
+        # The editor frame is rebuilt only when the records changed outside the editor
+        # (or the language changed); a new key starts the editor's change set afresh.
+        editor_key = f"personnel_editor_{st.session_state.get('personnel_rev', 0)}_{lang}"
+        editor = st.session_state.get("_personnel_editor")
+        if editor is None or editor["key"] != editor_key:
+            editor = st.session_state["_personnel_editor"] = {
+                "key": editor_key,
+                "frame": personnel_store.build_frame(st.session_state.personnel, role_map_display),
+                "applied": personnel_store.new_sync_state()
+            }
+
+        # Apply only what changed in the editor since the previous rerun
+        if editor_key in st.session_state:
+            personnel_store.apply_editor_changes(
+                st.session_state.personnel, editor["frame"], st.session_state[editor_key], editor["applied"], role_map_save
+            )
 
         # Editable Dataframe
-        edited_df = st.data_editor(
-            df_editor[["name", "gender", "role", "fixed_duties_total", "max_duties", "fixed_duties_weekend", "max_weekends", "mixed_gender_allowed", "busy_days", "off_dates", "leave_dates", "fixed_dates", "duty_count", "weekend_duty_count"]],
+        st.data_editor(
+            editor["frame"],
             column_config={
+                "id": None, # Hidden, keeps records stable across edits
                 "name": t["name"],
                 "gender": st.column_config.SelectboxColumn(t["gender"], options=["M", "F"], required=True),
                 "role": st.column_config.SelectboxColumn(t["role"], options=[t["role_junior"], t["role_senior"]], required=True),
                 "fixed_duties_total": st.column_config.NumberColumn(t["fixed_total"], min_value=0, step=1, help=t["fixed_total_help"]),
                 "fixed_duties_weekend": st.column_config.NumberColumn(t["fixed_wknd"], min_value=0, step=1, help=t["fixed_wknd_help"]),
-                "max_duties": st.column_config.NumberColumn(t["max_duties"], min_value=0, step=1),
-                "max_weekends": st.column_config.NumberColumn(t["max_wknd"], min_value=0, step=1),
+                "max_duties": st.column_config.NumberColumn(t["max_duties"], min_value=0, step=1, default=personnel_store.DEFAULTS["max_duties"]),
+                "max_weekends": st.column_config.NumberColumn(t["max_wknd"], min_value=0, step=1, default=personnel_store.DEFAULTS["max_weekends"]),
                 "mixed_gender_allowed": st.column_config.CheckboxColumn(t["mixed_ok"]),
                 "busy_days": st.column_config.ListColumn(t["busy_days"], help=t["col_busy_help"]),
                 "off_dates": st.column_config.ListColumn(t["off_dates"], help=t["col_off_help"]),
@@ -1009,25 +1133,8 @@ def main():
             },
             use_container_width=True,
             num_rows="dynamic",
-            key="personnel_editor"
+            key=editor_key
         )
-        
-        # Update session state from editor
-        # Convert lists back to comma-separated strings for storage/scheduler compatibility
-        def list_to_str(val):
-            if isinstance(val, list):
-                return ", ".join([str(x) for x in val])
-            return val
-
-        df_saved = edited_df.copy()
-        
-        # Translate roles back to internal values
-        df_saved["role"] = df_saved["role"].map(role_map_save).fillna(df_saved["role"])
-        
-        for col in ["busy_days", "off_dates", "leave_dates", "fixed_dates"]:
-            df_saved[col] = df_saved[col].apply(list_to_str)
-            
-        st.session_state.personnel = df_saved.to_dict('records')
 
     else:
         st.info(t["info_start"])
@@ -1069,6 +1176,7 @@ def main():
                                     
                                     p['leave_dates'] = ", ".join(current_leaves)
                                     st.toast(t["added"].format(selected_person_leave), icon="✅")
+                                    touch_personnel()
                                     st.rerun()
             
             with tab_busy:
@@ -1102,6 +1210,7 @@ def main():
                             if p['name'] == selected_person_busy:
                                 p['busy_days'] = ", ".join(new_busy_days)
                                 st.toast(t["busy_updated"].format(selected_person_busy), icon="✅")
+                                touch_personnel()
                                 st.rerun()
 
             with tab_off:
@@ -1140,6 +1249,7 @@ def main():
                                 all_dates = other_dates + new_off_dates
                                 p['off_dates'] = ", ".join(all_dates)
                                 st.toast(t["off_updated"].format(selected_person_off), icon="✅")
+                                touch_personnel()
                                 st.rerun()
 
             with tab_fixed:
@@ -1176,6 +1286,7 @@ def main():
                                 all_dates = other_dates + new_fixed_dates
                                 p['fixed_dates'] = ", ".join(all_dates)
                                 st.toast(t["fixed_updated"].format(selected_person_fixed), icon="✅")
+                                touch_personnel()
                                 st.rerun()
 
     # --- Save / Load Section ---
@@ -1193,6 +1304,7 @@ def main():
         def load_cloud_data():
             db_data = load_db(st.session_state.get('username'))
             st.session_state.personnel = db_data.get("personnel", [])
+            touch_personnel()
             
             # Restore other settings
             if "conditional_rules" in db_data:
@@ -1202,7 +1314,7 @@ def main():
             if "holidays_multiselect" in db_data:
                 st.session_state.holidays_multiselect = db_data["holidays_multiselect"]
             
-            for key in ["cfg_year", "cfg_month", "cfg_ppl", "cfg_min_seniors", "cfg_gender", "cfg_consecutive", "cfg_two_rest", "cfg_max_weekly", "cfg_language"]:
+            for key in CONFIG_KEYS:
                 if key in db_data:
                     st.session_state[key] = db_data[key]
             
@@ -1216,6 +1328,9 @@ def main():
                     st.session_state.generated_schedule = sched_loaded
                     st.session_state.gen_year = db_data.get("gen_year")
                     st.session_state.gen_month = db_data.get("gen_month")
+                    st.session_state.gen_holidays = db_data.get("gen_holidays", [])
+                    st.session_state.gen_roster = db_data.get("gen_roster", [])
+                    st.session_state.gen_violations = []
                     st.session_state.schedule_success = True
                 except Exception as e:
                     print(f"Error loading schedule: {e}")
@@ -1225,10 +1340,11 @@ def main():
         st.button(t["load_db_btn"], use_container_width=True, on_click=load_cloud_data)
 
     with col_act3:
-        json_data = json.dumps(st.session_state.personnel, ensure_ascii=False, indent=4)
+        # Serialized only when the download is requested
+        personnel_export = st.session_state.personnel
         st.download_button(
             label=t["download_db"],
-            data=json_data,
+            data=lambda: json.dumps(personnel_export, ensure_ascii=False, indent=4),
             file_name="personnel_db.json",
             mime="application/json",
             use_container_width=True
@@ -1244,12 +1360,14 @@ def main():
                 p['leave_dates'] = ""
                 p['fixed_dates'] = ""
                 # We don't reset fixed_duties targets or roles, just dates
+            touch_personnel()
             st.toast(t["reset_success"], icon="🔄")
             st.rerun()
 
     with col_act5:
         if st.button(t["clear_all"], use_container_width=True):
             st.session_state.personnel = []
+            touch_personnel()
             st.session_state.generated_schedule = {}
             st.session_state.schedule_success = False
             st.rerun()
@@ -1277,6 +1395,8 @@ def main():
 
     # --- Generation Section ---
     if btn_gen_clicked:
+        st.session_state.pop("explain_input", None)
+        st.session_state.pop("explanation", None)
         if not st.session_state.personnel:
             st.error(t["err_no_pers"])
         else:
@@ -1298,7 +1418,13 @@ def main():
                 'conditional_rules': scheduler_rules,
                 'max_weekly_duties': max_weekly,
                 'require_two_rest_days': require_two_rest,
-                'holidays': selected_holidays,
+                'holidays': holiday_calendar.to_date_set(selected_holidays),
+                'objective_weights': objective_weights,
+                'soft_rules': soft_rules,
+                'rule_penalties': rule_penalties,
+                'candidate_count': candidate_count,
+                'record_trace': record_trace,
+                'day_order': 'constrained' if hardest_first else 'calendar',
                 'forbidden_pairs': st.session_state.forbidden_pairs,
                 'history': {
                     'prev_1': history_prev_1, # Names of people who worked yesterday (relative to 1st of month)
@@ -1306,30 +1432,70 @@ def main():
                 }
             }
 
+            # Per-person deficits against the cumulative history of saved months
+            if use_history:
+                history_counts = load_history(st.session_state.get('username'))
+                people = [(p['id'], p['name']) for p in st.session_state.personnel if p.get('id')]
+                config['history_deficits'] = history.compute_deficits(history_counts, people)
+
             # Initialize Scheduler
             scheduler = DutyScheduler(year, month, st.session_state.personnel, config)
             
             with st.spinner(t["spinner"]):
-                success, schedule, error_msg = scheduler.generate()
+                result = scheduler.generate()
+            st.session_state.gen_trace = result.trace.to_bytes() if result.trace else None
 
-            if success:
-                st.session_state.generated_schedule = schedule
+            if result.success:
+                # The scheduler works on copies; take its counts into the roster for the stats
+                for p in st.session_state.personnel:
+                    p.update(result.counts.get(p['name'], dict.fromkeys(COUNT_FIELDS, 0)))
+                st.session_state.generated_schedule = result.schedule
                 st.session_state.gen_year = year
                 st.session_state.gen_month = month
+                st.session_state.gen_holidays = list(selected_holidays)
+                st.session_state.gen_roster = [p['id'] for p in st.session_state.personnel if p.get('id')]
                 st.session_state.schedule_success = True
+                st.session_state.gen_violations = result.violations
+                st.session_state.gen_penalty = result.penalty
+                # Runtime counters changed
+                touch_personnel()
                 st.toast(t["success"], icon="🎉")
                 st.rerun()
             else:
                 st.session_state.schedule_success = False
-                if error_msg:
-                    st.error(f"{t['err_fail']} \n\nDetails: {error_msg}")
+                if result.error:
+                    st.error(f"{t['err_fail']} \n\nDetails: {result.error}")
                 else:
                     st.error(t["err_fail"])
 
+                # Inputs of the conflict search, run on demand (it can take seconds on large rosters)
+                st.session_state.explain_input = (year, month, copy.deepcopy(st.session_state.personnel), config)
+
+    if st.session_state.get("explain_input") and not st.session_state.get("schedule_success"):
+        if st.button(t["btn_explain"], key="btn_explain"):
+            import infeasibility
+            with st.spinner(t["spinner_explain"]):
+                st.session_state.explanation = infeasibility.explain(*st.session_state.explain_input)
+        if "explanation" in st.session_state:
+            render_explanation(st.session_state.explanation, *st.session_state.explain_input, t, translate_day)
+
+    if st.session_state.get("gen_trace"):
+        st.download_button(t["dl_trace"], data=st.session_state.gen_trace, file_name=f"trace_{year}_{month:02d}.nbt",
+                           mime="application/octet-stream", key="btn_download_trace")
+
     if st.session_state.get("schedule_success") and st.session_state.get("generated_schedule"):
         st.divider()
         st.success(t["success"])
         schedule = st.session_state.generated_schedule
+
+        # Soft rules broken by this schedule (only known right after generation)
+        gen_violations = st.session_state.get("gen_violations") or []
+        if gen_violations:
+            with st.expander(t["soft_violations"].format(len(gen_violations), st.session_state.get("gen_penalty", 0))):
+                st.dataframe(pd.DataFrame([
+                    {t["col_date"]: d.strftime("%d/%m/%Y"), t["name"]: who or "-", t["col_rule"]: t[f"rule_{rule}"]}
+                    for d, who, rule in gen_violations
+                ]), use_container_width=True, hide_index=True)
         gen_year = st.session_state.gen_year
         gen_month = st.session_state.gen_month
         
@@ -1357,64 +1523,83 @@ def main():
             st.dataframe(df_res, use_container_width=True, hide_index=True)
             
         with tab_cal:
-            cal_html = get_calendar_html(gen_year, gen_month, schedule, t)
+            cal_mode = st.radio(t["cal_view"], [t["month"], t["year"]], horizontal=True, label_visibility="collapsed", key="cal_mode")
+            if cal_mode == t["month"]:
+                cal_html = get_calendar_html(gen_year, gen_month, schedule, t, st.session_state.get("gen_holidays", []), t["filter_all"])
+            else:
+                # Saved months of the year, with the current (maybe unsaved) month taking precedence
+                year_months = {
+                    int(m_doc["month"]): storage.month_schedule(m_doc)
+                    for m_doc in storage.load_months(get_firestore_db(), st.session_state.get('username'), gen_year)
+                }
+                year_months[gen_month] = schedule
+                # Official holidays of the whole year plus the ones this month was generated with
+                year_holidays = {holiday_calendar.format_date(d) for d in holiday_calendar.holiday_dates(holiday_calendar.DEFAULT_COUNTRY, [gen_year], half_days=True)}
+                year_holidays.update(st.session_state.get("gen_holidays", []))
+                cal_html = get_year_html(gen_year, year_months, t, year_holidays, t["filter_all"])
             st.markdown(cal_html, unsafe_allow_html=True)
         
         # Show Stats
         with tab_stats:
-            stats = []
-            duty_counts = []
-            for p in st.session_state.personnel:
-                stats.append({
-                    t["name"]: p['name'],
-                    t["col_assigned"]: p['duty_count'],
-                    t["type_wknd"]: p.get('weekend_duty_count', 0),
-                    t["short_days"][5]: p.get('saturday_duty_count', 0),
-                    t["short_days"][6]: p.get('sunday_duty_count', 0)
-                })
-                duty_counts.append(p['duty_count'])
+            from analytics import compute_analytics
+
+            # One incidence matrix (people x days) gives every table below
+            # Holidays of the generation, not the sidebar's current selection
+            an = compute_analytics(schedule, [p['name'] for p in st.session_state.personnel], st.session_state.get("gen_holidays", []))
+            names = an["names"]
             
-            # Fairness Metric
-            if len(duty_counts) > 1:
-                stdev = statistics.stdev(duty_counts)
-                st.metric(label=t["fairness_score"], value=f"{stdev:.2f}", help=t["fairness_help"])
+            # Fairness Metrics
+            if len(names) > 1:
+                c_fair1, c_fair2 = st.columns(2)
+                with c_fair1:
+                    st.metric(label=t["fairness_score"], value=f"{an['fairness']['total_std']:.2f}", help=t["fairness_help"])
+                with c_fair2:
+                    st.metric(label=t["fairness_wknd"], value=f"{an['fairness']['weekend_std']:.2f}", help=t["fairness_help"])
             
-            st.dataframe(pd.DataFrame(stats), use_container_width=True)
+            df_stats = pd.DataFrame({
+                t["name"]: names,
+                t["col_assigned"]: an["totals"],
+                t["type_wknd"]: an["weekend"],
+                t["short_days"][5]: an["saturday"],
+                t["short_days"][6]: an["sunday"]
+            })
+            st.dataframe(df_stats, use_container_width=True)
             
-            if stats:
+            if names:
                 # Chart
                 st.caption("Duty Distribution / Nöbet Dağılımı")
-                st.bar_chart(pd.DataFrame(stats).set_index(t["name"])[[t["col_assigned"], t["type_wknd"], t["short_days"][5], t["short_days"][6]]])
+                st.bar_chart(df_stats.set_index(t["name"])[[t["col_assigned"], t["type_wknd"], t["short_days"][5], t["short_days"][6]]])
                 
                 st.divider()
                 
                 # 1. Day Distribution Heatmap
                 st.subheader(t["day_distribution"])
-                day_counts = {p['name']: {day: 0 for day in t["short_days"]} for p in st.session_state.personnel}
-                for d, team in schedule.items():
-                    day_idx = d.weekday()
-                    day_name = t["short_days"][day_idx]
-                    for p in team:
-                        day_counts[p['name']][day_name] += 1
-                
-                df_days = pd.DataFrame(day_counts).T
+                df_days = pd.DataFrame(an["weekday"], index=names, columns=t["short_days"])
                 st.dataframe(df_days.style.background_gradient(cmap="Blues", axis=1), use_container_width=True)
 
                 # 2. Co-occurrence Matrix
                 st.subheader(t["co_occurrence"])
-                names = [p['name'] for p in st.session_state.personnel]
-                if len(names) > 0:
-                    co_matrix = pd.DataFrame(0, index=names, columns=names)
-                    for team in schedule.values():
-                        t_names = [p['name'] for p in team]
-                        for i in range(len(t_names)):
-                            for j in range(i + 1, len(t_names)):
-                                p1, p2 = t_names[i], t_names[j]
-                                co_matrix.loc[p1, p2] += 1
-                                co_matrix.loc[p2, p1] += 1
-                    
-                    # Display with gradient
-                    st.dataframe(co_matrix.style.background_gradient(cmap="Reds"), use_container_width=True)
+                co_matrix = pd.DataFrame(an["co_occurrence"], index=names, columns=names)
+                
+                # Display with gradient
+                st.dataframe(co_matrix.style.background_gradient(cmap="Reds"), use_container_width=True)
+
+            # 3. Cumulative counts over saved months (kept incrementally on save)
+            history_counts = load_history(st.session_state.get('username'))
+            if any(h.get("months", 0) > 0 for h in history_counts.values()):
+                st.subheader(t["cumulative_history"])
+                df_hist = pd.DataFrame([
+                    {
+                        t["name"]: h.get("name") or pid,
+                        t["col_months"]: h.get("months", 0),
+                        t["col_assigned"]: h.get("total", 0),
+                        t["type_wknd"]: h.get("weekend", 0),
+                        t["short_days"][5]: h.get("saturday", 0),
+                        t["short_days"][6]: h.get("sunday", 0)
+                    }
+                    for pid, h in history_counts.items() if h.get("months", 0) > 0
+                ])
+                st.dataframe(df_hist, use_container_width=True, hide_index=True)
 
 if __name__ == '__main__':
     if st.runtime.exists():
@@ -0,0 +1,210 @@
+# Joint scheduling of several rosters (departments) over one personnel pool.
+#
+# Every roster has its own team rules: people_per_day, gender_mode, min_seniors,
+# forbidden_pairs and the people who may serve on it ("members", everyone by
+# default). The person rules (limits, rest days, weekly limit, conditional rules,
+# personal dates, soft rules) come from the shared config and count the duties of
+# all rosters together, and nobody is on two rosters on the same date.
+#
+# The search is the one of DutyScheduler: dates are filled in day_order(), and
+# for each date the rosters are filled one after another, the roster with the
+# fewest members per place first. Each roster draws from its own CandidateQueue
+# over its members; the queues share the person records, so a duty on one
+# roster lowers the person's priority on all of them.
+#
+#     rosters = [
+#         {'name': 'Emergency', 'people_per_day': 2, 'gender_mode': 'Mixed', 'min_seniors': 1},
+#         {'name': 'Ward', 'people_per_day': 1, 'members': ['Ali', 'Ayse', 'Mehmet']},
+#     ]
+#     result = MultiRosterScheduler(2026, 3, personnel, dict(config, rosters=rosters)).generate()
+#     result.rosters['Ward']   # {date: [person dicts]}
+import random
+from candidate_queue import CandidateQueue
+from scheduler import DutyScheduler, ScheduleResult, COUNT_FIELDS
+import symmetry
+
+# Team rules a roster may set; missing ones are taken from the shared config
+ROSTER_RULES = ("people_per_day", "gender_mode", "min_seniors", "forbidden_pairs")
+
+
+def roster_rules(roster, config):
+    """Team settings of one roster, completed from the shared config."""
+    return {key: roster.get(key, config.get(key)) for key in ROSTER_RULES}
+
+
+def unrostered_fixed(year, month, personnel_list, rosters):
+    """Names of people with a fixed date in the month who are a member of no roster."""
+    names = [p['name'] for p in personnel_list]
+    rostered = set()
+    for roster in rosters:
+        members = roster.get('members')
+        rostered |= set(names if members is None else members)
+    suffix = f"/{month:02d}/{year}"
+    return [
+        p['name'] for p in personnel_list
+        if p['name'] not in rostered and any(d.strip().endswith(suffix) for d in (p.get('fixed_dates') or '').split(','))
+    ]
+
+
+class MultiRosterScheduler(DutyScheduler):
+    def __init__(self, year, month, personnel_list, config):
+        """
+        config['rosters']: list of {'name', 'members' (names, default all) and any of ROSTER_RULES}.
+        Fixed dates go to the first roster (in the given order) the person is a member of
+        that still has a free place; a fixed date of someone on no roster is a ValueError.
+        Decision traces are not recorded in this mode.
+        """
+        rosters = config['rosters']
+        unplaced = unrostered_fixed(year, month, personnel_list, rosters)
+        if unplaced:
+            raise ValueError(f"fixed dates for people on no roster: {', '.join(unplaced)}")
+        names = [p['name'] for p in personnel_list]
+        self.rosters = []
+        for roster in rosters:
+            rules = roster_rules(roster, config)
+            rules['people_per_day'] = int(rules['people_per_day'] or 1)
+            rules['min_seniors'] = int(rules['min_seniors'] or 0)
+            rules['gender_mode'] = rules['gender_mode'] or 'Any'
+            rules['forbidden_pairs'] = rules['forbidden_pairs'] or []
+            members = roster.get('members')
+            members = set(names) if members is None else set(members)
+            self.rosters.append((roster['name'], rules, [n for n in names if n in members]))
+
+        # The whole pool as one roster for day_order() and the symmetry classes:
+        # all places of a date, all seniors, all pairs
+        combined = dict(
+            config,
+            people_per_day=sum(rules['people_per_day'] for _, rules, _ in self.rosters),
+            min_seniors=sum(rules['min_seniors'] for _, rules, _ in self.rosters),
+            gender_mode='Mixed' if any(rules['gender_mode'] == 'Mixed' for _, rules, _ in self.rosters) else 'Any',
+            forbidden_pairs=[pair for _, rules, _ in self.rosters for pair in rules['forbidden_pairs']],
+        )
+        super().__init__(year, month, personnel_list, combined)
+
+        # Interchangeable people must also serve on the same rosters
+        membership = {n: tuple(i for i, (_, _, members) in enumerate(self.rosters) if n in members) for n in names}
+        split = {}
+        for i, class_names in enumerate(self.classes):
+            for n in class_names:
+                split.setdefault((i, membership[n]), []).append(n)
+        self.classes = [class_names for class_names in split.values() if len(class_names) > 1]
+        self.class_of = {n: i for i, class_names in enumerate(self.classes) for n in class_names}
+
+        # Fewest members per place first (stable for equal rosters)
+        self.fill_sequence = sorted(range(len(self.rosters)), key=lambda i: len(self.rosters[i][2]) / self.rosters[i][1]['people_per_day'])
+        self.roster_schedules = {}
+
+    # Even out duties inside symmetry classes after the search (duties_allowed must model the rules)
+    rebalance = True
+
+    def begin_attempt(self):
+        """Resets per-attempt state of subclasses."""
+
+    def fill_roster(self, i, current_date, queue, day_teams, attempt_violations):
+        """Fills roster i for one date; people on another roster that date are taken."""
+        taken = [p for j, team in enumerate(day_teams) if j != i for p in team]
+        self.fill_team(current_date, queue, day_teams[i], self.rosters[i][1], taken, attempt_violations=attempt_violations)
+
+    def generate(self):
+        """Searches for joint schedules; ScheduleResult.rosters holds one schedule per roster."""
+        valid_solutions = []
+        solution_rosters = []
+        solution_violations = []
+        target_solutions = self.config.get('candidate_count', 5)
+        max_attempts = max(200, 2 * target_solutions)
+        last_error = ""
+        deficits = self.config.get('history_deficits', {})
+
+        seen_signatures = set()
+        fill_order = self.day_order()
+        fixed_on = self.fixed_assignments()
+        by_name = {p['name']: p for p in self.personnel}
+        records = {name: {k: v for k, v in p.items() if k not in COUNT_FIELDS} for name, p in by_name.items()}
+        members = [[by_name[n] for n in roster_members] for _, _, roster_members in self.rosters]
+        member_names = [set(roster_members) for _, _, roster_members in self.rosters]
+
+        for attempt in range(max_attempts):
+            rng = random.Random(self.rng.getrandbits(32))
+            self.schedule = {}
+            teams = {}  # date -> [team of each roster]
+            for p in self.personnel:
+                p.update(dict.fromkeys(COUNT_FIELDS, 0))
+            self.begin_attempt()
+            queues = [
+                CandidateQueue(people, lambda p, weekend: self.priority(p, weekend, deficits), rng, self.class_of)
+                for people in members
+            ]
+
+            success = True
+            attempt_violations = []
+
+            for current_date in fill_order:
+                current_date_str = current_date.strftime("%d/%m/%Y")
+                day_teams = [[] for _ in self.rosters]
+
+                # 1. Fixed duties, on the first of the person's rosters with room
+                for p in fixed_on.get(current_date_str, []):
+                    own = [i for i in range(len(self.rosters)) if p['name'] in member_names[i]]
+                    free = [i for i in own if len(day_teams[i]) < self.rosters[i][1]['people_per_day']]
+                    # Everyone with a fixed date is on a roster (checked in __init__)
+                    day_teams[(free or own)[0]].append(p)
+
+                # 2. Rosters one by one
+                for i in self.fill_sequence:
+                    name, rules, _ = self.rosters[i]
+                    self.fill_roster(i, current_date, queues[i], day_teams, attempt_violations)
+                    if len(day_teams[i]) < rules['people_per_day']:
+                        success = False
+                        last_error = (f"Could not find enough eligible personnel for {name} on {current_date_str}. "
+                                      f"Found {len(day_teams[i])}/{rules['people_per_day']}.")
+                        break
+                if not success:
+                    break
+
+                # Commit day: the rest rules see everyone on duty, whatever the roster
+                day_team = [p for team in day_teams for p in team]
+                self.commit_day(current_date, day_team)
+                teams[current_date] = day_teams
+                for i, queue in enumerate(queues):
+                    queue.commit([p for p in day_team if p['name'] in member_names[i]])
+
+            if success:
+                solution = self.snapshot(self.schedule)
+                if self.classes:
+                    signature = symmetry.class_signature(
+                        {(d, i): team for d, day_teams in teams.items() for i, team in enumerate(day_teams)}, self.class_of
+                    )
+                    if signature in seen_signatures:
+                        continue
+                    seen_signatures.add(signature)
+                if self.classes and self.rebalance:
+                    # Class members serve on the same rosters, so a swap keeps every roster valid
+                    symmetry.balance_classes(
+                        solution, self.classes, records, lambda name, dates: self.duties_allowed(by_name[name], dates),
+                        self.is_weekend, frozen={d for d, _, _ in attempt_violations}
+                    )
+                valid_solutions.append(solution)
+                solution_rosters.append(self.split_rosters(solution, teams))
+                solution_violations.append(attempt_violations)
+
+                if len(valid_solutions) >= target_solutions:
+                    break
+
+        if valid_solutions:
+            # Fairness over the pool: the duties of all rosters count together
+            best = self.best_solution(valid_solutions, solution_violations, deficits)
+            self.roster_schedules = solution_rosters[best]
+            return ScheduleResult(True, self.schedule, None, self.count_duties(self.schedule), self.violations,
+                                  self.total_penalty, rosters=self.roster_schedules)
+
+        return ScheduleResult(False, error=last_error)
+
+    def split_rosters(self, solution, teams):
+        """{roster name: {date: team}} from the joint schedule (day teams are concatenated in roster order)."""
+        rosters = {name: {} for name, _, _ in self.rosters}
+        for d, day_team in solution.items():
+            pos = 0
+            for (name, _, _), team in zip(self.rosters, teams[d]):
+                rosters[name][d] = day_team[pos:pos + len(team)]
+                pos += len(team)
+        return rosters
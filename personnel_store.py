@@ -0,0 +1,160 @@
+import storage
+
+# Backing store for the personnel data editor.
+#
+# The records in st.session_state.personnel stay the source of truth (scheduler,
+# storage). The editor is given a typed, column-oriented DataFrame that is only
+# rebuilt when the records change outside the editor (revision bump) or the
+# display language changes. On a rerun the editor reports its change set
+# relative to that frame (edited/added/deleted rows); only the cells that
+# changed since the previous rerun are converted and written to the records.
+
+EDITOR_COLUMNS = [
+    "id", "name", "gender", "role", "fixed_duties_total", "max_duties", "fixed_duties_weekend", "max_weekends",
+    "mixed_gender_allowed", "busy_days", "off_dates", "leave_dates", "fixed_dates", "duty_count", "weekend_duty_count"
+]
+LIST_COLUMNS = ["busy_days", "off_dates", "leave_dates", "fixed_dates"]
+INT_COLUMNS = ["fixed_duties_total", "max_duties", "fixed_duties_weekend", "max_weekends", "duty_count", "weekend_duty_count"]
+
+# Values of a new record: rows added in the editor get the add-person form's defaults
+DEFAULTS = {
+    "name": "", "gender": "M", "role": "Junior",
+    "fixed_duties_total": 0, "max_duties": 5, "fixed_duties_weekend": 0, "max_weekends": 2,
+    "mixed_gender_allowed": True,
+    "busy_days": "", "off_dates": "", "leave_dates": "", "fixed_dates": "",
+    "duty_count": 0, "weekend_duty_count": 0,
+}
+
+
+def split_list(val):
+    """Comma-separated string -> list (editor ListColumn)."""
+    if isinstance(val, list):
+        return val
+    if not val:
+        return []
+    return [x.strip() for x in str(val).split(",") if x.strip()]
+
+
+def join_list(val):
+    """List -> comma-separated string (records / scheduler)."""
+    if isinstance(val, list):
+        return ", ".join(str(x) for x in val)
+    return val or ""
+
+
+def normalize_records(personnel):
+    """Ids and every editor column on each record (in place)."""
+    storage.ensure_ids(personnel)
+    for p in personnel:
+        if "fixed_duties_total" not in p:
+            # Migration: old records only have fixed_duties
+            p["fixed_duties_total"] = p.get("fixed_duties", 0)
+        for col, default in DEFAULTS.items():
+            if col not in p:
+                p[col] = default
+    return personnel
+
+
+def build_frame(personnel, role_labels):
+    """
+    Typed editor frame, built column by column.
+    role_labels: internal role -> display label.
+    """
+    import pandas as pd
+
+    normalize_records(personnel)
+    columns = {}
+    for col in EDITOR_COLUMNS:
+        values = [p[col] for p in personnel]
+        if col in LIST_COLUMNS:
+            columns[col] = pd.Series([split_list(v) for v in values], dtype=object)
+        elif col in INT_COLUMNS:
+            columns[col] = pd.Series([int(v) if v == v and v is not None else 0 for v in values], dtype="int64")
+        elif col == "mixed_gender_allowed":
+            columns[col] = pd.Series([bool(v) if v is not None else True for v in values], dtype=bool)
+        elif col == "role":
+            columns[col] = pd.Series([role_labels.get(v, v) for v in values], dtype=object)
+        else:
+            columns[col] = pd.Series(values, dtype=object)
+    return pd.DataFrame(columns, columns=EDITOR_COLUMNS)
+
+
+def _to_record(col, val, role_values):
+    # One editor cell -> record value
+    if col in LIST_COLUMNS:
+        return join_list(val)
+    if col in INT_COLUMNS:
+        return int(val) if val is not None else 0
+    if col == "role":
+        return role_values.get(val, val)
+    if col == "mixed_gender_allowed":
+        return bool(val) if val is not None else True
+    return val if val is not None else DEFAULTS.get(col)
+
+
+def new_sync_state():
+    """What has been applied from the current editor instance."""
+    return {"edited": {}, "added": [], "added_ids": [], "deleted": set()}
+
+
+def apply_editor_changes(personnel, frame, changes, applied, role_values):
+    """
+    Applies an editor change set to the records in place. Only cells that differ
+    from what was applied on the previous rerun are written.
+
+    frame: the frame the editor was given (row position -> base values, id column).
+    changes: editor widget state {"edited_rows", "added_rows", "deleted_rows"}.
+    applied: sync state from new_sync_state(), updated in place.
+    role_values: display label -> internal role.
+    Returns True if any record changed.
+    """
+    edited = {int(k): v for k, v in changes.get("edited_rows", {}).items()}
+    added = changes.get("added_rows", [])
+    deleted = set(changes.get("deleted_rows", []))
+    if edited == applied["edited"] and added == applied["added"] and deleted == applied["deleted"]:
+        return False
+
+    by_id = {p["id"]: p for p in personnel}
+    ids = frame["id"]
+
+    # 1. Edited cells of existing rows (cells dropped from the change set go back to the frame value)
+    for idx in set(edited) | set(applied["edited"]):
+        record = by_id.get(ids.iat[idx]) if idx < len(ids) else None
+        if record is None:
+            continue
+        cells = edited.get(idx, {})
+        before = applied["edited"].get(idx, {})
+        for col, val in cells.items():
+            if col in DEFAULTS and (col not in before or before[col] != val):
+                record[col] = _to_record(col, val, role_values)
+        for col in before:
+            if col not in cells and col in DEFAULTS:
+                record[col] = _to_record(col, frame.at[idx, col], role_values)
+
+    # 2. Added rows (positions can shift when an added row is removed again)
+    for i, row in enumerate(added):
+        if i < len(applied["added_ids"]):
+            if i < len(applied["added"]) and applied["added"][i] == row:
+                continue
+            record = by_id.get(applied["added_ids"][i])
+        else:
+            record = dict(DEFAULTS, id=storage.new_person_id())
+            personnel.append(record)
+            applied["added_ids"].append(record["id"])
+        if record is not None:
+            record.update(DEFAULTS)
+            for col, val in row.items():
+                if col in DEFAULTS:
+                    record[col] = _to_record(col, val, role_values)
+    removed = set(applied["added_ids"][len(added):])
+    del applied["added_ids"][len(added):]
+
+    # 3. Deleted rows of the frame
+    removed.update(ids.iat[idx] for idx in deleted - applied["deleted"] if idx < len(ids))
+    if removed:
+        personnel[:] = [p for p in personnel if p["id"] not in removed]
+
+    applied["edited"] = {idx: dict(cells) for idx, cells in edited.items()}
+    applied["added"] = [dict(row) for row in added]
+    applied["deleted"] = deleted
+    return True
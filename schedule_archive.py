@@ -0,0 +1,213 @@
+"""
+Columnar archive of accepted schedules.
+
+Every saved month is also written as an Arrow IPC file with one row per duty
+(date, person id, person, role, weekend and holiday flags), partitioned by
+user and month:
+
+    schedule_archive/user=<name>/month=2026-03/part-0.arrow
+
+Re-saving a month replaces its file. Files are uncompressed so readers can
+memory-map them; queries go through pyarrow.dataset, which prunes partitions by
+user and month and aggregates in Arrow without building Python objects per row.
+pyarrow is optional (Streamlit installs it): without it nothing is archived.
+NOBET_ARCHIVE_DIR sets the archive directory; an empty value turns archiving off.
+Only local saves are archived (storage.save_state skips it with Firestore), and a
+failed write is logged without failing the save.
+
+    python schedule_archive.py report --user alice --year 2026
+    python schedule_archive.py backfill --user alice     # archive stored months (local storage)
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import threading
+from datetime import date
+from urllib.parse import quote
+
+from holiday_calendar import to_date_set
+
+ARCHIVE_DIR = os.environ.get("NOBET_ARCHIVE_DIR", "schedule_archive")
+FILE_NAME = "part-0.arrow"
+
+
+def available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("date", pa.date32()),
+        ("person_id", pa.string()),
+        ("person", pa.string()),
+        ("role", pa.string()),
+        ("weekend", pa.bool_()),
+        ("holiday", pa.bool_()),
+    ])
+
+
+def partition_path(username, year, month, root=None):
+    return os.path.join(root or ARCHIVE_DIR, f"user={quote(str(username), safe='')}",
+                        f"month={int(year):04d}-{int(month):02d}", FILE_NAME)
+
+
+def month_table(month_doc, records=None):
+    """Arrow table of one month document (see storage.py), one row per duty."""
+    import pyarrow as pa
+
+    records = records or {}
+    names = month_doc.get("names", {})
+    holidays = to_date_set(month_doc.get("holidays", []))
+    dates, ids = [], []
+    for d_str, team in sorted(month_doc.get("schedule", {}).items()):
+        d = date.fromisoformat(d_str)
+        for pid in team:
+            dates.append(d)
+            ids.append(pid)
+    holiday = [d in holidays for d in dates]
+    return pa.table({
+        "date": dates,
+        "person_id": ids,
+        "person": [names.get(pid) or records.get(pid, {}).get("name") or pid for pid in ids],
+        "role": [records.get(pid, {}).get("role") or "" for pid in ids],
+        "weekend": [d.weekday() >= 5 or h for d, h in zip(dates, holiday)],
+        "holiday": holiday,
+    }, schema=_schema())
+
+
+def write_month(username, month_doc, records=None, root=None):
+    """
+    Writes (or replaces) the partition of one accepted month.
+    records: {person_id: person record} for the roles. Returns the path, or None
+    when pyarrow is missing or archiving is turned off.
+    """
+    root = ARCHIVE_DIR if root is None else root
+    if not root or not available():
+        return None
+    import pyarrow as pa
+
+    table = month_table(month_doc, records)
+    path = partition_path(username, month_doc["year"], month_doc["month"], root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and renamed, so readers never map a half-written file.
+    # Per process and thread: sessions of one server may save the same month at once
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+def open_archive(root=None):
+    """Memory-mapped dataset over the whole archive (None when it is empty or pyarrow is missing)."""
+    root = root or ARCHIVE_DIR
+    if not available() or not os.path.isdir(root):
+        return None
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    partitioning = ds.partitioning(pa.schema([("user", pa.string()), ("month", pa.string())]), flavor="hive")
+    return ds.dataset(root, format="ipc", partitioning=partitioning,
+                      filesystem=fs.LocalFileSystem(use_mmap=True), exclude_invalid_files=True)
+
+
+def scan(username, year=None, columns=None, root=None):
+    """Duties of one user (optionally one year) as an Arrow table, with the month column."""
+    import pyarrow.dataset as ds
+
+    dataset = open_archive(root)
+    if dataset is None:
+        return None
+    condition = ds.field("user") == str(username)
+    if year is not None:
+        condition &= ds.field("month").isin([f"{int(year):04d}-{m:02d}" for m in range(1, 13)])
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def yearly_report(username, year, root=None):
+    """
+    Per-person duties of one year, computed in Arrow: person_id, person (latest
+    name), months, total, weekend, holiday, saturday, sunday, per_month.
+    """
+    import pyarrow.compute as pc
+
+    table = scan(username, year, ["date", "person_id", "person", "weekend", "holiday", "month"], root)
+    if table is None:
+        return None
+    weekday = pc.day_of_week(table["date"])  # Monday = 0
+    table = table.append_column("saturday", pc.equal(weekday, 5)).append_column("sunday", pc.equal(weekday, 6))
+    # Sorted by date, so "last" is the name of the latest month
+    table = table.sort_by("date")
+    for flag in ("weekend", "holiday", "saturday", "sunday"):
+        table = table.set_column(table.schema.get_field_index(flag), flag, pc.cast(table[flag], "int32"))
+    report = table.group_by("person_id", use_threads=False).aggregate([
+        ("person", "last"), ("month", "count_distinct"), ("date", "count"),
+        ("weekend", "sum"), ("holiday", "sum"), ("saturday", "sum"), ("sunday", "sum"),
+    ])
+    # Aggregates come out as "<column>_<function>"
+    names = {"person_last": "person", "month_count_distinct": "months", "date_count": "total"}
+    report = report.rename_columns([names.get(c, c[:-len("_sum")] if c.endswith("_sum") else c) for c in report.column_names])
+    report = report.append_column("per_month", pc.divide(pc.cast(report["total"], "float64"), report["months"]))
+    return report.select(["person_id", "person", "months", "total", "weekend", "holiday", "saturday", "sunday", "per_month"]).sort_by("person")
+
+
+def fairness_summary(report):
+    """Spread of the yearly report: {column: (min, max, standard deviation)}."""
+    import pyarrow.compute as pc
+
+    summary = {}
+    for column in ("per_month", "total", "weekend", "holiday"):
+        values = report[column]
+        minmax = pc.min_max(values)
+        summary[column] = (minmax["min"].as_py(), minmax["max"].as_py(), pc.stddev(values).as_py())
+    return summary
+
+
+def backfill(username, root=None):
+    """Archives every month stored for the user in the local database. Returns the count."""
+    import storage
+
+    data, _ = storage.load_state(None, username)
+    records = {p["id"]: p for p in data.get("personnel", []) if p.get("id")}
+    months = storage.load_months(None, username)
+    for month_doc in months:
+        write_month(username, month_doc, records, root)
+    return len(months)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar archive of accepted schedules")
+    parser.add_argument("command", choices=["report", "backfill"])
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--year", type=int, default=date.today().year)
+    parser.add_argument("--root", default=None, help=f"archive directory (default {ARCHIVE_DIR})")
+    args = parser.parse_args()
+
+    if not available():
+        print("pyarrow is not installed")
+        return 1
+    if args.command == "backfill":
+        print(f"{backfill(args.user, args.root)} months archived")
+        return 0
+
+    report = yearly_report(args.user, args.year, args.root)
+    if report is None or report.num_rows == 0:
+        print(f"no archived months for {args.user} in {args.year}")
+        return 1
+    print(report.to_pandas().to_string(index=False))
+    for column, (low, high, std) in fairness_summary(report).items():
+        print(f"{column}: min {low:g}, max {high:g}, std {std:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,84 +1,180 @@
 import calendar
 import random
+import time
 from datetime import date, timedelta
-import statistics
-import copy
+from holiday_calendar import to_date_set
+import symmetry
+from decision_trace import TraceRecorder, ORDER, FIXED, ACCEPT, REJECT, TEAM_REJECT, SOFT, DAY_DONE, DAY_FAILED
+from candidate_queue import CandidateQueue
+
+# Neutral entry for people without saved history
+_NO_DEFICIT = {'total': 0.0, 'weekend': 0.0}
+
+# Rules that can be made soft (config['soft_rules']). A soft rule may be broken
+# when no one else fits; each violation adds its penalty (config['rule_penalties'])
+# and the candidate with the lowest total penalty wins. All rules are hard by default.
+RULES = [
+    "max_duties", "max_weekends", "consecutive", "two_day_rest", "weekly_limit", "busy_days",
+    "off_dates", "leave_dates", "conditional", "weekend_balance",
+    "gender", "mixed_gender_pref", "forbidden_pairs", "min_seniors"
+]
+DEFAULT_PENALTIES = {
+    "max_duties": 10, "max_weekends": 10, "consecutive": 20, "two_day_rest": 10, "weekly_limit": 5,
+    "busy_days": 5, "off_dates": 20, "leave_dates": 100, "conditional": 5, "weekend_balance": 1,
+    "gender": 20, "mixed_gender_pref": 10, "forbidden_pairs": 20, "min_seniors": 20
+}
+
+# Team gender modes (config['gender_mode']) and their sidebar labels per UI language
+GENDER_MODES = ["Any", "Mixed", "Single Gender"]
+GENDER_LABELS = {
+    "English": ["Any", "Mixed (Must have M & F)", "Single Gender (All M or All F)"],
+    "Türkçe": ["Fark etmez", "Karma (E & K olmalı)", "Tek Cinsiyet (Hepsi E veya Hepsi K)"],
+}
+
+
+def gender_mode_of(value):
+    """Gender mode from a mode name or a sidebar label of any language (None if unknown)."""
+    if value in GENDER_MODES:
+        return value
+    for labels in GENDER_LABELS.values():
+        if value in labels:
+            return GENDER_MODES[labels.index(value)]
+    return None
+
+
+# Per-person counters kept during the search and reported in ScheduleResult.counts
+COUNT_FIELDS = ("duty_count", "weekend_duty_count", "saturday_duty_count", "sunday_duty_count")
+
+
+class ScheduleResult:
+    """
+    Outcome of DutyScheduler.generate().
+    schedule: {date: [person dicts]}; counts: {name: {field: n}} for COUNT_FIELDS;
+    violations: [(date, name or None, rule)] of the soft rules broken; penalty: their total.
+    rosters: {roster name: {date: [person dicts]}} for joint schedules (see multi_roster.py).
+    """
+
+    def __init__(self, success, schedule=None, error=None, counts=None, violations=None, penalty=0, trace=None, rosters=None):
+        self.success = success
+        self.schedule = schedule or {}
+        self.error = error
+        self.counts = counts or {}
+        self.violations = violations or []
+        self.penalty = penalty
+        # decision_trace.TraceRecorder when config['record_trace'] is set
+        self.trace = trace
+        self.rosters = rosters or {}
+
 
 class DutyScheduler:
     def __init__(self, year, month, personnel_list, config):
         """
         personnel_list: list of dicts [{'name': '...', 'gender': 'M/F', 'max_duties': 5, 'max_weekends': 2}]
         config: dict {'people_per_day': 2, 'allow_consecutive': False, 'gender_mode': 'Mixed/Single/Any', 'conditional_rules': []}
+        The inputs are not modified; the search works on private copies of the records,
+        so one roster can be scheduled by several schedulers (threads) at once.
+        config['seed'] makes the random search reproducible; config['record_trace'] records
+        every decision (see decision_trace.py). config['symmetry_reduction'] (default on)
+        treats interchangeable people as one class (see symmetry.py).
         """
         self.year = year
         self.month = month
-        self.personnel = personnel_list
+        self.personnel = [dict(p) for p in personnel_list]
         self.config = config
+        self.rng = random.Random(config.get('seed'))
+        # Holidays as a date set ('holidays' may hold dates or "dd/mm/YYYY" strings)
+        self.holiday_dates = to_date_set(config.get('holidays', []))
+        self.soft_rules = set(config.get('soft_rules', []))
+        self.rule_penalties = dict(DEFAULT_PENALTIES, **config.get('rule_penalties', {}))
+        # Soft-rule violations of the returned schedule: [(date, name, rule)]
+        self.violations = []
+        self.total_penalty = 0
         self.days_in_month = calendar.monthrange(year, month)[1]
+        # Interchangeable people: name -> class index
+        self.classes = symmetry.equivalence_classes(self.personnel, config) if config.get('symmetry_reduction', True) else []
+        self.class_of = {name: i for i, names in enumerate(self.classes) for name in names}
         self.schedule = {}  # Key: Date, Value: List of names
         self.errors = []
 
     def is_weekend(self, d):
         # 5 = Saturday, 6 = Sunday
-        # Also check if the date is in the configured holidays list
-        if d.strftime("%d/%m/%Y") in self.config.get('holidays', []):
-            return True
-        return d.weekday() >= 5
+        # Also check if the date is in the configured holidays
+        return d.weekday() >= 5 or d in self.holiday_dates
 
     def get_week_number(self, d):
         return d.isocalendar()[1]
 
-    def check_constraints(self, person, current_date, current_team):
+    def constraint_violations(self, person, current_date, current_team):
+        """
+        Rules (see RULES) that assigning `person` on `current_date` would break.
+        Stops at the first hard rule, since the assignment is impossible then.
+        """
+        violations = []
+
+        def broken(rule):
+            # Records the violation; True means stop (hard rule)
+            violations.append(rule)
+            return rule not in self.soft_rules
+
         # 1. Max Duties Total
         # If fixed_duties_total is set (>0), use it as the limit. Otherwise use max_duties.
         fixed_total = person.get('fixed_duties_total', 0)
         limit_total = fixed_total if fixed_total > 0 else person['max_duties']
         
-        if person['duty_count'] >= limit_total:
-            return False
+        if person['duty_count'] >= limit_total and broken('max_duties'):
+            return violations
 
         # 2. Max Weekend Duties
         if self.is_weekend(current_date):
             fixed_wknd = person.get('fixed_duties_weekend', 0)
             limit_wknd = fixed_wknd if fixed_wknd > 0 else person['max_weekends']
             
-            if person['weekend_duty_count'] >= limit_wknd:
-                return False
+            if person['weekend_duty_count'] >= limit_wknd and broken('max_weekends'):
+                return violations
 
         # 3. Consecutive Days (Yesterday)
         # If they worked yesterday, they cannot work today (unless configured otherwise)
         if not self.config.get('allow_consecutive', False):
             yesterday = current_date - timedelta(days=1)
+            worked = False
             
             # Check current month history
             if yesterday in self.schedule:
-                if any(p['name'] == person['name'] for p in self.schedule[yesterday]):
-                    return False
+                worked = any(p['name'] == person['name'] for p in self.schedule[yesterday])
             # Check previous month history (if we are on day 1)
             elif current_date.day == 1:
-                if person['name'] in self.config.get('history', {}).get('prev_1', []):
-                    return False
+                worked = person['name'] in self.config.get('history', {}).get('prev_1', [])
+            # Tomorrow may already be filled when dates are not filled in calendar order
+            tomorrow = current_date + timedelta(days=1)
+            if not worked and tomorrow in self.schedule:
+                worked = any(p['name'] == person['name'] for p in self.schedule[tomorrow])
+            if worked and broken('consecutive'):
+                return violations
             
             # New Rule: 2 Days Rest (Prevent "Every Other Day" pattern)
             if self.config.get('require_two_rest_days', False):
                 day_before = current_date - timedelta(days=2)
+                worked = False
                 
                 # Check current month
                 if day_before in self.schedule:
-                    if any(p['name'] == person['name'] for p in self.schedule[day_before]):
-                        return False
+                    worked = any(p['name'] == person['name'] for p in self.schedule[day_before])
                 # Check previous month history
                 elif current_date.day == 1:
-                    if person['name'] in self.config.get('history', {}).get('prev_2', []):
-                        return False
+                    worked = person['name'] in self.config.get('history', {}).get('prev_2', [])
                 elif current_date.day == 2:
                     # On day 2, day_before is day 0 (prev_1)
-                    if person['name'] in self.config.get('history', {}).get('prev_1', []):
-                        return False
+                    worked = person['name'] in self.config.get('history', {}).get('prev_1', [])
+                day_after = current_date + timedelta(days=2)
+                if not worked and day_after in self.schedule:
+                    worked = any(p['name'] == person['name'] for p in self.schedule[day_after])
+                if worked and broken('two_day_rest'):
+                    return violations
 
-        # 4. Already in current team (cannot be added twice same day)
+        # 4. Already in current team (cannot be added twice same day, never soft)
         if any(p['name'] == person['name'] for p in current_team):
-            return False
+            violations.append('in_team')
+            return violations
 
         # 5. Weekly Constraint (Simple version: Max 2 per week to prevent burnout)
         # This addresses "if x day then y day" by ensuring they don't hold too many in one week
@@ -90,8 +186,8 @@ class DutyScheduler:
                     duties_this_week += 1
         
         # Configurable limit (Default 3)
-        if duties_this_week >= self.config.get('max_weekly_duties', 3):
-            return False
+        if duties_this_week >= self.config.get('max_weekly_duties', 3) and broken('weekly_limit'):
+            return violations
 
         # 6. Busy Days (Day of Week constraint)
         # Checks if the person has blocked this specific day of the week (e.g., "Monday")
@@ -100,60 +196,79 @@ class DutyScheduler:
             busy_list = [d.strip() for d in busy_str.split(',')]
             # Get the day name for the current date (e.g., "Monday")
             day_name = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"][current_date.weekday()]
-            if day_name in busy_list:
-                return False
+            if day_name in busy_list and broken('busy_days'):
+                return violations
 
         # 7. Specific Off Dates
         off_dates_str = person.get('off_dates', '')
         if off_dates_str:
-            if current_date.strftime("%d/%m/%Y") in [d.strip() for d in off_dates_str.split(',')]:
-                return False
+            if current_date.strftime("%d/%m/%Y") in [d.strip() for d in off_dates_str.split(',')] and broken('off_dates'):
+                return violations
 
         # 8. Leave Dates
         leave_dates_str = person.get('leave_dates', '')
         if leave_dates_str:
-            if current_date.strftime("%d/%m/%Y") in [d.strip() for d in leave_dates_str.split(',')]:
-                return False
+            if current_date.strftime("%d/%m/%Y") in [d.strip() for d in leave_dates_str.split(',')] and broken('leave_dates'):
+                return violations
 
         # 9. Conditional Weekday Rules (e.g., If Wed then No Sat)
         # config['conditional_rules'] = [{'trigger': 2, 'forbidden': 5}, ...] (0=Mon, 6=Sun)
+        # Checked both ways (today is the forbidden or the trigger day), since the
+        # other day of the week may already be filled in either direction.
         conditional_rules = self.config.get('conditional_rules', [])
         if conditional_rules:
             current_weekday = current_date.weekday()
             
             for rule in conditional_rules:
-                trigger_day = rule['trigger']
-                forbidden_day = rule['forbidden']
-                
-                # Only check if today is the forbidden day
-                if current_weekday == forbidden_day:
-                    # Calculate the date of the trigger day in the current week
-                    # trigger_date = current_date - (current_weekday - trigger_day)
-                    days_diff = current_weekday - trigger_day
-                    trigger_date = current_date - timedelta(days=days_diff)
-                    
-                    # Check if person worked on trigger_date
-                    if trigger_date in self.schedule:
-                        if any(p['name'] == person['name'] for p in self.schedule[trigger_date]):
-                            return False
+                if current_weekday == rule['forbidden']:
+                    other_day = rule['trigger']
+                elif current_weekday == rule['trigger']:
+                    other_day = rule['forbidden']
+                else:
+                    continue
+                # Same week as current_date
+                other_date = current_date + timedelta(days=other_day - current_weekday)
+                if other_date in self.schedule:
+                    if any(p['name'] == person['name'] for p in self.schedule[other_date]) and broken('conditional'):
+                        return violations
 
         # 10. Weekend Balance (Sat vs Sun)
         # Ensure that a person doesn't accumulate too many Saturdays without Sundays and vice versa.
         if current_date.weekday() == 5: # Saturday
-            if person.get('saturday_duty_count', 0) > person.get('sunday_duty_count', 0):
-                return False
+            if person.get('saturday_duty_count', 0) > person.get('sunday_duty_count', 0) and broken('weekend_balance'):
+                return violations
         elif current_date.weekday() == 6: # Sunday
-            if person.get('sunday_duty_count', 0) > person.get('saturday_duty_count', 0):
-                return False
+            if person.get('sunday_duty_count', 0) > person.get('saturday_duty_count', 0) and broken('weekend_balance'):
+                return violations
 
-        return True
+        return violations
+
+    def is_hard(self, violations):
+        return any(rule not in self.soft_rules for rule in violations)
+
+    def penalty(self, violations):
+        return sum(self.rule_penalties.get(rule, 1) for rule in violations)
+
+    def check_constraints(self, person, current_date, current_team):
+        return not self.constraint_violations(person, current_date, current_team)
+
+    def team_violations(self, team, rules=None):
+        """
+        Team rules (see RULES) broken by `team`. Stops at the first hard one.
+        rules: the team settings to check against, self.config by default.
+        """
+        rules = rules or self.config
+        violations = []
+
+        def broken(rule):
+            violations.append(rule)
+            return rule not in self.soft_rules
 
-    def check_team_constraints(self, team):
         # Gender Rules
-        mode = self.config.get('gender_mode', 'Any')
+        mode = rules.get('gender_mode', 'Any')
         
         if len(team) == 0:
-            return True
+            return violations
             
         genders = [p['gender'] for p in team]
         is_mixed = 'M' in genders and 'F' in genders
@@ -161,184 +276,379 @@ class DutyScheduler:
         if mode == 'Mixed':
             # If team is full, must have both genders. 
             # If not full, we just continue building.
-            if len(team) == self.config['people_per_day']:
-                if not is_mixed:
-                    return False
+            if len(team) == rules['people_per_day']:
+                if not is_mixed and broken('gender'):
+                    return violations
         
         elif mode == 'Single Gender':
             # All must be same
-            if is_mixed:
-                return False
+            if is_mixed and broken('gender'):
+                return violations
 
         # Personal Constraint: Mixed Gender Preference
         # If the team is mixed, ensure everyone in it allows mixed teams
         if is_mixed:
             for p in team:
-                if not p.get('mixed_gender_allowed', True):
-                    return False
+                if not p.get('mixed_gender_allowed', True) and broken('mixed_gender_pref'):
+                    return violations
 
         # Incompatible Pairs
         # config['forbidden_pairs'] = [{'p1': 'NameA', 'p2': 'NameB'}, ...]
-        forbidden_pairs = self.config.get('forbidden_pairs', [])
+        forbidden_pairs = rules.get('forbidden_pairs', [])
         if forbidden_pairs and len(team) > 1:
             team_names = set(p['name'] for p in team)
             for pair in forbidden_pairs:
-                if pair['p1'] in team_names and pair['p2'] in team_names:
-                    return False
+                if pair['p1'] in team_names and pair['p2'] in team_names and broken('forbidden_pairs'):
+                    return violations
         
         # Role / Seniority Constraint
-        min_seniors = self.config.get('min_seniors', 0)
-        if min_seniors > 0 and len(team) == self.config['people_per_day']:
+        min_seniors = rules.get('min_seniors', 0)
+        if min_seniors > 0 and len(team) == rules['people_per_day']:
             seniors_count = sum(1 for p in team if p.get('role') == 'Senior')
-            if seniors_count < min_seniors:
-                return False
+            if seniors_count < min_seniors and broken('min_seniors'):
+                return violations
                 
-        return True
+        return violations
 
-    def generate(self):
-        # Reset counts
+    def check_team_constraints(self, team):
+        return not self.team_violations(team)
+
+    def count_duties(self, schedule):
+        """{name: {field: n}} for COUNT_FIELDS, with every person of the roster."""
+        counts = {p['name']: dict.fromkeys(COUNT_FIELDS, 0) for p in self.personnel}
+        for d, team in schedule.items():
+            for p in team:
+                c = counts.setdefault(p['name'], dict.fromkeys(COUNT_FIELDS, 0))
+                c['duty_count'] += 1
+                if self.is_weekend(d):
+                    c['weekend_duty_count'] += 1
+                    if d.weekday() == 5:
+                        c['saturday_duty_count'] += 1
+                    elif d.weekday() == 6:
+                        c['sunday_duty_count'] += 1
+        return counts
+
+    def day_order(self):
+        """
+        Dates in the order they are filled. Calendar order by default; with
+        config['day_order'] == 'constrained' the scarcest dates come first, ranked by
+        how many eligible people, seniors and people of each needed gender they have.
+        """
+        dates = [date(self.year, self.month, day) for day in range(1, self.days_in_month + 1)]
+        if self.config.get('day_order') != 'constrained':
+            return dates
+
+        needed = self.config['people_per_day']
+        min_seniors = self.config.get('min_seniors', 0)
+        mixed = self.config.get('gender_mode', 'Any') == 'Mixed' and needed > 1
+        weekend_count = sum(1 for d in dates if self.is_weekend(d))
+        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+        # What each person can contribute to one date: 1, or less when their limit is
+        # smaller than the number of dates of that kind
+        people = []
+        for p in self.personnel:
+            blocked = set()
+            for key in ('off_dates', 'leave_dates'):
+                blocked.update(d.strip() for d in (p.get(key) or '').split(',') if d.strip())
+            busy = {d.strip() for d in (p.get('busy_days') or '').split(',') if d.strip()}
+            total, weekend = self.person_limits(p)
+            people.append((p, blocked, busy, min(1.0, total / len(dates)), min(1.0, weekend / weekend_count) if weekend_count else 0.0))
+
+        def scarcity(d):
+            d_str = d.strftime("%d/%m/%Y")
+            is_weekend = self.is_weekend(d)
+            free = [
+                (p, weekend if is_weekend else total) for p, blocked, busy, total, weekend in people
+                if d_str not in blocked and day_names[d.weekday()] not in busy
+            ]
+            ratios = [sum(share for _, share in free) / needed]
+            if min_seniors > 0:
+                ratios.append(sum(share for p, share in free if p.get('role') == 'Senior') / min_seniors)
+            if mixed:
+                ratios.append(sum(share for p, share in free if p['gender'] == 'M'))
+                ratios.append(sum(share for p, share in free if p['gender'] == 'F'))
+            # Weekends (and holidays) first among equals: their limits are usually tighter
+            return (min(ratios), not is_weekend, d)
+
+        return sorted(dates, key=scarcity)
+
+    def person_limits(self, person):
+        """(total, weekend) duty limits; a fixed target replaces the max."""
+        fixed_total = person.get('fixed_duties_total', 0)
+        fixed_wknd = person.get('fixed_duties_weekend', 0)
+        return (fixed_total if fixed_total > 0 else person['max_duties'],
+                fixed_wknd if fixed_wknd > 0 else person['max_weekends'])
+
+    def priority(self, p, weekend, deficits):
+        """Water-filling sort key of a person for a weekday or a weekend date (lowest first)."""
+        # Priority 0: Needs weekend duty on a weekend
+        if weekend:
+            f_wknd = p.get('fixed_duties_weekend', 0)
+            if f_wknd > 0 and p['weekend_duty_count'] < f_wknd:
+                return (0, p['weekend_duty_count'], p['duty_count'])
+
+        # Priority 1: Needs total duty
+        f_total = p.get('fixed_duties_total', 0)
+        if f_total > 0 and p['duty_count'] < f_total:
+            return (1, p['duty_count'], 0)
+
+        # Priority 2: Least loaded, counting what past months owe them
+        if deficits:
+            d = deficits.get(p['name'], _NO_DEFICIT)
+            if weekend:
+                return (2, p['weekend_duty_count'] - d['weekend'], p['duty_count'] - d['total'])
+            return (2, p['duty_count'] - d['total'], 0)
+        return (2, p['duty_count'], 0)
+
+    def duties_allowed(self, person, dates):
+        """
+        Whether `person` (no personal dates or history) may work exactly `dates`:
+        limits, rest rules, weekly limit, conditional rules and Saturday/Sunday balance.
+        Used to move dates between interchangeable people after the search.
+        """
+        dates = sorted(dates)
+        worked = set(dates)
+        limit_total, limit_wknd = self.person_limits(person)
+        weekend = [d for d in dates if self.is_weekend(d)]
+        if len(dates) > limit_total or len(weekend) > limit_wknd:
+            return False
+        if not self.config.get('allow_consecutive', False):
+            gaps = (1, 2) if self.config.get('require_two_rest_days', False) else (1,)
+            if any(d + timedelta(days=gap) in worked for d in dates for gap in gaps):
+                return False
+        weeks = {}
+        for d in dates:
+            weeks[self.get_week_number(d)] = weeks.get(self.get_week_number(d), 0) + 1
+        if weeks and max(weeks.values()) > self.config.get('max_weekly_duties', 3):
+            return False
+        for rule in self.config.get('conditional_rules', []):
+            gap = rule['forbidden'] - rule['trigger']
+            if any(d.weekday() == rule['trigger'] and d + timedelta(days=gap) in worked for d in dates):
+                return False
+        saturdays = sum(1 for d in weekend if d.weekday() == 5)
+        sundays = sum(1 for d in weekend if d.weekday() == 6)
+        return abs(saturdays - sundays) <= 1
+
+    def fixed_assignments(self):
+        """{"dd/mm/YYYY": [people with that fixed date]}"""
+        fixed_on = {}
         for p in self.personnel:
-            p['duty_count'] = 0
-            p['weekend_duty_count'] = 0
-            p['saturday_duty_count'] = 0
-            p['sunday_duty_count'] = 0
+            for d in (p.get('fixed_dates') or '').split(','):
+                if d.strip():
+                    fixed_on.setdefault(d.strip(), []).append(p)
+        return fixed_on
+
+    def fill_team(self, current_date, queue, day_team, rules=None, taken=(), trace=None, attempt_violations=None):
+        """
+        Fills `day_team` (in place) for one date from the queue's candidates.
+        rules: team rules (people_per_day, gender_mode, forbidden_pairs, min_seniors),
+        self.config by default; taken: people already on duty that date in another team.
+        Soft-rule breaks are appended to attempt_violations.
+        """
+        rules = rules or self.config
+        needed_count = rules['people_per_day']
+        day_num = current_date.day
+        # People least loaded first (fixed targets before), random among equals
+        is_weekend = self.is_weekend(current_date)
+        # Everyone taken from the queue this date, in order (reused by the soft-rule step)
+        candidates = []
+
+        # 2. Fill remaining spots
+        for person in queue.candidates(is_weekend):
+            if len(day_team) >= needed_count:
+                break
+            candidates.append(person)
+            if trace:
+                trace.event(day_num, ORDER, person)
+
+            # Skip if already added via fixed duties
+            if any(p['name'] == person['name'] for p in day_team):
+                continue
+
+            violations = self.constraint_violations(person, current_date, list(taken) + day_team)
+            if not violations:
+                # Tentatively add
+                day_team.append(person)
+
+                # Check if adding this person breaks team rules (like gender)
+                # If it's the last person to add, strict check. 
+                # If intermediate, loose check.
+                team_violations = self.team_violations(day_team, rules)
+                if team_violations:
+                    day_team.pop() # Backtrack specific person
+                    if trace:
+                        trace.event(day_num, TEAM_REJECT, person, team_violations[-1])
+                elif trace:
+                    trace.event(day_num, ACCEPT, person)
+            elif trace:
+                # The last rule is the one that stopped the check
+                trace.event(day_num, REJECT, person, violations[-1])
+
+        # 3. Soft rules: fill what is left with the cheapest rule breaks instead of restarting
+        if len(day_team) < needed_count and self.soft_rules:
+            relaxed = []
+            for person in candidates:
+                if any(p['name'] == person['name'] for p in day_team):
+                    continue
+                violations = self.constraint_violations(person, current_date, list(taken) + day_team)
+                if not self.is_hard(violations):
+                    relaxed.append((self.penalty(violations), person, violations))
+            # Stable sort keeps the priority order among equal penalties
+            relaxed.sort(key=lambda x: x[0])
+            for _, person, violations in relaxed:
+                if len(day_team) >= needed_count:
+                    break
+                day_team.append(person)
+                team_violations = self.team_violations(day_team, rules)
+                if self.is_hard(team_violations):
+                    day_team.pop()
+                    if trace:
+                        trace.event(day_num, TEAM_REJECT, person, team_violations[-1])
+                    continue
+                attempt_violations.extend((current_date, person['name'], rule) for rule in violations)
+                if trace:
+                    for rule in violations:
+                        trace.event(day_num, SOFT, person, rule)
+            attempt_violations.extend((current_date, None, rule) for rule in self.team_violations(day_team, rules))
+        return day_team
 
+    def commit_day(self, current_date, day_team):
+        """Records a filled date and updates the search counters of its people."""
+        is_weekend = self.is_weekend(current_date)
+        self.schedule[current_date] = day_team
+        for p in day_team:
+            p['duty_count'] += 1
+            if is_weekend:
+                p['weekend_duty_count'] += 1
+                if current_date.weekday() == 5:
+                    p['saturday_duty_count'] += 1
+                elif current_date.weekday() == 6:
+                    p['sunday_duty_count'] += 1
+
+    def snapshot(self, schedule):
+        """Copy of a schedule without the search counters (see ScheduleResult.counts)."""
+        return {
+            d: [{k: v for k, v in p.items() if k not in COUNT_FIELDS} for p in team]
+            for d, team in sorted(schedule.items())
+        }
+
+    def best_solution(self, valid_solutions, solution_violations, deficits):
+        """Index of the candidate with the lowest soft-rule penalty, then the fairest."""
+        # Score all candidates at once on the weighted fairness objectives (lowest is best)
+        import scoring
+        names = [p['name'] for p in self.personnel]
+        dates = [date(self.year, self.month, day) for day in range(1, self.days_in_month + 1)]
+        offsets = None
+        if deficits:
+            # Spread of the history-adjusted load, so owed duties count as fair
+            offsets = {
+                'total': [-deficits.get(name, _NO_DEFICIT)['total'] for name in names],
+                'weekend': [-deficits.get(name, _NO_DEFICIT)['weekend'] for name in names]
+            }
+        _, scores = scoring.rank(valid_solutions, names, dates, self.holiday_dates, self.config.get('objective_weights'), offsets)
+        penalties = [self.penalty(rule for _, _, rule in v) for v in solution_violations]
+        best = min(range(len(valid_solutions)), key=lambda i: (penalties[i], scores[i]))
+        self.schedule = valid_solutions[best]
+        self.violations = solution_violations[best]
+        self.total_penalty = penalties[best]
+        return best
+
+    def generate(self):
+        """Searches for schedules and returns the best one as a ScheduleResult."""
         # Optimization: Find multiple valid schedules and pick the fairest one
         valid_solutions = []
-        target_solutions = 5
-        max_attempts = 200
+        solution_violations = []
+        target_solutions = self.config.get('candidate_count', 5)
+        max_attempts = max(200, 2 * target_solutions)
         last_error = ""
+        # Duties owed per person from past months (see history.compute_deficits)
+        deficits = self.config.get('history_deficits', {})
+
+        # Every attempt shuffles with its own seed, so a recorded attempt can be rerun alone
+        attempt_seeds = self.config.get('attempt_seeds')
+        if attempt_seeds:
+            max_attempts = len(attempt_seeds)
+        trace = None
+        if self.config.get('record_trace'):
+            trace = TraceRecorder(self, RULES + ['in_team'])
+            trace.set_inputs([dict(p) for p in self.personnel], self.config, self.holiday_dates)
+
+        seen_signatures = set()
+        fill_order = self.day_order()
+        fixed_on = self.fixed_assignments()
+        by_name = {p['name']: p for p in self.personnel}
+        records = {name: {k: v for k, v in p.items() if k not in COUNT_FIELDS} for name, p in by_name.items()}
 
         for attempt in range(max_attempts):
+            seed = attempt_seeds[attempt] if attempt_seeds else self.rng.getrandbits(32)
+            rng = random.Random(seed)
+            if trace:
+                trace.begin_attempt(seed)
             self.schedule = {}
             # Reset temp counts for this attempt
             for p in self.personnel:
-                p['duty_count'] = 0
-                p['weekend_duty_count'] = 0
-                p['saturday_duty_count'] = 0
-                p['sunday_duty_count'] = 0
+                p.update(dict.fromkeys(COUNT_FIELDS, 0))
+            queue = CandidateQueue(self.personnel, lambda p, weekend: self.priority(p, weekend, deficits), rng, self.class_of)
             
             success = True
+            attempt_violations = []
             
             # Iterate days
-            for day_num in range(1, self.days_in_month + 1):
-                current_date = date(self.year, self.month, day_num)
+            for current_date in fill_order:
+                if trace:
+                    day_start = time.perf_counter()
+                day_num = current_date.day
                 current_date_str = current_date.strftime("%d/%m/%Y")
                 needed_count = self.config['people_per_day']
                 day_team = []
                 
                 # 1. Handle Fixed Duties (Priority Assignment)
-                for p in self.personnel:
-                    f_dates = [d.strip() for d in p.get('fixed_dates', '').split(',') if d.strip()]
-                    if current_date_str in f_dates:
-                        day_team.append(p)
-                
-                # Shuffle personnel to ensure randomness
-                candidates = self.personnel[:]
-                random.shuffle(candidates)
-                
-                # Prioritize people who have a fixed duty target and haven't reached it yet
-                def get_sort_key(p):
-                    # Priority 0: Needs weekend duty on a weekend
-                    if self.is_weekend(current_date):
-                        f_wknd = p.get('fixed_duties_weekend', 0)
-                        if f_wknd > 0 and p['weekend_duty_count'] < f_wknd:
-                            return (0, p['weekend_duty_count'], p['duty_count'])
-                    
-                    # Priority 1: Needs total duty
-                    f_total = p.get('fixed_duties_total', 0)
-                    if f_total > 0 and p['duty_count'] < f_total:
-                        return (1, p['duty_count'], 0)
-                        
-                    return (2, p['duty_count'], 0)
-                
-                candidates.sort(key=get_sort_key)
-                
-                # 2. Fill remaining spots
-                for person in candidates:
-                    if len(day_team) >= needed_count:
-                        break
-                    
-                    # Skip if already added via fixed duties
-                    if any(p['name'] == person['name'] for p in day_team):
-                        continue
-                    
-                    if self.check_constraints(person, current_date, day_team):
-                        # Tentatively add
-                        day_team.append(person)
-                        
-                        # Check if adding this person breaks team rules (like gender)
-                        # If it's the last person to add, strict check. 
-                        # If intermediate, loose check.
-                        if not self.check_team_constraints(day_team):
-                            day_team.pop() # Backtrack specific person
-                        else:
-                            # Keep them
-                            pass
+                for p in fixed_on.get(current_date_str, []):
+                    day_team.append(p)
+                    if trace:
+                        trace.event(day_num, FIXED, p)
+
+                # 2. and 3. Candidates in priority order, then soft rules
+                self.fill_team(current_date, queue, day_team, trace=trace, attempt_violations=attempt_violations)
 
                 # Verify day is full
                 if len(day_team) < needed_count:
                     success = False
                     last_error = f"Could not find enough eligible personnel for {current_date_str}. Found {len(day_team)}/{needed_count}."
+                    if trace:
+                        trace.event(day_num, DAY_FAILED, value=int((time.perf_counter() - day_start) * 1e6))
                     break
                 
                 # Commit day
-                self.schedule[current_date] = day_team
-                for p in day_team:
-                    p['duty_count'] += 1
-                    if self.is_weekend(current_date):
-                        p['weekend_duty_count'] += 1
-                        if current_date.weekday() == 5:
-                            p['saturday_duty_count'] += 1
-                        elif current_date.weekday() == 6:
-                            p['sunday_duty_count'] += 1
-            
+                self.commit_day(current_date, day_team)
+                queue.commit(day_team)
+                if trace:
+                    trace.event(day_num, DAY_DONE, value=int((time.perf_counter() - day_start) * 1e6))
+
+            if trace:
+                trace.end_attempt(success)
             if success:
-                # Calculate Fairness Score (Standard Deviation)
-                counts = [p['duty_count'] for p in self.personnel]
-                wknd_counts = [p['weekend_duty_count'] for p in self.personnel]
-                
-                std_total = statistics.stdev(counts) if len(counts) > 1 else 0
-                std_wknd = statistics.stdev(wknd_counts) if len(wknd_counts) > 1 else 0
-                
-                # Combined score: Total variation + Weekend variation
-                score = std_total + std_wknd
-                
-                valid_solutions.append({
-                    'schedule': copy.deepcopy(self.schedule),
-                    'score': score
-                })
+                solution = self.snapshot(self.schedule)
+                if self.classes:
+                    # Skip schedules that only swap interchangeable people of an earlier one
+                    signature = symmetry.class_signature(solution, self.class_of)
+                    if signature in seen_signatures:
+                        continue
+                    seen_signatures.add(signature)
+                    symmetry.balance_classes(
+                        solution, self.classes, records, lambda name, dates: self.duties_allowed(by_name[name], dates),
+                        self.is_weekend, frozen={d for d, _, _ in attempt_violations}
+                    )
+                valid_solutions.append(solution)
+                solution_violations.append(attempt_violations)
                 
                 if len(valid_solutions) >= target_solutions:
                     break
         
         if valid_solutions:
-            # Sort by score (lowest std dev is best)
-            valid_solutions.sort(key=lambda x: x['score'])
-            best_solution = valid_solutions[0]
-            self.schedule = best_solution['schedule']
-            
-            # Sync counts back to personnel objects so UI stats are accurate
-            for p in self.personnel:
-                p['duty_count'] = 0
-                p['weekend_duty_count'] = 0
-                p['saturday_duty_count'] = 0
-                p['sunday_duty_count'] = 0
-                
-            for d, team in self.schedule.items():
-                for p_sched in team:
-                    # Find the original person object to update
-                    for p_orig in self.personnel:
-                        if p_orig['name'] == p_sched['name']:
-                            p_orig['duty_count'] += 1
-                            if self.is_weekend(d):
-                                p_orig['weekend_duty_count'] += 1
-                                if d.weekday() == 5:
-                                    p_orig['saturday_duty_count'] = p_orig.get('saturday_duty_count', 0) + 1
-                                elif d.weekday() == 6:
-                                    p_orig['sunday_duty_count'] = p_orig.get('sunday_duty_count', 0) + 1
-                            break
-            
-            return True, self.schedule, None
-            
-        return False, {}, last_error
\ No newline at end of file
+            # Lowest soft-rule penalty first, then fairest
+            self.best_solution(valid_solutions, solution_violations, deficits)
+            return ScheduleResult(True, self.schedule, None, self.count_duties(self.schedule), self.violations, self.total_penalty, trace)
+
+        return ScheduleResult(False, error=last_error, trace=trace)
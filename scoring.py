@@ -0,0 +1,137 @@
+# Batch scoring of candidate schedules.
+#
+# Candidates are stacked into one 0/1 tensor X of shape
+# (candidates, people, days) and every objective is computed for the whole
+# batch with array operations:
+#   per-person counts      = X @ day masks           -> (S, P)
+#   weekday distribution   = X @ W (days x 7 one-hot) -> (S, P, 7)
+#   co-occurrence          = X @ X^T per candidate    -> (S, P, P)
+# An objective maps the batch to one value per candidate (lower is fairer);
+# the score is the weighted sum of the enabled objectives. numpy is imported
+# in the functions so the objective names can be used at app startup.
+
+OBJECTIVE_NAMES = ["total_std", "weekend_std", "weekday_std", "sat_sun_gap", "co_occurrence_std"]
+
+# Same ranking as the original std(total) + std(weekend) score
+DEFAULT_WEIGHTS = {"total_std": 1.0, "weekend_std": 1.0, "weekday_std": 0.0, "sat_sun_gap": 0.0, "co_occurrence_std": 0.0}
+
+
+def stack_schedules(schedules, names, dates):
+    """
+    0/1 tensor (candidates, people, days) from schedules {date: [person dicts]}.
+    names/dates fix the axis order; people or dates outside them are ignored.
+    """
+    import numpy as np
+
+    p_index = {name: i for i, name in enumerate(names)}
+    d_index = {d: j for j, d in enumerate(dates)}
+    s_idx, p_idx, d_idx = [], [], []
+    for s, schedule in enumerate(schedules):
+        for d, team in schedule.items():
+            j = d_index.get(d)
+            if j is None:
+                continue
+            for p in team:
+                i = p_index.get(p['name'])
+                if i is not None:
+                    s_idx.append(s)
+                    p_idx.append(i)
+                    d_idx.append(j)
+    tensor = np.zeros((len(schedules), len(names), len(dates)), dtype=np.float32)
+    tensor[s_idx, p_idx, d_idx] = 1
+    return tensor
+
+
+def _std(values, axis):
+    # Sample standard deviation (statistics.stdev), 0 with fewer than two values
+    import numpy as np
+
+    if values.shape[axis] < 2:
+        return np.zeros(np.delete(values.shape, axis), dtype=np.float64)
+    return values.std(axis=axis, ddof=1)
+
+
+def _total_std(ctx):
+    return _std(ctx["totals"], axis=1)
+
+
+def _weekend_std(ctx):
+    return _std(ctx["weekend"], axis=1)
+
+
+def _weekday_std(ctx):
+    # Spread of each weekday across people, averaged over the 7 weekdays
+    return _std(ctx["weekday"], axis=1).mean(axis=1)
+
+
+def _sat_sun_gap(ctx):
+    import numpy as np
+
+    return np.abs(ctx["saturday"] - ctx["sunday"]).mean(axis=1)
+
+
+def _co_occurrence_std(ctx):
+    import numpy as np
+
+    tensor = ctx["tensor"]
+    people = tensor.shape[1]
+    if people < 3:
+        return np.zeros(tensor.shape[0])
+    co = tensor @ tensor.transpose(0, 2, 1)
+    rows, cols = np.triu_indices(people, k=1)
+    return _std(co[:, rows, cols], axis=1)
+
+
+OBJECTIVES = {
+    "total_std": _total_std,
+    "weekend_std": _weekend_std,
+    "weekday_std": _weekday_std,
+    "sat_sun_gap": _sat_sun_gap,
+    "co_occurrence_std": _co_occurrence_std,
+}
+
+
+def score_batch(tensor, dates, weekend_dates=(), weights=None, offsets=None):
+    """
+    Weighted objective per candidate, shape (candidates,). Lower is better.
+
+    tensor: (candidates, people, days) from stack_schedules.
+    weekend_dates: dates counted as weekend besides Saturday/Sunday (holidays).
+    weights: {objective name: weight}; missing names count as 0, None uses DEFAULT_WEIGHTS.
+    offsets: optional {"total": (P,), "weekend": (P,)} added to the per-person counts
+             before the spreads are taken (e.g. minus the duties owed from past months).
+    """
+    import numpy as np
+
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    weekend_dates = set(weekend_dates)
+    weekdays = np.array([d.weekday() for d in dates], dtype=np.int64)
+    weekend_mask = np.array([d.weekday() >= 5 or d in weekend_dates for d in dates], dtype=np.float32)
+    onehot = np.zeros((len(dates), 7), dtype=np.float32)
+    onehot[np.arange(len(dates)), weekdays] = 1
+
+    ctx = {
+        "tensor": tensor,
+        "totals": tensor.sum(axis=2, dtype=np.float64),
+        "weekend": (tensor @ weekend_mask).astype(np.float64),
+        "saturday": (tensor @ (weekend_mask * (weekdays == 5))).astype(np.float64),
+        "sunday": (tensor @ (weekend_mask * (weekdays == 6))).astype(np.float64),
+        "weekday": tensor @ onehot,
+    }
+    if offsets:
+        ctx["totals"] = ctx["totals"] + np.asarray(offsets.get("total", 0.0))
+        ctx["weekend"] = ctx["weekend"] + np.asarray(offsets.get("weekend", 0.0))
+
+    scores = np.zeros(tensor.shape[0], dtype=np.float64)
+    for name, weight in weights.items():
+        if weight:
+            scores += weight * OBJECTIVES[name](ctx)
+    return scores
+
+
+def rank(schedules, names, dates, weekend_dates=(), weights=None, offsets=None):
+    """Candidate indices from fairest to least fair, and their scores."""
+    import numpy as np
+
+    scores = score_batch(stack_schedules(schedules, names, dates), dates, weekend_dates, weights, offsets)
+    return np.argsort(scores, kind="stable"), scores
@@ -0,0 +1,449 @@
+"""
+Local HTTP scheduling service.
+
+Accepts roster + settings payloads (the shape save_db stores), queues them in
+process and runs them on a bounded pool of worker processes, so many
+departments can be scheduled in parallel without a browser session.
+
+    python service.py --port 8765 --workers 4 --queue 200
+
+Endpoints (JSON):
+    POST   /jobs          one payload or a list of payloads -> 202 {"id", "status"} (list for a list;
+                          queued all or nothing, 503 when the queue is full)
+    GET    /jobs/<id>     status; includes "result" once done
+    GET    /jobs/<id>/calendar.ics   the finished schedule as iCalendar (timed events per shift)
+    DELETE /jobs/<id>     cancel a job that has not started
+    GET    /health        workers, queued and running jobs
+
+Payload: {"personnel": [...], "cfg_year": 2026, "cfg_month": 3, "cfg_ppl": 2, ...,
+          "conditional_rules": [...], "forbidden_pairs": [...], "holidays_multiselect": [...],
+          "history": {"prev_1": [...], "prev_2": [...]},
+          "fairness_history": {person_id: {"months", "total", "weekend", ...}}}
+"year"/"month" may be used instead of cfg_year/cfg_month. Without
+holidays_multiselect the official holidays of the month are used. With
+cfg_use_history, fairness_history (as load_history returns it) balances duties
+against past months. With "rosters": [{"name", "people_per_day", "gender_mode",
+"min_seniors", "forbidden_pairs", "members": [names]}, ...] the rosters are
+scheduled jointly over the personnel (see multi_roster.py) and the result also
+holds one schedule per roster. "shifts" takes the same fields plus "start" and
+"end" ("HH:MM") and "rest_after" (hours) for several shifts per date, with
+"min_rest_hours" between any two duties (see shifts.py); the result then holds
+one schedule per shift under "shifts".
+
+The service listens on 127.0.0.1 by default. Set NOBET_SERVICE_TOKEN to require
+"Authorization: Bearer <token>" on every request.
+"""
+import argparse
+import copy
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import history
+import holiday_calendar
+import infeasibility
+import personnel_store
+from multi_roster import MultiRosterScheduler, unrostered_fixed
+from scheduler import DutyScheduler, RULES, gender_mode_of
+from shifts import ShiftScheduler, parse_time
+
+DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Finished jobs kept for polling
+MAX_FINISHED_JOBS = 1000
+MAX_BODY_BYTES = 5 * 1024 * 1024
+# Candidate schedules per job, as the sidebar allows
+MAX_CANDIDATES = 500
+
+
+class PayloadError(ValueError):
+    """Invalid job payload (answered with 400)."""
+
+
+class QueueFullError(Exception):
+    """No room in the job queue (answered with 503)."""
+
+
+def _gender_mode(value):
+    if value is None:
+        return "Any"
+    # Stored settings hold the sidebar label of the UI language
+    mode = gender_mode_of(value)
+    if mode is None:
+        raise PayloadError(f"unknown gender mode: {value}")
+    return mode
+
+
+def _forbidden_pairs(pairs, names):
+    """Validated [{"p1", "p2"}] pairs of two different known names."""
+    if pairs is None:
+        return []
+    if not isinstance(pairs, list) or not all(
+        isinstance(pair, dict) and pair.get("p1") in names and pair.get("p2") in names and pair["p1"] != pair["p2"]
+        for pair in pairs
+    ):
+        raise PayloadError("forbidden_pairs must be a list of {p1, p2} with two different names from personnel")
+    return [{"p1": pair["p1"], "p2": pair["p2"]} for pair in pairs]
+
+
+def _rosters(rosters, names):
+    """Validated roster definitions for MultiRosterScheduler."""
+    if not isinstance(rosters, list) or not all(isinstance(r, dict) and r.get("name") for r in rosters):
+        raise PayloadError("rosters must be a list of objects with a name")
+    if len({r["name"] for r in rosters}) != len(rosters):
+        raise PayloadError("roster names must be unique")
+    result = []
+    for r in rosters:
+        roster = {"name": str(r["name"])}
+        try:
+            for key in ("people_per_day", "min_seniors"):
+                if r.get(key) is not None:
+                    roster[key] = int(r[key])
+        except (TypeError, ValueError):
+            raise PayloadError(f"roster {r['name']}: people_per_day and min_seniors must be integers")
+        if r.get("gender_mode") is not None:
+            roster["gender_mode"] = _gender_mode(r["gender_mode"])
+        if r.get("forbidden_pairs") is not None:
+            roster["forbidden_pairs"] = _forbidden_pairs(r["forbidden_pairs"], names)
+        if r.get("members") is not None:
+            if not isinstance(r["members"], list):
+                raise PayloadError(f"roster {r['name']}: members must be a list of names")
+            roster["members"] = r["members"]
+        result.append(roster)
+    return result
+
+
+def _shifts(shifts, names):
+    """Validated shift definitions for ShiftScheduler."""
+    result = _rosters(shifts, names)
+    for shift, raw in zip(result, shifts):
+        try:
+            for key in ("start", "end"):
+                parse_time(raw.get(key))
+                shift[key] = raw[key]
+            shift["rest_after"] = float(raw.get("rest_after") or 0)
+        except (TypeError, ValueError):
+            raise PayloadError(f"shift {shift['name']}: start and end must be HH:MM, rest_after hours")
+    return result
+
+
+def config_from_state(state):
+    """(year, month, personnel, scheduler config) from a stored-state shaped payload."""
+    if not isinstance(state, dict):
+        raise PayloadError("payload must be an object")
+    personnel = state.get("personnel")
+    if not isinstance(personnel, list) or not personnel:
+        raise PayloadError("personnel must be a non-empty list")
+    if not all(isinstance(p, dict) and p.get("name") for p in personnel):
+        raise PayloadError("every person needs a name")
+    # Own copy with every field the scheduler reads
+    personnel = personnel_store.normalize_records(copy.deepcopy(personnel))
+    try:
+        year = int(state.get("year") or state["cfg_year"])
+        month = int(state.get("month") or state["cfg_month"])
+    except (KeyError, TypeError, ValueError):
+        raise PayloadError("year and month are required")
+    if not 1 <= month <= 12:
+        raise PayloadError("month must be 1-12")
+
+    try:
+        scheduler_rules = [
+            {'trigger': DAYS_OF_WEEK.index(r['trigger']), 'forbidden': DAYS_OF_WEEK.index(r['forbidden'])}
+            for r in state.get("conditional_rules", [])
+        ]
+    except (KeyError, TypeError, ValueError):
+        raise PayloadError("conditional_rules need English day names in trigger/forbidden")
+
+    if "holidays_multiselect" in state:
+        holidays = holiday_calendar.to_date_set(state["holidays_multiselect"])
+    else:
+        holidays = frozenset(d for d, _, _ in holiday_calendar.month_holidays(holiday_calendar.DEFAULT_COUNTRY, year, month))
+
+    soft_rules = [r for r in state.get("cfg_soft_rules") or [] if r in RULES]
+    gender_mode = _gender_mode(state.get("cfg_gender"))
+    names = {p['name'] for p in personnel}
+    forbidden_pairs = _forbidden_pairs(state.get("forbidden_pairs"), names)
+    try:
+        config = {
+            'people_per_day': int(state.get("cfg_ppl") or 2),
+            'min_seniors': int(state.get("cfg_min_seniors") or 0),
+            'gender_mode': gender_mode,
+            'allow_consecutive': bool(state.get("cfg_consecutive")),
+            'conditional_rules': scheduler_rules,
+            'max_weekly_duties': int(state.get("cfg_max_weekly") or 3),
+            'require_two_rest_days': bool(state.get("cfg_two_rest")),
+            'holidays': holidays,
+            'objective_weights': {k[len("cfg_w_"):]: float(v) for k, v in state.items() if k.startswith("cfg_w_") and v is not None} or None,
+            'soft_rules': soft_rules,
+            'rule_penalties': {r: float(state[f"cfg_pen_{r}"]) for r in soft_rules if state.get(f"cfg_pen_{r}") is not None},
+            'candidate_count': min(max(int(state.get("cfg_candidates") or 5), 1), MAX_CANDIDATES),
+            'day_order': 'constrained' if state.get("cfg_hardest_first") else 'calendar',
+            'forbidden_pairs': forbidden_pairs,
+            'history': state.get("history") or {'prev_1': [], 'prev_2': []},
+        }
+    except (TypeError, ValueError):
+        raise PayloadError("cfg_ppl, cfg_min_seniors, cfg_max_weekly, cfg_candidates, cfg_w_* and cfg_pen_* must be numbers")
+    if state.get("cfg_use_history") and state.get("fairness_history"):
+        people = [(p['id'], p['name']) for p in personnel if p.get('id')]
+        config['history_deficits'] = history.compute_deficits(state["fairness_history"], people)
+    if state.get("rosters") and state.get("shifts"):
+        raise PayloadError("use either rosters or shifts")
+    if state.get("rosters"):
+        config['rosters'] = _rosters(state["rosters"], names)
+    if state.get("shifts"):
+        config['shifts'] = _shifts(state["shifts"], names)
+        try:
+            config['min_rest_hours'] = float(state.get("min_rest_hours") or 0)
+        except (TypeError, ValueError):
+            raise PayloadError("min_rest_hours must be a number")
+    rosters = config.get('rosters') or config.get('shifts')
+    unplaced = unrostered_fixed(year, month, personnel, rosters) if rosters else []
+    if unplaced:
+        raise PayloadError(f"fixed dates for people on no roster: {', '.join(unplaced)}")
+    return year, month, personnel, config
+
+
+def run_job(year, month, personnel, config):
+    """Runs one schedule in a worker process. Returns a JSON-ready result."""
+    if config.get('shifts'):
+        scheduler_class = ShiftScheduler
+    elif config.get('rosters'):
+        scheduler_class = MultiRosterScheduler
+    else:
+        scheduler_class = DutyScheduler
+    result = scheduler_class(year, month, personnel, config).generate()
+    conflicts = None
+    # The conflict search models a single roster
+    if not result.success and scheduler_class is DutyScheduler:
+        explanation = infeasibility.explain(year, month, personnel, config)
+        if explanation:
+            conflicts = {
+                "items": [[x.isoformat() if isinstance(x, date) else x for x in item] for item in explanation.items],
+                "dates": [d.isoformat() for d in explanation.dates],
+                "minimal": explanation.minimal,
+            }
+    def team_list(schedule):
+        return {
+            d.isoformat(): [{"id": p.get("id"), "name": p["name"]} for p in team]
+            for d, team in sorted(schedule.items())
+        }
+
+    return {
+        "success": result.success,
+        "error": result.error,
+        "schedule": team_list(result.schedule),
+        "shifts" if config.get('shifts') else "rosters":
+            {name: team_list(schedule) for name, schedule in result.rosters.items()} or None,
+        "stats": {
+            name: {"total": c["duty_count"], "weekend": c["weekend_duty_count"]}
+            for name, c in result.counts.items()
+        },
+        "penalty": result.penalty,
+        "violations": [{"date": d.isoformat(), "name": who, "rule": rule} for d, who, rule in result.violations],
+        # Set of hard constraints that rule the month out, minimal unless the search ran out of time (see infeasibility.py)
+        "conflicts": conflicts,
+        # Times of each shift, in shift order (for the calendar export)
+        "shift_times": [[s['name'], s['start'], s['end']] for s in config['shifts']] if config.get('shifts') else None,
+    }
+
+
+def result_ics(result):
+    """iCalendar file of a finished job: timed events per shift, otherwise one all-day event per date."""
+    from exports import generate_ics
+
+    def schedule(teams):
+        return {date.fromisoformat(d): team for d, team in teams.items()}
+
+    if result.get("shift_times"):
+        shifts = [(name, start, end, schedule(result["shifts"][name])) for name, start, end in result["shift_times"]]
+        return generate_ics(shifts)
+    return generate_ics(schedule(result["schedule"]))
+
+
+class JobQueue:
+    """
+    In-process job queue. Dispatcher threads take jobs in order and run them on
+    a process pool of the same size, so at most `workers` schedules run at once
+    and at most `max_queued` wait.
+    """
+
+    def __init__(self, workers=None, max_queued=200):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_queued = max_queued
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        for i in range(self.workers):
+            threading.Thread(target=self._dispatch, name=f"job-dispatch-{i}", daemon=True).start()
+
+    def submit(self, payloads):
+        """Queues all payloads or none of them. Returns the job ids."""
+        jobs = [config_from_state(p) for p in payloads]
+        with self._lock:
+            if self._count("queued") + len(jobs) > self.max_queued:
+                raise QueueFullError()
+            job_ids = []
+            for args in jobs:
+                job_id = uuid.uuid4().hex
+                self._jobs[job_id] = {"id": job_id, "status": "queued", "submitted": time.time(), "args": args}
+                job_ids.append(job_id)
+            self._prune()
+        for job_id in job_ids:
+            self._queue.put(job_id)
+        return job_ids
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else {k: v for k, v in job.items() if k != "args"}
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return False
+            job["status"] = "cancelled"
+            job.pop("args", None)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "queued": self._count("queued"), "running": self._count("running")}
+
+    def _count(self, status):
+        return sum(1 for job in self._jobs.values() if job["status"] == status)
+
+    def _prune(self):
+        # Forget the oldest finished jobs
+        finished = [k for k, job in self._jobs.items() if job["status"] in ("done", "failed", "cancelled")]
+        for key in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[key]
+
+    def _dispatch(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue
+                job["status"] = "running"
+                job["started"] = time.time()
+                args = job.pop("args")
+            try:
+                result = self._pool.submit(run_job, *args).result()
+                update = {"status": "done", "result": result}
+            except Exception as e:
+                update = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+            with self._lock:
+                job.update(update, finished=time.time())
+
+
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})$")
+_ICS_PATH = re.compile(r"^/jobs/([0-9a-f]{32})/calendar\.ics$")
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    jobs = None
+    token = None
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_ics(self, job):
+        if job is None:
+            return self._send(404, {"error": "not found"})
+        if job["status"] != "done" or not job["result"]["success"]:
+            return self._send(409, {"error": "no schedule", "status": job["status"]})
+        data = result_ics(job["result"])
+        self.send_response(200)
+        self.send_header("Content-Type", "text/calendar; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        if self.token and self.headers.get("Authorization") != f"Bearer {self.token}":
+            self._send(401, {"error": "unauthorized"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/health":
+            return self._send(200, self.jobs.stats())
+        match = _ICS_PATH.match(self.path)
+        if match:
+            return self._send_ics(self.jobs.get(match.group(1)))
+        match = _JOB_PATH.match(self.path)
+        job = self.jobs.get(match.group(1)) if match else None
+        if job is None:
+            return self._send(404, {"error": "not found"})
+        self._send(200, job)
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != "/jobs":
+            return self._send(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._send(400, {"error": "invalid Content-Length"})
+        if length > MAX_BODY_BYTES:
+            return self._send(413, {"error": "payload too large"})
+        try:
+            payload = json.loads(self.rfile.read(length) or b"null")
+            job_ids = self.jobs.submit(payload if isinstance(payload, list) else [payload])
+            body = [{"id": job_id, "status": "queued"} for job_id in job_ids]
+            if not isinstance(payload, list):
+                body = body[0]
+        except QueueFullError:
+            return self._send(503, {"error": "queue full, retry later"})
+        except (ValueError, TypeError) as e:
+            # PayloadError, invalid JSON or a body that is not UTF-8
+            return self._send(400, {"error": str(e)})
+        self._send(202, body)
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        match = _JOB_PATH.match(self.path)
+        if match and self.jobs.cancel(match.group(1)):
+            return self._send(200, {"id": match.group(1), "status": "cancelled"})
+        self._send(409 if match and self.jobs.get(match.group(1)) else 404, {"error": "cannot cancel"})
+
+    def log_message(self, format, *args):
+        # Quiet by default; errors are returned to the client
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, workers=None, max_queued=200, token=None):
+    handler = type("Handler", (ServiceHandler,), {"jobs": JobQueue(workers, max_queued), "token": token})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Scheduling service on http://{host}:{server.server_port} ({handler.jobs.workers} workers)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP scheduling service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="parallel schedules (default: CPUs - 1)")
+    parser.add_argument("--queue", type=int, default=200, help="max queued jobs")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.queue, os.environ.get("NOBET_SERVICE_TOKEN"))
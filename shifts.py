@@ -0,0 +1,144 @@
+# Several shifts per date, defined as time intervals.
+#
+# A shift is a roster (see multi_roster.py) with a start and end time ("HH:MM";
+# an end at or before the start means the next morning) and optionally the rest
+# owed after it in hours ("rest_after", e.g. 16 after a night). Each shift has
+# its own team size and team rules:
+#
+#     shifts = [
+#         {'name': 'Day', 'start': '08:00', 'end': '20:00', 'people_per_day': 3, 'min_seniors': 1},
+#         {'name': 'Night', 'start': '20:00', 'end': '08:00', 'people_per_day': 2, 'rest_after': 16},
+#     ]
+#     result = ShiftScheduler(2026, 3, personnel, dict(config, shifts=shifts, min_rest_hours=11)).generate()
+#     result.rosters['Night']   # {date: [person dicts]}
+#
+# Rest is counted in hours instead of whole days: between two duties of a person
+# there must be at least max(min_rest_hours, rest_after of the earlier shift)
+# hours (rule "consecutive", so it can be made soft), and duties never overlap.
+# A person holds at most one shift per date, as on the rosters of multi_roster.py.
+# allow_consecutive and require_two_rest_days do not apply. Each person's duties
+# are kept as sorted intervals; a check looks only at the neighbours of the new
+# interval found by bisection, so it costs O(log n) per candidate.
+import bisect
+from datetime import date
+from multi_roster import MultiRosterScheduler
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_time(value):
+    """Minutes after midnight of "HH:MM" (ValueError when invalid)."""
+    hours, minutes = str(value).split(":")
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"invalid time: {value}")
+    return hours * 60 + minutes
+
+
+def shift_span(shift):
+    """(start, end) in minutes after midnight of the shift date; end may be on the next day."""
+    start, end = parse_time(shift['start']), parse_time(shift['end'])
+    return start, end if end > start else end + MINUTES_PER_DAY
+
+
+class IntervalIndex:
+    """Sorted duty intervals (minutes) of each person with the rest owed after each one."""
+
+    def __init__(self):
+        self.starts = {}
+        self.intervals = {}
+
+    def add(self, name, start, end, rest):
+        starts = self.starts.setdefault(name, [])
+        pos = bisect.bisect_left(starts, start)
+        starts.insert(pos, start)
+        self.intervals.setdefault(name, []).insert(pos, (start, end, rest))
+
+    def conflict(self, name, start, end, rest):
+        """None, "overlap" or "rest" for a new duty [start, end) owing `rest` minutes after it."""
+        starts = self.starts.get(name)
+        if not starts:
+            return None
+        pos = bisect.bisect_left(starts, start)
+        intervals = self.intervals[name]
+        if pos > 0:
+            prev_start, prev_end, prev_rest = intervals[pos - 1]
+            if prev_end > start:
+                return "overlap"
+            if prev_end + prev_rest > start:
+                return "rest"
+        if pos < len(starts):
+            next_start = starts[pos]
+            if end > next_start:
+                return "overlap"
+            if end + rest > next_start:
+                return "rest"
+        return None
+
+
+class ShiftScheduler(MultiRosterScheduler):
+    # duties_allowed() counts whole days, so the classes are not rebalanced afterwards
+    rebalance = False
+
+    def __init__(self, year, month, personnel_list, config):
+        """
+        config['shifts']: list of rosters with 'start', 'end' and optionally 'rest_after' (hours).
+        config['min_rest_hours']: rest between any two duties (default 0).
+        Previous-month history (prev_1, prev_2) counts as the latest-ending shift of those days.
+        """
+        shifts = config['shifts']
+        combined = dict(config, rosters=shifts, allow_consecutive=True, require_two_rest_days=False)
+        super().__init__(year, month, personnel_list, combined)
+        min_rest = float(config.get('min_rest_hours') or 0) * 60
+        for (_, rules, _), shift in zip(self.rosters, shifts):
+            rules['start'], rules['end'] = shift_span(shift)
+            rules['rest'] = max(min_rest, float(shift.get('rest_after') or 0) * 60)
+        self.month_start = date(year, month, 1)
+        self.index = IntervalIndex()
+        self.indexed = set()
+        self.shift = None
+
+    def interval(self, d, rules):
+        """(start, end, rest) of a shift on date d, in minutes from the start of the month."""
+        offset = (d - self.month_start).days * MINUTES_PER_DAY
+        return offset + rules['start'], offset + rules['end'], rules['rest']
+
+    def begin_attempt(self):
+        self.index = IntervalIndex()
+        self.indexed = set()
+        # Previous-month duties as the shift that ends last
+        history = self.config.get('history', {})
+        rules = max((rules for _, rules, _ in self.rosters), key=lambda r: r['end'])
+        for days_before, key in ((1, 'prev_1'), (2, 'prev_2')):
+            start, end, rest = self.interval(self.month_start, rules)
+            for name in history.get(key, []):
+                self.index.add(name, start - days_before * MINUTES_PER_DAY, end - days_before * MINUTES_PER_DAY, rest)
+
+    def index_teams(self, d, day_teams):
+        for i, team in enumerate(day_teams):
+            for p in team:
+                if (p['name'], d, i) not in self.indexed:
+                    self.indexed.add((p['name'], d, i))
+                    self.index.add(p['name'], *self.interval(d, self.rosters[i][1]))
+
+    def fill_roster(self, i, current_date, queue, day_teams, attempt_violations):
+        """Fills shift i for one date; people on another shift of the date are taken."""
+        # One shift per person and date: the day counts once against the limits.
+        # The index adds the rest around the shifts of the neighbouring dates.
+        self.index_teams(current_date, day_teams)
+        self.shift = self.rosters[i][1]
+        taken = [p for j, team in enumerate(day_teams) if j != i for p in team]
+        self.fill_team(current_date, queue, day_teams[i], self.shift, taken, attempt_violations=attempt_violations)
+        self.index_teams(current_date, day_teams)
+
+    def constraint_violations(self, person, current_date, current_team):
+        violations = super().constraint_violations(person, current_date, current_team)
+        if self.is_hard(violations):
+            return violations
+        conflict = self.index.conflict(person['name'], *self.interval(current_date, self.shift))
+        if conflict == "overlap":
+            # Double booking, never soft
+            violations.append('in_team')
+        elif conflict == "rest":
+            violations.append('consecutive')
+        return violations
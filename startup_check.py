@@ -0,0 +1,104 @@
+"""
+Cold start check for main.py.
+
+Imports main.py in fresh interpreters (as a new Streamlit server process would)
+and reports the import time, the slowest modules and whether any heavy library
+was loaded eagerly. Exits with status 1 on a regression, so it can run in CI:
+
+    python startup_check.py            # 5 runs, default budget
+    python startup_check.py --runs 10 --budget 1.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Must not be imported by `import main` (login page / cold start)
+DEFERRED_MODULES = [
+    "pandas", "numpy", "holidays", "reportlab", "xlsxwriter",
+    "google.cloud.firestore", "matplotlib",
+]
+
+# Total time budget for `import main`, in seconds
+DEFAULT_BUDGET = 1.0
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(m for m in {deferred!r} if m in sys.modules))
+"""
+
+
+def measure(imports, runs):
+    """Runs `imports` in `runs` fresh interpreters. Returns (median seconds, eagerly loaded deferred modules)."""
+    code = _PROBE.format(imports=imports, deferred=DEFERRED_MODULES)
+    times = []
+    loaded = set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True).stdout
+        elapsed, modules = out.split("\n")[:2]
+        times.append(float(elapsed))
+        loaded.update(m for m in modules.split(",") if m)
+    return statistics.median(times), sorted(loaded)
+
+
+def slowest_modules(imports, top=10):
+    """Cumulative import time per top-level module from `python -X importtime`."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", imports], cwd=HERE, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time: self | cumulative | name", nested imports are indented further
+        _, cumulative, name = line.split("|")
+        if name.startswith("    "):
+            continue
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="max seconds for `import main`")
+    args = parser.parse_args()
+
+    # 1. Cold import of the app module
+    main_time, eager = measure("import main", args.runs)
+    print(f"import main: {main_time * 1000:.0f} ms (median of {args.runs})")
+
+    # 2. What the deferred libraries would add if imported up front
+    available = []
+    for module in DEFERRED_MODULES:
+        if subprocess.run([sys.executable, "-c", f"import {module}"], cwd=HERE, capture_output=True).returncode == 0:
+            available.append(module)
+    if available:
+        eager_time, _ = measure("import main\n" + "\n".join(f"import {m}" for m in available), args.runs)
+        print(f"with deferred libraries: {eager_time * 1000:.0f} ms (saved {(eager_time - main_time) * 1000:.0f} ms)")
+
+    # 3. Where the remaining time goes
+    print("slowest modules (cumulative):")
+    for micros, name in slowest_modules("import main"):
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    # 4. Regression checks
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+        failed = True
+    if main_time > args.budget:
+        print(f"FAIL: import main took {main_time:.2f} s, budget is {args.budget:.2f} s")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,664 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import date
+
+import history
+
+# Normalized storage layout
+# -------------------------
+# State document (one per user):
+#   {"schema": 2,
+#    "personnel": {<id>: {...profile without runtime counters...}},
+#    "personnel_order": [<id>, ...],
+#    "conditional_rules": [...], "cfg_year": ..., "gen_year": ..., "gen_month": ...}
+#
+# Month document (one per user and generated month, key "YYYY-MM"):
+#   {"year": 2024, "month": 5,
+#    "schedule": {"2024-05-01": [<id>, <id>], ...},
+#    "names": {<id>: "Name"}}
+#
+# Saves compare against the snapshot of the last load/save and only write
+# what changed: single personnel records, single settings and the month that
+# was regenerated.
+
+SCHEMA_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+# Counters the scheduler writes into personnel dicts. They are derived from the
+# schedule, so they are not persisted.
+RUNTIME_FIELDS = ("duty_count", "weekend_duty_count", "saturday_duty_count", "sunday_duty_count")
+
+SETTING_KEYS = [
+    "conditional_rules", "forbidden_pairs", "holidays_multiselect",
+    "cfg_year", "cfg_month", "cfg_ppl", "cfg_gender", "cfg_consecutive",
+    "cfg_two_rest", "cfg_min_seniors", "cfg_max_weekly", "cfg_language", "cfg_use_history",
+    "cfg_candidates", "cfg_hardest_first", "cfg_w_total_std", "cfg_w_weekend_std", "cfg_w_weekday_std", "cfg_w_sat_sun_gap",
+    "cfg_w_co_occurrence_std",
+    "gen_year", "gen_month"
+]
+
+# Any other sidebar setting is stored as long as its key has this prefix
+SETTING_PREFIX = "cfg_"
+
+
+def is_setting(key):
+    return key in SETTING_KEYS or key.startswith(SETTING_PREFIX)
+
+
+# Sentinel for "remove this field" in a change set
+DELETE = object()
+
+
+def new_person_id():
+    return uuid.uuid4().hex[:12]
+
+
+def name_person_id(name):
+    """Stable id for a schedule member no longer on the list, so re-saving the month keeps it."""
+    return hashlib.sha1(str(name).encode("utf-8")).hexdigest()[:12]
+
+
+def ensure_ids(personnel):
+    """Give every person a unique id (in place). Rows added through the editor arrive without one."""
+    seen = set()
+    for p in personnel:
+        pid = p.get("id")
+        if not isinstance(pid, str) or not pid or pid in seen:
+            pid = new_person_id()
+            p["id"] = pid
+        seen.add(pid)
+    return personnel
+
+
+def month_key(year, month):
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+# --- Normalization ---
+
+def normalize_state(state_data):
+    """
+    Converts the in-app state (personnel list, settings, generated_schedule with
+    full person dicts) into the normalized state document and an optional month document.
+    """
+    personnel = ensure_ids(state_data.get("personnel", []))
+    records = {}
+    order = []
+    for p in personnel:
+        records[p["id"]] = {k: v for k, v in p.items() if k != "id" and k not in RUNTIME_FIELDS}
+        order.append(p["id"])
+
+    doc = {"schema": SCHEMA_VERSION, "personnel": records, "personnel_order": order}
+    for key, value in state_data.items():
+        if is_setting(key) and value is not None:
+            doc[key] = value
+
+    month_doc = None
+    schedule = state_data.get("generated_schedule")
+    if schedule and state_data.get("gen_year") and state_data.get("gen_month"):
+        name_to_id = {p.get("name"): p["id"] for p in personnel}
+        sched_ids = {}
+        names = {}
+        for d_str, team in schedule.items():
+            ids = []
+            for member in team:
+                pid = member.get("id") or name_to_id.get(member.get("name")) or name_person_id(member.get("name"))
+                ids.append(pid)
+                names[pid] = member.get("name")
+            sched_ids[d_str] = ids
+        month_doc = {
+            "year": state_data["gen_year"],
+            "month": state_data["gen_month"],
+            "schedule": sched_ids,
+            "names": names,
+            # Holidays used for this generation (weekend classification in history/stats)
+            "holidays": state_data.get("gen_holidays") or []
+        }
+        if state_data.get("gen_roster"):
+            # Everyone who could have been scheduled (months on the roster in the history)
+            id_to_name = {p["id"]: p.get("name") for p in personnel}
+            month_doc["roster"] = list(state_data["gen_roster"])
+            for pid in month_doc["roster"]:
+                names.setdefault(pid, id_to_name.get(pid))
+    return doc, month_doc
+
+
+def denormalize_state(doc, month_doc=None):
+    """Inverse of normalize_state. Returns the dict shape the app restores from."""
+    records = doc.get("personnel", {})
+    order = doc.get("personnel_order") or list(records.keys())
+    personnel = [dict(records[pid], id=pid) for pid in order if pid in records]
+
+    data = {k: v for k, v in doc.items() if is_setting(k)}
+    data["personnel"] = personnel
+
+    if month_doc:
+        # Runtime counters are not stored, rebuild them from the schedule
+        by_id = {p["id"]: p for p in personnel}
+        holidays = set(month_doc.get("holidays") or doc.get("holidays_multiselect", []))
+        for d_str, ids in month_doc.get("schedule", {}).items():
+            d = date.fromisoformat(d_str)
+            is_weekend = d.weekday() >= 5 or d.strftime("%d/%m/%Y") in holidays
+            for pid in ids:
+                p = by_id.get(pid)
+                if p is None:
+                    continue
+                p["duty_count"] = p.get("duty_count", 0) + 1
+                if is_weekend:
+                    p["weekend_duty_count"] = p.get("weekend_duty_count", 0) + 1
+                    if d.weekday() == 5:
+                        p["saturday_duty_count"] = p.get("saturday_duty_count", 0) + 1
+                    elif d.weekday() == 6:
+                        p["sunday_duty_count"] = p.get("sunday_duty_count", 0) + 1
+
+        names = month_doc.get("names", {})
+        sched = {}
+        for d_str, ids in month_doc.get("schedule", {}).items():
+            team = []
+            for pid in ids:
+                if pid in records:
+                    team.append(dict(records[pid], id=pid))
+                else:
+                    # Person was removed from the roster after this month was generated
+                    team.append({"id": pid, "name": names.get(pid, pid)})
+            sched[d_str] = team
+        data["generated_schedule"] = sched
+        data["gen_year"] = month_doc.get("year")
+        data["gen_month"] = month_doc.get("month")
+        data["gen_holidays"] = month_doc.get("holidays", [])
+        data["gen_roster"] = month_doc.get("roster", [])
+    return data
+
+
+def upgrade_legacy(data):
+    """Converts a schema-1 document (personnel list + embedded schedule) to the normalized pair."""
+    if isinstance(data, list):
+        data = {"personnel": data}
+    return normalize_state(data)
+
+
+# --- Change sets ---
+
+def diff_state(old, new):
+    """
+    Returns {field_path: value} for the fields of `new` that differ from `old`.
+    Personnel records are compared one by one ("personnel.<id>"); removed fields map to DELETE.
+    """
+    changes = {}
+    for key, value in new.items():
+        if key != "personnel" and old.get(key) != value:
+            changes[key] = value
+    for key in old:
+        if key != "personnel" and key not in new:
+            changes[key] = DELETE
+
+    old_p = old.get("personnel", {})
+    new_p = new.get("personnel", {})
+    for pid, rec in new_p.items():
+        if old_p.get(pid) != rec:
+            changes[f"personnel.{pid}"] = rec
+    for pid in old_p:
+        if pid not in new_p:
+            changes[f"personnel.{pid}"] = DELETE
+    return changes
+
+
+# --- Local SQLite store ---
+
+LOCAL_DB_FILE = "nobet_wizard.db"
+LEGACY_USER_DB_FILE = "users_db.json"
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS personnel (
+    username TEXT NOT NULL,
+    person_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (username, person_id)
+);
+CREATE TABLE IF NOT EXISTS configs (
+    username TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (username, key)
+);
+CREATE TABLE IF NOT EXISTS schedules (
+    username TEXT NOT NULL,
+    month TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (username, month)
+);
+CREATE TABLE IF NOT EXISTS fairness_history (
+    username TEXT NOT NULL,
+    person_id TEXT NOT NULL,
+    name TEXT,
+    months INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    weekend INTEGER NOT NULL DEFAULT 0,
+    saturday INTEGER NOT NULL DEFAULT 0,
+    sunday INTEGER NOT NULL DEFAULT 0,
+    wd0 INTEGER NOT NULL DEFAULT 0,
+    wd1 INTEGER NOT NULL DEFAULT 0,
+    wd2 INTEGER NOT NULL DEFAULT 0,
+    wd3 INTEGER NOT NULL DEFAULT 0,
+    wd4 INTEGER NOT NULL DEFAULT 0,
+    wd5 INTEGER NOT NULL DEFAULT 0,
+    wd6 INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, person_id)
+);
+CREATE INDEX IF NOT EXISTS idx_personnel_user_position ON personnel (username, position);
+CREATE INDEX IF NOT EXISTS idx_schedules_month ON schedules (month);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def get_local_db(path=None):
+    """Returns this thread's connection to the local store, creating the schema on first use."""
+    path = path or LOCAL_DB_FILE
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        # timeout doubles as busy timeout when another session holds the write lock
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with _init_lock:
+                if path not in _initialized:
+                    conn.executescript(_SCHEMA_SQL)
+                    _backfill_history(conn)
+                    # Legacy JSON files sit next to the database, wherever the process was started
+                    import_legacy_json(conn, os.path.dirname(os.path.abspath(path)))
+                    _initialized.add(path)
+        except Exception:
+            # Not cached, so the next call retries the initialization
+            conn.close()
+            raise
+        conns[path] = conn
+    return conn
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _read_json(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+
+def _backfill_history(conn):
+    """Builds the fairness history once from months saved before it existed."""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'history_built'").fetchone():
+        return
+    with conn:
+        conn.execute("DELETE FROM fairness_history")
+        rows = conn.execute("SELECT username, data FROM schedules").fetchall()
+        months = {}
+        for username, data in rows:
+            months.setdefault(username, []).append(json.loads(data))
+        conn.executemany(
+            f"INSERT INTO fairness_history (username, person_id, name, {', '.join(history.HISTORY_FIELDS)}) "
+            f"VALUES (?, ?, ?, {', '.join('?' for _ in history.HISTORY_FIELDS)})",
+            [(u, pid, e["name"], *[e[f] for f in history.HISTORY_FIELDS])
+             for u, docs in months.items() for pid, e in history.build_history(docs).items()]
+        )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('history_built', '1')")
+
+
+def import_legacy_json(conn, directory="."):
+    """
+    One-time import of the old JSON files (users_db.json, personnel_db_<user>.json,
+    schedule_db_<user>_<YYYY-MM>.json). The files are left in place.
+    """
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+        return
+
+    with conn:
+        users = _read_json(os.path.join(directory, LEGACY_USER_DB_FILE)) or {}
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)",
+            list(users.items())
+        )
+
+        for file_name in sorted(os.listdir(directory)):
+            if not (file_name.startswith("personnel_db_") and file_name.endswith(".json")):
+                continue
+            username = file_name[len("personnel_db_"):-len(".json")]
+            if not username:
+                continue
+            raw = _read_json(os.path.join(directory, file_name))
+            if not raw:
+                continue
+
+            if isinstance(raw, dict) and raw.get("schema") == SCHEMA_VERSION:
+                doc = raw
+                months = []
+                prefix = f"schedule_db_{username}_"
+                for month_file in os.listdir(directory):
+                    if month_file.startswith(prefix) and month_file.endswith(".json"):
+                        month_doc = _read_json(os.path.join(directory, month_file))
+                        if month_doc:
+                            months.append(month_doc)
+            else:
+                doc, month_doc = upgrade_legacy(raw)
+                months = [month_doc] if month_doc else []
+
+            _write_local_state(conn, username, None, doc)
+            for month_doc in months:
+                _write_local_month(conn, username, month_doc)
+
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_imported', '1')")
+
+
+def _load_local_state(conn, username):
+    rows = conn.execute(
+        "SELECT person_id, data FROM personnel WHERE username = ? ORDER BY position", (username,)
+    ).fetchall()
+    configs = conn.execute("SELECT key, value FROM configs WHERE username = ?", (username,)).fetchall()
+    if not rows and not configs:
+        return None
+
+    doc = {"schema": SCHEMA_VERSION, "personnel": {}, "personnel_order": []}
+    for pid, data in rows:
+        doc["personnel"][pid] = json.loads(data)
+        doc["personnel_order"].append(pid)
+    for key, value in configs:
+        doc[key] = json.loads(value)
+    return doc
+
+
+def _load_local_month(conn, username, key):
+    row = conn.execute(
+        "SELECT data FROM schedules WHERE username = ? AND month = ?", (username, key)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _write_local_state(conn, username, old_doc, doc):
+    """Writes the rows that differ between old_doc and doc. Caller provides the transaction."""
+    if old_doc is None:
+        # Unknown stored state: replace the user's rows entirely
+        conn.execute("DELETE FROM personnel WHERE username = ?", (username,))
+        conn.execute("DELETE FROM configs WHERE username = ?", (username,))
+        old_doc = {}
+
+    positions = {pid: i for i, pid in enumerate(doc.get("personnel_order", []))}
+    for path, value in diff_state(old_doc, doc).items():
+        if path.startswith("personnel."):
+            pid = path[len("personnel."):]
+            if value is DELETE:
+                conn.execute("DELETE FROM personnel WHERE username = ? AND person_id = ?", (username, pid))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO personnel (username, person_id, position, data) VALUES (?, ?, ?, ?)",
+                    (username, pid, positions.get(pid, len(positions)), _dumps(value))
+                )
+        elif path == "personnel_order":
+            conn.executemany(
+                "UPDATE personnel SET position = ? WHERE username = ? AND person_id = ?",
+                [(i, username, pid) for pid, i in positions.items()]
+            )
+        elif path == "schema":
+            continue
+        elif value is DELETE:
+            conn.execute("DELETE FROM configs WHERE username = ? AND key = ?", (username, path))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO configs (username, key, value) VALUES (?, ?, ?)",
+                (username, path, _dumps(value))
+            )
+
+
+def _write_local_month(conn, username, month_doc):
+    """
+    Stores a month and moves its contribution into the fairness history. Caller provides
+    the transaction, begun with BEGIN IMMEDIATE so the old month cannot change before the write.
+    """
+    key = month_key(month_doc["year"], month_doc["month"])
+    old_month = _load_local_month(conn, username, key)
+    conn.execute(
+        "INSERT OR REPLACE INTO schedules (username, month, data) VALUES (?, ?, ?)",
+        (username, key, _dumps(month_doc))
+    )
+
+    names = month_doc.get("names", {})
+    for pid, changes in history.contribution_delta(old_month, month_doc).items():
+        conn.execute(
+            "INSERT OR IGNORE INTO fairness_history (username, person_id) VALUES (?, ?)", (username, pid)
+        )
+        # Field names come from history.HISTORY_FIELDS, never from user input
+        assignments = ", ".join(f"{field} = {field} + ?" for field in changes)
+        conn.execute(
+            f"UPDATE fairness_history SET name = COALESCE(?, name), {assignments} WHERE username = ? AND person_id = ?",
+            (names.get(pid), *changes.values(), username, pid)
+        )
+
+
+def _load_local_months(conn, username, year=None):
+    if year is None:
+        rows = conn.execute(
+            "SELECT data FROM schedules WHERE username = ? ORDER BY month", (username,)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT data FROM schedules WHERE username = ? AND month BETWEEN ? AND ? ORDER BY month",
+            (username, month_key(year, 1), month_key(year, 12))
+        ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def get_user_hash(username):
+    row = get_local_db().execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+    return row[0] if row else None
+
+
+def create_user(username, password_hash):
+    """Registers a local user. Returns False if the username is taken."""
+    conn = get_local_db()
+    try:
+        with conn:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+# --- Backends ---
+
+def load_state(db, username):
+    """
+    Loads the user's state from Firestore (if `db` is given) or the local SQLite store.
+    Returns (data, snapshot); pass the snapshot back to save_state.
+    """
+    month_doc = None
+    if db:
+        user_ref = db.collection("personnel_data").document(username)
+        doc_snap = user_ref.get()
+        raw = doc_snap.to_dict() if doc_snap.exists else None
+        if raw and raw.get("schema") == SCHEMA_VERSION and raw.get("gen_year") and raw.get("gen_month"):
+            key = month_key(raw["gen_year"], raw["gen_month"])
+            month_snap = user_ref.collection("schedules").document(key).get()
+            month_doc = month_snap.to_dict() if month_snap.exists else None
+    else:
+        conn = get_local_db()
+        raw = _load_local_state(conn, username)
+        if raw and raw.get("gen_year") and raw.get("gen_month"):
+            month_doc = _load_local_month(conn, username, month_key(raw["gen_year"], raw["gen_month"]))
+
+    if not raw:
+        return {"personnel": []}, None
+
+    if not isinstance(raw, dict) or raw.get("schema") != SCHEMA_VERSION:
+        # Legacy document: the first save rewrites it in the new layout
+        doc, month_doc = upgrade_legacy(raw)
+        return denormalize_state(doc, month_doc), None
+
+    data = denormalize_state(raw, month_doc)
+    months = {month_key(month_doc["year"], month_doc["month"]): month_doc} if month_doc else {}
+    return data, copy.deepcopy({"state": raw, "months": months})
+
+
+def save_state(db, username, state_data, snapshot=None):
+    """
+    Persists `state_data`, writing only what changed since `snapshot`.
+    Returns the new snapshot.
+    """
+    doc, month_doc = normalize_state(state_data)
+    old_doc = snapshot["state"] if snapshot else None
+    months = dict(snapshot["months"]) if snapshot else {}
+
+    key = month_key(month_doc["year"], month_doc["month"]) if month_doc else None
+    month_changed = month_doc is not None and months.get(key) != month_doc
+
+    if db:
+        user_ref = db.collection("personnel_data").document(username)
+        if old_doc is None:
+            user_ref.set(doc)
+        else:
+            changes = diff_state(old_doc, doc)
+            if changes:
+                from google.cloud import firestore
+                user_ref.update({k: (firestore.DELETE_FIELD if v is DELETE else v) for k, v in changes.items()})
+        if month_changed:
+            # Before the month is written, so the rebuild sees the old version the delta replaces
+            _ensure_remote_history(db, username)
+            _write_remote_month(db, username, month_doc)
+    else:
+        conn = get_local_db()
+        with conn:
+            # Take the write lock before reading the old month: otherwise two sessions
+            # saving the same month could both apply its history delta
+            conn.execute("BEGIN IMMEDIATE")
+            _write_local_state(conn, username, old_doc, doc)
+            if month_changed:
+                _write_local_month(conn, username, month_doc)
+
+    if month_changed:
+        months[key] = month_doc
+        if not db:
+            _archive_month(username, month_doc, doc["personnel"])
+    # Deep copy so later in-place edits of session state still show up as changes
+    return copy.deepcopy({"state": doc, "months": months})
+
+
+def _archive_month(username, month_doc, personnel):
+    """Columnar copy of a saved month for cross-month analytics (local storage only, skipped without pyarrow)."""
+    import schedule_archive
+    try:
+        schedule_archive.write_month(username, month_doc, personnel)
+    except Exception:
+        # The month itself is already saved; a failed copy must not fail the save
+        logger.exception("could not archive %s/%s", username, month_key(month_doc["year"], month_doc["month"]))
+
+
+def load_months(db, username, year=None):
+    """Returns the user's stored month documents in calendar order, optionally for one year only."""
+    if db:
+        months_ref = db.collection("personnel_data").document(username).collection("schedules")
+        docs = [snap.to_dict() for snap in months_ref.stream()]
+        if year is not None:
+            docs = [d for d in docs if int(d.get("year", 0)) == int(year)]
+        return sorted(docs, key=lambda d: (int(d["year"]), int(d["month"])))
+    return _load_local_months(get_local_db(), username, year)
+
+
+def month_schedule(month_doc):
+    """Month document -> {date: [{"id", "name"}]} for display and exports."""
+    names = month_doc.get("names", {})
+    return {
+        date.fromisoformat(d_str): [{"id": pid, "name": names.get(pid, pid)} for pid in ids]
+        for d_str, ids in month_doc.get("schedule", {}).items()
+    }
+
+
+# Users whose Firestore history this process has seen built
+_remote_history_built = set()
+
+
+def _ensure_remote_history(db, username):
+    """
+    Builds the Firestore fairness history once from months saved before it existed,
+    like _backfill_history does for the local store. history/meta marks it as built.
+    """
+    if username in _remote_history_built:
+        return
+    from google.cloud import firestore
+    user_ref = db.collection("personnel_data").document(username)
+    meta_ref = user_ref.collection("history").document("meta")
+
+    @firestore.transactional
+    def build(transaction):
+        if meta_ref.get(transaction=transaction).exists:
+            return
+        months = [snap.to_dict() for snap in transaction.get(user_ref.collection("schedules"))]
+        transaction.set(user_ref.collection("history").document("counts"), history.build_history(months))
+        transaction.set(meta_ref, {"built": True})
+
+    build(db.transaction())
+    _remote_history_built.add(username)
+
+
+def _write_remote_month(db, username, month_doc):
+    """
+    Firestore counterpart of _write_local_month: reads the stored month, writes the new one
+    and moves its contribution into the history in one transaction, so two sessions saving
+    the same month cannot both apply a delta against the same old version.
+    """
+    from google.cloud import firestore
+    user_ref = db.collection("personnel_data").document(username)
+    month_ref = user_ref.collection("schedules").document(month_key(month_doc["year"], month_doc["month"]))
+    counts_ref = user_ref.collection("history").document("counts")
+    names = month_doc.get("names", {})
+
+    @firestore.transactional
+    def write(transaction):
+        old_snap = month_ref.get(transaction=transaction)
+        old_month = old_snap.to_dict() if old_snap.exists else None
+        transaction.set(month_ref, month_doc)
+        delta = history.contribution_delta(old_month, month_doc)
+        if delta:
+            transaction.set(counts_ref, {
+                pid: dict({f: firestore.Increment(v) for f, v in changes.items()}, name=names.get(pid))
+                for pid, changes in delta.items()
+            }, merge=True)
+
+    write(db.transaction())
+
+
+def load_history(db, username):
+    """Cumulative per-person counts: {person_id: {"name", "months", "total", ...}}."""
+    if db:
+        _ensure_remote_history(db, username)
+        snap = db.collection("personnel_data").document(username).collection("history").document("counts").get()
+        return (snap.to_dict() or {}) if snap.exists else {}
+    rows = get_local_db().execute(
+        f"SELECT person_id, name, {', '.join(history.HISTORY_FIELDS)} FROM fairness_history WHERE username = ?",
+        (username,)
+    ).fetchall()
+    return {
+        row[0]: dict(zip(["name"] + history.HISTORY_FIELDS, row[1:]))
+        for row in rows
+    }
@@ -0,0 +1,94 @@
+# Symmetry reduction for interchangeable personnel.
+#
+# People with the same profile (gender, role, limits, mixed-team preference,
+# past-month deficit) and no personal dates, busy days, pairs or previous-month
+# duties are interchangeable: swapping two of them throughout a schedule gives
+# another valid schedule. The scheduler therefore
+#   - breaks ties at random between classes instead of people, members of a
+#     class being tried in roster order among equals (see candidate_queue.py),
+#     so permutations inside a class are not explored;
+#   - skips candidates whose class-level schedule (which class fills which place
+#     on which date) was already found;
+#   - balances total and weekend duties between the members of each class at the
+#     end, moving single dates only where the person rules still hold.
+
+PROFILE_FIELDS = ["gender", "role", "fixed_duties_total", "max_duties", "fixed_duties_weekend", "max_weekends", "mixed_gender_allowed"]
+DATE_FIELDS = ["busy_days", "off_dates", "leave_dates", "fixed_dates"]
+
+
+def equivalence_classes(personnel, config):
+    """Classes (lists of names, roster order) of two or more interchangeable people."""
+    history = config.get('history', {})
+    bound = set(history.get('prev_1', [])) | set(history.get('prev_2', []))
+    for pair in config.get('forbidden_pairs', []):
+        bound.update((pair['p1'], pair['p2']))
+    deficits = config.get('history_deficits', {})
+
+    groups = {}
+    for p in personnel:
+        if p['name'] in bound or any(str(p.get(field) or "").strip() for field in DATE_FIELDS):
+            continue
+        deficit = deficits.get(p['name'], {})
+        key = tuple(p.get(field) for field in PROFILE_FIELDS) + (deficit.get('total', 0), deficit.get('weekend', 0))
+        groups.setdefault(key, []).append(p['name'])
+    return [names for names in groups.values() if len(names) > 1]
+
+
+def class_signature(schedule, class_of):
+    """Schedule with class members replaced by their class; equal for symmetric schedules."""
+    return tuple(
+        (d, tuple(sorted(("class", class_of[p['name']]) if p['name'] in class_of else ("name", p['name']) for p in team)))
+        for d, team in sorted(schedule.items())
+    )
+
+
+def balance_classes(schedule, classes, records, can_work, is_weekend, frozen=()):
+    """
+    Evens out total and then weekend duties inside each class by moving dates
+    from the most to the least loaded member (in place).
+    can_work(name, dates): whether a person may work exactly these dates.
+    frozen: dates that must not change (e.g. dates with recorded soft-rule breaks).
+    """
+    worked = {}
+    for d, team in schedule.items():
+        for p in team:
+            worked.setdefault(p['name'], set()).add(d)
+
+    def move(src, dst, give, take=None):
+        # src gives date `give` to dst (and takes `take` back from dst)
+        new_src = (worked[src] - {give}) | ({take} if take else set())
+        new_dst = (worked[dst] | {give}) - ({take} if take else set())
+        if not (can_work(src, new_src) and can_work(dst, new_dst)):
+            return False
+        for d, a, b in [(give, src, dst)] + ([(take, dst, src)] if take else []):
+            schedule[d] = [records[b] if p['name'] == a else p for p in schedule[d]]
+        worked[src], worked[dst] = new_src, new_dst
+        return True
+
+    for names in classes:
+        for name in names:
+            worked.setdefault(name, set())
+
+        # 1. Total duties
+        while True:
+            load = sorted(names, key=lambda n: len(worked[n]))
+            low, high = load[0], load[-1]
+            if len(worked[high]) - len(worked[low]) < 2:
+                break
+            if not any(move(high, low, d) for d in sorted(worked[high] - worked[low] - set(frozen))):
+                break
+
+        # 2. Weekend duties, exchanged for a weekday so totals stay even
+        def weekend_count(n):
+            return sum(1 for d in worked[n] if is_weekend(d))
+
+        while True:
+            load = sorted(names, key=weekend_count)
+            low, high = load[0], load[-1]
+            if weekend_count(high) - weekend_count(low) < 2:
+                break
+            gives = [d for d in sorted(worked[high] - worked[low] - set(frozen)) if is_weekend(d)]
+            takes = [d for d in sorted(worked[low] - worked[high] - set(frozen)) if not is_weekend(d)]
+            if not any(move(high, low, g, t) for g in gives for t in takes):
+                break
+    return schedule
@@ -0,0 +1,50 @@
+import time
+
+import infeasibility
+
+
+def roster(n, **fields):
+    return [
+        dict({'name': f'P{i}', 'gender': 'M' if i % 2 else 'F', 'role': 'Senior' if i % 5 == 0 else 'Junior',
+              'max_duties': 8, 'max_weekends': 3}, **fields)
+        for i in range(n)
+    ]
+
+
+def test_date_conflict_is_minimal():
+    people = roster(12)
+    for p in people:
+        if p['role'] == 'Senior':
+            p['leave_dates'] = '10/03/2026'
+    explanation = infeasibility.explain(2026, 3, people, {'people_per_day': 2, 'min_seniors': 1})
+    assert explanation.minimal
+    assert sorted(explanation.items) == sorted([('leave', 'P0', explanation.dates[0]), ('leave', 'P5', explanation.dates[0]),
+                                                ('leave', 'P10', explanation.dates[0]), ('min_seniors',)])
+    assert [d.day for d in explanation.dates] == [10]
+
+
+def test_feasible_month_has_no_explanation():
+    assert infeasibility.explain(2026, 3, roster(12), {'people_per_day': 2}) is None
+
+
+def test_large_roster_stays_within_budget():
+    # 200 people whose caps are far too low: the conflict involves nearly everyone
+    people = roster(200, max_duties=1, max_weekends=1)
+    config = {'people_per_day': 21, 'min_seniors': 1, 'gender_mode': 'Mixed',
+              'forbidden_pairs': [{'p1': 'P1', 'p2': 'P2'}]}
+    start = time.monotonic()
+    explanation = infeasibility.explain(2026, 3, people, config)
+    elapsed = time.monotonic() - start
+    assert explanation is not None and explanation.items
+    # Budget plus the initial checks and one oracle call in flight
+    assert elapsed < infeasibility.TIME_LIMIT + 1.5
+    # Whatever it returns is still a conflict
+    m = infeasibility._Month(2026, 3, people, config)
+    assert m.infeasible(explanation.items)
+
+
+def test_check_budget():
+    people = roster(60, max_duties=1, max_weekends=1)
+    explanation = infeasibility.explain(2026, 3, people, {'people_per_day': 6}, max_checks=5)
+    assert not explanation.minimal
+    assert infeasibility._Month(2026, 3, people, {'people_per_day': 6}).infeasible(explanation.items)
@@ -0,0 +1,31 @@
+import os
+import threading
+
+import pytest
+
+import schedule_archive
+
+pytest.importorskip("pyarrow")
+
+
+def test_concurrent_writes_of_one_month(tmp_path):
+    month_doc = {"year": 2026, "month": 3, "names": {"a1": "Ali", "b2": "Ayşe"},
+                 "schedule": {"2026-03-01": ["a1", "b2"], "2026-03-02": ["b2"]}, "holidays": []}
+    errors = []
+
+    def save():
+        try:
+            for _ in range(20):
+                schedule_archive.write_month("tester", month_doc, root=str(tmp_path))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not errors
+    path = schedule_archive.partition_path("tester", 2026, 3, str(tmp_path))
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+    assert schedule_archive.scan("tester", 2026, root=str(tmp_path)).num_rows == 3
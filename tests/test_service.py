@@ -0,0 +1,34 @@
+import pytest
+
+from service import MAX_CANDIDATES, PayloadError, config_from_state
+
+
+def payload(**extra):
+    state = {"year": 2026, "month": 3,
+             "personnel": [{"name": "Ali"}, {"name": "Ayşe"}, {"name": "Can"}]}
+    state.update(extra)
+    return state
+
+
+def test_candidate_count_is_clamped():
+    assert config_from_state(payload(cfg_candidates=10 ** 9))[3]['candidate_count'] == MAX_CANDIDATES
+    assert config_from_state(payload(cfg_candidates=-3))[3]['candidate_count'] == 1
+
+
+def test_forbidden_pairs_of_known_names():
+    pairs = [{"p1": "Ali", "p2": "Can"}]
+    assert config_from_state(payload(forbidden_pairs=pairs))[3]['forbidden_pairs'] == pairs
+
+
+@pytest.mark.parametrize("pairs", [
+    {"p1": "Ali", "p2": "Can"},
+    [["Ali", "Can"]],
+    [{"p1": "Ali"}],
+    [{"p1": "Ali", "p2": "Nobody"}],
+    [{"p1": "Ali", "p2": "Ali"}],
+])
+def test_invalid_forbidden_pairs_rejected(pairs):
+    with pytest.raises(PayloadError):
+        config_from_state(payload(forbidden_pairs=pairs))
+    with pytest.raises(PayloadError):
+        config_from_state(payload(rosters=[{"name": "ER", "forbidden_pairs": pairs}]))
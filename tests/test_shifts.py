@@ -0,0 +1,29 @@
+from shifts import ShiftScheduler
+
+
+def test_one_shift_per_person_and_date():
+    # Touching shifts and no rest: only the same-date rule keeps people apart
+    people = [{'name': f'P{i}', 'gender': 'M', 'role': 'Junior', 'max_duties': 31, 'max_weekends': 10} for i in range(4)]
+    shifts = [
+        {'name': 'Day', 'start': '08:00', 'end': '14:00', 'people_per_day': 1},
+        {'name': 'Evening', 'start': '14:00', 'end': '20:00', 'people_per_day': 1},
+    ]
+    config = {'people_per_day': 1, 'allow_consecutive': True, 'max_weekly_duties': 7, 'shifts': shifts,
+              'min_rest_hours': 0, 'seed': 1}
+    result = ShiftScheduler(2026, 3, people, config).generate()
+    assert result.success
+    for d, team in result.schedule.items():
+        names = [p['name'] for p in team]
+        assert len(names) == len(set(names)), (d, names)
+    # Duties count once per date, as the schedule lists them
+    assert sum(c['duty_count'] for c in result.counts.values()) == sum(len(t) for t in result.schedule.values())
+
+
+def test_too_few_people_for_two_shifts():
+    people = [{'name': 'A', 'gender': 'M', 'role': 'Junior', 'max_duties': 31, 'max_weekends': 10}]
+    shifts = [
+        {'name': 'Day', 'start': '08:00', 'end': '14:00', 'people_per_day': 1},
+        {'name': 'Evening', 'start': '14:00', 'end': '20:00', 'people_per_day': 1},
+    ]
+    config = {'people_per_day': 1, 'allow_consecutive': True, 'shifts': shifts, 'seed': 1}
+    assert not ShiftScheduler(2026, 3, people, config).generate().success
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+import storage
+
+
+def test_legacy_json_imported_from_database_directory(tmp_path, monkeypatch):
+    (tmp_path / storage.LEGACY_USER_DB_FILE).write_text(json.dumps({"ayse": "hash"}), encoding="utf-8")
+    # Started elsewhere: the files next to the database still count
+    monkeypatch.chdir(tmp_path.parent)
+    conn = storage.get_local_db(str(tmp_path / "store.db"))
+    assert conn.execute("SELECT password_hash FROM users WHERE username = 'ayse'").fetchone() == ("hash",)
+
+
+def test_failed_initialization_is_retried(tmp_path, monkeypatch):
+    path = str(tmp_path / "store.db")
+
+    def broken(conn, directory="."):
+        raise OSError("unreadable legacy file")
+
+    monkeypatch.setattr(storage, "import_legacy_json", broken)
+    with pytest.raises(OSError):
+        storage.get_local_db(path)
+    monkeypatch.undo()
+    conn = storage.get_local_db(path)
+    assert conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone()
+
+
+def test_removed_member_keeps_id_across_saves():
+    state = {"personnel": [{"id": "a1", "name": "Ali"}], "gen_year": 2026, "gen_month": 3,
+             "generated_schedule": {"2026-03-01": [{"name": "Ali"}, {"name": "Veli"}]}}
+    first = storage.normalize_state(state)[1]
+    second = storage.normalize_state(state)[1]
+    # An unchanged month stays unchanged, so it is not rewritten and its history delta is empty
+    assert first == second
+    assert first["schedule"]["2026-03-01"][0] == "a1"